@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'football_data.timing.ServerTimingMiddleware',  # first, so its total covers the other middleware
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -140,3 +141,111 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Football data app settings
+
+# Seconds the in-process league/season catalog (football_data/catalog.py) is kept before reloading
+FOOTBALL_CATALOG_TTL = int(os.environ.get('FOOTBALL_CATALOG_TTL', '600'))
+
+# Seconds the in-process team dimension index (football_data/teams.py) is kept before reloading
+TEAM_INDEX_TTL = int(os.environ.get('TEAM_INDEX_TTL', '600'))
+
+# football-data-api fixtures client (football_data/fixtures.py)
+FOOTBALL_DATA_API_URL = os.environ.get('FOOTBALL_DATA_API_URL', 'https://api.football-data-api.com/todays-matches')
+FOOTBALL_DATA_API_KEY = os.environ.get('FOOTBALL_DATA_API_KEY', '928d7e45d921850a05f77b1f6e3fb7b137bd6184c447a44c9d9f6f0cab380ff9')
+FIXTURES_MAX_WORKERS = int(os.environ.get('FIXTURES_MAX_WORKERS', '8'))  # concurrent requests per date range
+FIXTURES_TIMEOUT = float(os.environ.get('FIXTURES_TIMEOUT', '10'))  # seconds per request
+FIXTURES_RETRIES = int(os.environ.get('FIXTURES_RETRIES', '3'))
+FIXTURES_BACKOFF_FACTOR = float(os.environ.get('FIXTURES_BACKOFF_FACTOR', '0.5'))
+FIXTURES_ASYNC_MAX_CONNECTIONS = int(os.environ.get('FIXTURES_ASYNC_MAX_CONNECTIONS', '100'))  # upcoming_games_async, per event loop
+
+# Fixture responses are cached per date on disk so every process shares them.
+# Past dates are kept forever, today and future dates for FIXTURES_CACHE_TTL seconds.
+FIXTURES_CACHE_ALIAS = 'fixtures'
+FIXTURES_CACHE_TTL = int(os.environ.get('FIXTURES_CACHE_TTL', '900'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'fixtures': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('FIXTURES_CACHE_DIR', str(BASE_DIR / '.cache' / 'fixtures')),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,  # one entry per date, culling would drop past dates
+        },
+    },
+}
+
+# Correlation matrices (football_data/correlations.py)
+CORRELATIONS_CACHE_TTL = int(os.environ.get('CORRELATIONS_CACHE_TTL', '3600'))  # seconds
+CORRELATIONS_MAX_SEASONS = int(os.environ.get('CORRELATIONS_MAX_SEASONS', '100'))  # seasons pooled per request
+
+# Multi-season team trends: most seasons combined into one UNION ALL query
+TREND_MAX_SEASONS = int(os.environ.get('TREND_MAX_SEASONS', '10'))
+
+# Connection pool and prepared statements for the season table queries (football_data/db.py)
+FOOTBALL_DB_POOL = {
+    'ENABLED': os.environ.get('FOOTBALL_DB_POOL_ENABLED', '1') == '1',
+    'MIN_CONNECTIONS': int(os.environ.get('FOOTBALL_DB_POOL_MIN', '1')),
+    'MAX_CONNECTIONS': int(os.environ.get('FOOTBALL_DB_POOL_MAX', '10')),
+    'TIMEOUT': float(os.environ.get('FOOTBALL_DB_POOL_TIMEOUT', '10')),  # seconds to wait for a free connection
+    'MAX_PREPARED_PER_CONNECTION': 256,
+}
+
+# Local columnar snapshot of the season tables (football_data/snapshot.py, manage.py snapshot_seasons).
+# 'snapshot' serves the catalog and every snapshotted season from it; 'postgres' always queries the database.
+FOOTBALL_DATA_BACKEND = os.environ.get('FOOTBALL_DATA_BACKEND', 'postgres')
+FOOTBALL_SNAPSHOT_DIR = os.environ.get('FOOTBALL_SNAPSHOT_DIR', str(BASE_DIR / 'snapshot'))
+
+# Conditional GET for the season pages (football_data/versions.py)
+SEASON_VERSIONS_TTL = int(os.environ.get('SEASON_VERSIONS_TTL', '60'))  # seconds season data versions are kept in memory
+SEASON_HTTP_MAX_AGE = int(os.environ.get('SEASON_HTTP_MAX_AGE', '0'))  # Cache-Control max-age; 0 = always revalidate
+SEASON_ETAG_SALT = os.environ.get('SEASON_ETAG_SALT', '1')  # change on deploys that alter page or payload formats
+
+# CSV/NDJSON match exports (football_data/export.py)
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', '2000'))  # rows fetched per server-side cursor round trip
+EXPORT_MAX_SEASONS = int(os.environ.get('EXPORT_MAX_SEASONS', '50'))  # seasons per export request
+
+# KPI regressions (football_data/regression.py): per-season design matrices cached in the default cache
+REGRESSION_CACHE_TTL = int(os.environ.get('REGRESSION_CACHE_TTL', '3600'))
+REGRESSION_MAX_SEASONS = int(os.environ.get('REGRESSION_MAX_SEASONS', '100'))
+
+# Form tables and upcoming_games form averages: matches per team (last N game weeks)
+FORM_WINDOW = int(os.environ.get('FORM_WINDOW', '5'))
+
+# Match explorer: season tables read per query when filling a page (football_data/explorer.py)
+EXPLORER_SEASON_WINDOW = int(os.environ.get('EXPLORER_SEASON_WINDOW', '8'))
+EXPLORER_SEASONS_CACHE_TTL = int(os.environ.get('EXPLORER_SEASONS_CACHE_TTL', '300'))  # seconds a listing's season list is cached
+
+# Incremental match ingestion (football_data/ingest.py, manage.py ingest_matches)
+FOOTBALL_DATA_LEAGUE_MATCHES_URL = os.environ.get('FOOTBALL_DATA_LEAGUE_MATCHES_URL', 'https://api.football-data-api.com/league-matches')
+INGEST_MAX_WORKERS = int(os.environ.get('INGEST_MAX_WORKERS', '4'))  # seasons fetched from the API at the same time
+
+# upcoming_games: competitions looked up concurrently (one pooled DB connection each)
+UPCOMING_DB_MAX_WORKERS = int(os.environ.get('UPCOMING_DB_MAX_WORKERS', '4'))
+
+# format=columnar chart payloads (football_data/columnar.py): encoded and gzipped bodies cached per season ETag
+COLUMNAR_CACHE_TTL = int(os.environ.get('COLUMNAR_CACHE_TTL', '3600'))
+COLUMNAR_GZIP_MIN_BYTES = int(os.environ.get('COLUMNAR_GZIP_MIN_BYTES', '200'))
+
+# Per-request timings (football_data/timing.py): Server-Timing header and football_data.timing log lines
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', '1000'))  # slower requests are logged with their SQL
+SLOW_REQUEST_MAX_QUERIES = int(os.environ.get('SLOW_REQUEST_MAX_QUERIES', '50'))  # queries kept per request for that log
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # DEBUG also logs the view parameters and (truncated) JSON payloads
+        'football_data': {
+            'handlers': ['console'],
+            'level': os.environ.get('FOOTBALL_DATA_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -0,0 +1,209 @@
+"""
+Precomputed per-team, per-season aggregates for league_data_view.
+
+team_season_aggregates holds one row per (season_id, team_name, scope), where
+scope is 'all' for every game or the homeoraway value ('Homegame'/'Awaygame').
+Each row carries games played, total points and the sum and the rounded average
+of every KPI, so the league table becomes a primary-key lookup instead of a
+GROUP BY over the whole season table.
+
+league_gameweek_aggregates is the league-level rollup behind the league
+visualisation: one row per (season_id, game_week) with the sum and the number of
+non-NULL values of every KPI, so comparing any number of leagues reads a few
+dozen rows per league instead of scanning every season table.
+
+Every season table carries a statement trigger counting the writes to it in
+season_table_changes, so correcting rows in place is noticed as well as loading new
+game weeks. Each derived table has its own refresh hook: refresh_season() for the
+team aggregates, refresh_season_gameweeks() for the game-week rollup and
+teams.refresh_team_season() for the team dimension. season_refresh_state remembers,
+per season and derived table, the fingerprint (row count and write counter, see
+season_fingerprint) it was last built from, so each hook skips seasons that have
+not changed, and every fingerprint read is recorded as the season's data version
+(see versions.py). Run `python manage.py refresh_team_aggregates` after loading
+data. The league table is read back with db.fetch_team_aggregates(), the game-week
+rollup with db.fetch_leagues_gameweek_aggregates().
+"""
+from django.db import connection, transaction
+
+from . import versions
+from .kpis import KPI_COLUMNS, season_table_name
+
+
+AGGREGATES_TABLE = "team_season_aggregates"
+GAMEWEEK_TABLE = "league_gameweek_aggregates"
+STATE_TABLE = "season_refresh_state"
+CHANGES_TABLE = "season_table_changes"
+CHANGES_FUNCTION = "football_data_count_season_write"
+ALL_GAMES_SCOPE = "all"
+
+
+def ensure_tables(cursor):
+    kpi_columns_ddl = ", ".join(f"sum_{kpi} NUMERIC, avg_{kpi} NUMERIC" for kpi in KPI_COLUMNS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {AGGREGATES_TABLE} (
+            season_id INTEGER NOT NULL,
+            team_name TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            games_played BIGINT,
+            total_points NUMERIC,
+            {kpi_columns_ddl},
+            PRIMARY KEY (season_id, scope, team_name)
+        )
+    """)
+    # Seasons a team played in, for the match explorer
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {AGGREGATES_TABLE}_team_idx ON {AGGREGATES_TABLE} (team_name, scope)")
+    gameweek_columns_ddl = ", ".join(f"sum_{kpi} NUMERIC, count_{kpi} BIGINT" for kpi in KPI_COLUMNS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {GAMEWEEK_TABLE} (
+            season_id INTEGER NOT NULL,
+            game_week INTEGER,
+            {gameweek_columns_ddl}
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {GAMEWEEK_TABLE}_season_idx ON {GAMEWEEK_TABLE} (season_id, game_week)")
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            season_id INTEGER NOT NULL,
+            target TEXT NOT NULL,  -- the derived table
+            row_count BIGINT NOT NULL,
+            checksum BIGINT NOT NULL,  -- the write counter, see season_fingerprint()
+            refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (season_id, target)
+        )
+    """)
+
+
+def season_table_exists(cursor, table_name):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", [table_name])
+    return cursor.fetchone()[0]
+
+
+def ensure_change_tracking(cursor, season_id, table_name):
+    """
+    Installs the statement trigger that counts the INSERT, UPDATE, DELETE and TRUNCATE
+    statements run on a season table in season_table_changes, unless the table has it.
+    The counter row is updated in the writing transaction, so it moves exactly when
+    the season's rows do (concurrent writers to one season wait for each other).
+    """
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+            season_id INTEGER PRIMARY KEY,
+            changes BIGINT NOT NULL
+        )
+    """)
+    trigger = f"{table_name}_changes"
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = to_regclass(%s) AND tgname = %s)",
+        [table_name, trigger],
+    )
+    if cursor.fetchone()[0]:
+        return
+    cursor.execute(f"""
+        CREATE OR REPLACE FUNCTION {CHANGES_FUNCTION}() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO {CHANGES_TABLE} (season_id, changes) VALUES (TG_ARGV[0]::integer, 1)
+            ON CONFLICT (season_id) DO UPDATE SET changes = {CHANGES_TABLE}.changes + 1;
+            RETURN NULL;
+        END
+        $$
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER {trigger}
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table_name}
+        FOR EACH STATEMENT EXECUTE FUNCTION {CHANGES_FUNCTION}('{int(season_id)}')
+    """)
+
+
+def season_fingerprint(cursor, season_id):
+    """
+    Returns (row_count, checksum) of a season table, where checksum is the number of
+    statements that wrote to it since its change trigger was installed (which the first
+    fingerprint of a table does, see ensure_change_tracking). New game weeks and rows
+    corrected in place both move it. The row count is an index-only scan and the counter
+    a primary-key lookup, so checking every season is cheap.
+    """
+    table_name = season_table_name(season_id)
+    ensure_change_tracking(cursor, season_id, table_name)
+    cursor.execute(f"""
+        SELECT (SELECT COUNT(*) FROM {table_name}),
+               COALESCE((SELECT changes FROM {CHANGES_TABLE} WHERE season_id = %s), 0)
+    """, [season_id])
+    return tuple(cursor.fetchone())
+
+
+def refresh_derived(season_id, target, rebuild, force=False):
+    """
+    Runs rebuild(cursor, season_id, table_name) in a transaction if the season's fingerprint
+    changed since target (the derived table) was last built, or always with force=True
+    (which also moves the season's data version).
+    Returns 'refreshed', 'unchanged' or 'missing' (no match_data table for the season).
+    """
+    table_name = season_table_name(season_id)
+    with transaction.atomic(), connection.cursor() as cursor:
+        ensure_tables(cursor)
+        if not season_table_exists(cursor, table_name):
+            return 'missing'
+
+        row_count, checksum = season_fingerprint(cursor, season_id)
+        versions.store_season_version(cursor, season_id, row_count, checksum, changed=force)
+        if not force:
+            cursor.execute(
+                f"SELECT row_count, checksum FROM {STATE_TABLE} WHERE season_id = %s AND target = %s",
+                [season_id, target],
+            )
+            state = cursor.fetchone()
+            if state is not None and tuple(state) == (row_count, checksum):
+                return 'unchanged'
+
+        rebuild(cursor, season_id, table_name)
+        cursor.execute(f"""
+            INSERT INTO {STATE_TABLE} (season_id, target, row_count, checksum, refreshed_at)
+            VALUES (%s, %s, %s, %s, now())
+            ON CONFLICT (season_id, target) DO UPDATE
+            SET row_count = EXCLUDED.row_count, checksum = EXCLUDED.checksum, refreshed_at = EXCLUDED.refreshed_at
+        """, [season_id, target, row_count, checksum])
+    return 'refreshed'
+
+
+def _rebuild_team_aggregates(cursor, season_id, table_name):
+    kpi_select = ",\n".join(
+        f"SUM({kpi}), ROUND(CAST(AVG({kpi}) AS NUMERIC), 2)" for kpi in KPI_COLUMNS
+    )
+    kpi_targets = ", ".join(f"sum_{kpi}, avg_{kpi}" for kpi in KPI_COLUMNS)
+    cursor.execute(f"DELETE FROM {AGGREGATES_TABLE} WHERE season_id = %s", [season_id])
+    # One pass over the season table builds the overall and the home/away rows
+    cursor.execute(f"""
+        INSERT INTO {AGGREGATES_TABLE} (season_id, team_name, scope, games_played, total_points, {kpi_targets})
+        SELECT
+            %s,
+            team_name,
+            CASE WHEN GROUPING(homeoraway) = 1 THEN %s ELSE homeoraway END,
+            count(points),
+            SUM(points),
+            {kpi_select}
+        FROM {table_name}
+        GROUP BY GROUPING SETS ((team_name), (team_name, homeoraway))
+        HAVING GROUPING(homeoraway) = 1 OR homeoraway IS NOT NULL
+    """, [season_id, ALL_GAMES_SCOPE])
+
+
+def _rebuild_gameweeks(cursor, season_id, table_name):
+    cursor.execute(f"DELETE FROM {GAMEWEEK_TABLE} WHERE season_id = %s", [season_id])
+    gameweek_targets = ", ".join(f"sum_{kpi}, count_{kpi}" for kpi in KPI_COLUMNS)
+    cursor.execute(f"""
+        INSERT INTO {GAMEWEEK_TABLE} (season_id, game_week, {gameweek_targets})
+        SELECT %s, game_week, {", ".join(f"SUM({kpi}), COUNT({kpi})" for kpi in KPI_COLUMNS)}
+        FROM {table_name}
+        GROUP BY game_week
+    """, [season_id])
+
+
+def refresh_season(season_id, force=False):
+    """Rebuilds the team_season_aggregates rows of one season if it changed (see refresh_derived)."""
+    return refresh_derived(season_id, AGGREGATES_TABLE, _rebuild_team_aggregates, force)
+
+
+def refresh_season_gameweeks(season_id, force=False):
+    """Rebuilds the league_gameweek_aggregates rows of one season if it changed (see refresh_derived)."""
+    return refresh_derived(season_id, GAMEWEEK_TABLE, _rebuild_gameweeks, force)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class FootballDataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'football_data'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from .timing import install_query_timer
+
+        # Count and time the queries of every request, on every thread's connection
+        connection_created.connect(install_query_timer, dispatch_uid='football_data.timing')
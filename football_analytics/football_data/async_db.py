@@ -0,0 +1,166 @@
+"""
+Async data access for the async views.
+
+The helpers mirror their namesakes in db.py (same validation, same SQL, same
+snapshot short-cut) but run on psycopg 3 AsyncConnections, so a view can await
+several queries concurrently and the event loop keeps serving other requests
+while they run. Statements are prepared on first use (prepare=True) and kept per
+connection, up to FOOTBALL_DB_POOL['MAX_PREPARED_PER_CONNECTION'].
+
+Connections are bound to the event loop that opened them, so there is one pool
+per loop, capped at FOOTBALL_DB_POOL['MAX_CONNECTIONS']. When psycopg 3 is not
+installed, pooling is off or the database is not PostgreSQL, the sync helpers
+run in worker threads instead (sync_to_async), which keeps the concurrency but
+not the savings on threads.
+"""
+import asyncio
+import importlib.util
+import logging
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+
+from . import db, snapshot, timing
+
+
+logger = logging.getLogger(__name__)
+
+
+def async_driver_available():
+    return importlib.util.find_spec('psycopg') is not None
+
+
+def async_enabled():
+    """True when the async helpers run on psycopg 3 rather than on the sync helpers in threads."""
+    return db.pooling_enabled() and async_driver_available()
+
+
+class AsyncConnectionPool:
+    """
+    Minimal pool of psycopg 3 AsyncConnections for one event loop. Connections are
+    opened on demand up to max_size; checkouts beyond that wait up to timeout.
+    """
+
+    def __init__(self, max_size, timeout, max_prepared, **connect_kwargs):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_prepared = max_prepared
+        self.connect_kwargs = {key: value for key, value in connect_kwargs.items() if value is not None}
+        self._slots = asyncio.Semaphore(max_size)
+        self._idle = []
+
+    @asynccontextmanager
+    async def connection(self):
+        import psycopg
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise db.PoolTimeout(f"No database connection free after {self.timeout}s ({self.max_size} in use)")
+        conn = None
+        broken = False
+        try:
+            conn = self._idle.pop() if self._idle else await self._connect()
+            yield conn
+        except (psycopg.OperationalError, psycopg.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if conn is not None:
+                if broken or conn.closed:
+                    await conn.close()
+                else:
+                    self._idle.append(conn)
+            self._slots.release()
+
+    async def _connect(self):
+        import psycopg
+
+        conn = await psycopg.AsyncConnection.connect(autocommit=True, **self.connect_kwargs)
+        conn.prepared_max = self.max_prepared
+        return conn
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
+
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def get_async_pool():
+    """Returns the pool of the running event loop, created on first use from DATABASES['default']."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        options = db.pool_settings()
+        pool = _pools[loop] = AsyncConnectionPool(
+            options['MAX_CONNECTIONS'],
+            options['TIMEOUT'],
+            options['MAX_PREPARED_PER_CONNECTION'],
+            **db.connect_kwargs(),
+        )
+    return pool
+
+
+async def fetchall(sql, params=None):
+    """Runs sql as a prepared statement on a pooled async connection and returns every row."""
+    async with get_async_pool().connection() as conn:
+        async with conn.cursor() as cursor:
+            started = time.perf_counter()
+            try:
+                await cursor.execute(sql, params, prepare=True)
+                return await cursor.fetchall()
+            finally:
+                timing.record_query(sql, (time.perf_counter() - started) * 1000)
+
+
+def _in_thread(func):
+    """func on a worker thread, closing the thread's Django connection afterwards (see fixture_stats)."""
+
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            db.close_thread_connection()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def fetch_leagues_gameweek_aggregates(season_ids, kpi, aggregation_type='averages'):
+    """Async db.fetch_leagues_gameweek_aggregates."""
+    if not async_enabled():
+        return await _in_thread(db.fetch_leagues_gameweek_aggregates)(season_ids, kpi, aggregation_type)
+    kpi, results, queried = db.split_gameweek_seasons(season_ids, kpi, aggregation_type)
+    if queried:
+        try:
+            rows = await fetchall(db.gameweek_rollup_query(kpi, aggregation_type), [list(queried)])
+            results.update(db.group_rollup_rows(queried, rows))
+        except Exception as e:
+            logger.warning("Game-week aggregates not available: %s", e)
+        live = [season_id for season_id in queried if season_id not in results]
+        if live:
+            rows = await fetchall(db.leagues_gameweek_query([db.season_table(s) for s in live], kpi, aggregation_type))
+            results.update(db.group_union_rows(live, rows))
+    return {season_id: results[season_id] for season_id in season_ids if results.get(season_id)}
+
+
+async def fetch_league_gameweek_aggregates(season_id, kpi, aggregation_type='averages'):
+    """Async db.fetch_league_gameweek_aggregates."""
+    return (await fetch_leagues_gameweek_aggregates([season_id], kpi, aggregation_type)).get(season_id, [])
+
+
+async def fetch_competition_team_stats(competition_id, team_ids, window=None):
+    """Async db.fetch_competition_team_stats."""
+    if not async_enabled():
+        return await _in_thread(db.fetch_competition_team_stats)(competition_id, team_ids, window)
+    table_name = db.season_table(competition_id)
+    window = db.form_window(window)
+    season_snapshot = snapshot.snapshot_season(competition_id)
+    if season_snapshot is not None:
+        return season_snapshot.competition_team_stats(team_ids, window)
+    rows = await fetchall(db.competition_team_stats_query(table_name), [window, list(team_ids)])
+    return {row[0]: row[1:] for row in rows}
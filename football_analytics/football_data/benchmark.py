@@ -0,0 +1,357 @@
+"""
+Synthetic data and timed scenarios for benchmarking the views.
+
+generate_dataset() adds a synthetic catalog (leagues "Benchmark League N") and one
+match_data_{season_id}_final table per league and season to the configured
+database, PostgreSQL or SQLite. Every season is a double round robin between
+`teams` teams, cut at `game_weeks` game weeks, with per-team strengths driving
+Poisson goals, shots, corners and cards, so the KPI distributions look like real
+leagues. Rows go through ingest.match_rows(), i.e. the same layout as ingested
+seasons; on PostgreSQL the tables get their indexes and their aggregates.
+drop_dataset() removes it all again.
+
+run_scenario() requests one view through Django's test client (URL routing,
+middleware and templates included) and reports latency percentiles, the number of
+queries per request (Django connections in every thread plus the db.py pool) and
+the peak Python memory of one traced request. `python manage.py benchmark_views`
+runs every scenario, with upcoming_games against a local stub of the fixtures API.
+"""
+import contextlib
+import io
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from . import aggregates, catalog, db, fixtures, indexes, ingest, teams
+from .kpis import season_table_name
+from .stubs import FixturesStubServer
+
+
+FIRST_SEASON_ID = 900001
+LEAGUE_PREFIX = "Benchmark League"
+TEAM_ID_STRIDE = 1000  # team ids of league i are i * TEAM_ID_STRIDE + 1, ...
+PERCENTILES = (50, 90, 95, 99)
+
+# Per-team, per-match means of the generated statistics (the home side gets HOME_ADVANTAGE more)
+MEANS = {
+    'goals': 1.35,
+    'corners': 5.0,
+    'shots': 12.0,
+    'fouls': 11.0,
+    'offsides': 2.0,
+    'yellow_cards': 1.8,
+    'red_cards': 0.08,
+}
+SHOTS_ON_TARGET_RATE = 0.35
+HOME_ADVANTAGE = 1.1
+
+
+def season_year(index, last_year=2024):
+    """Season year of the index-th newest synthetic season, in the catalog format ('20232024')."""
+    start = last_year - 1 - index
+    return f"{start}{start + 1}"
+
+
+def season_label(year):
+    """'20232024' -> '2023/2024', the season format of the match rows."""
+    return f"{year[:4]}/{year[4:]}"
+
+
+def dataset_layout(leagues, seasons, first_season_id=FIRST_SEASON_ID):
+    """[(league name, season year, season_id)] of a synthetic dataset, newest season of each league first."""
+    return [
+        (f"{LEAGUE_PREFIX} {league + 1}", season_year(season), first_season_id + league * seasons + season)
+        for league in range(leagues)
+        for season in range(seasons)
+    ]
+
+
+def round_robin(teams):
+    """Double round robin: a list of game weeks, each a list of (home, away) team positions."""
+    positions = list(range(teams + teams % 2))  # a bye for an odd number of teams
+    half = len(positions) // 2
+    weeks = []
+    for week in range(len(positions) - 1):
+        pairs = []
+        for i in range(half):
+            home, away = positions[i], positions[-1 - i]
+            if (week + i) % 2:
+                home, away = away, home
+            if home < teams and away < teams:
+                pairs.append((home, away))
+        weeks.append(pairs)
+        positions = [positions[0], positions[-1]] + positions[1:-1]
+    return weeks + [[(away, home) for home, away in pairs] for pairs in weeks]
+
+
+def season_matches(league_index, season, teams, game_weeks, rng):
+    """The finished matches of one synthetic season, as league-matches API objects."""
+    strengths = rng.lognormal(0.0, 0.25, size=teams)
+    team_ids = [league_index * TEAM_ID_STRIDE + team + 1 for team in range(teams)]
+    names = [f"Bench {league_index + 1}-{team + 1:02d}" for team in range(teams)]
+    matches = []
+    for week, pairs in enumerate(round_robin(teams)[:game_weeks], start=1):
+        for home, away in pairs:
+            ratio = strengths[home] / strengths[away]
+            match = {
+                'status': ingest.COMPLETE_STATUS,
+                'season': season,
+                'game_week': week,
+                'home_name': names[home],
+                'away_name': names[away],
+                'homeID': team_ids[home],
+                'awayID': team_ids[away],
+                'stadium_name': f"{names[home]} Stadium",
+            }
+            home_factor = HOME_ADVANTAGE * np.sqrt(ratio)
+            away_factor = 1 / np.sqrt(ratio)
+            for kpi, mean in MEANS.items():
+                home_field, away_field = ingest.KPI_FIELDS[kpi]
+                # Fouls and cards don't depend on strength
+                scaled = kpi not in ('fouls', 'yellow_cards', 'red_cards')
+                match[home_field] = int(rng.poisson(mean * (home_factor if scaled else 1)))
+                match[away_field] = int(rng.poisson(mean * (away_factor if scaled else 1)))
+            for side in range(2):
+                shots = match[ingest.KPI_FIELDS['shots'][side]]
+                on_target = int(rng.binomial(shots, SHOTS_ON_TARGET_RATE))
+                match[ingest.KPI_FIELDS['shotsontarget'][side]] = on_target
+                match[ingest.KPI_FIELDS['shotsofftarget'][side]] = shots - on_target
+            home_possession = int(np.clip(rng.normal(50 + 10 * np.log(ratio), 6), 25, 75))
+            match['team_a_possession'], match['team_b_possession'] = home_possession, 100 - home_possession
+            matches.append(match)
+    return matches, dict(zip(team_ids, names))
+
+
+def _ensure_catalog_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS "possible_leagues_and_seasons_NEW" (
+            name TEXT, season_year TEXT, season_id INTEGER, data_available TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS possible_leagues_and_seasons (
+            season_id INTEGER, name TEXT, season_year TEXT
+        )
+    ''')
+
+
+def generate_dataset(leagues=5, seasons=2, teams=20, game_weeks=38, seed=0, first_season_id=FIRST_SEASON_ID):
+    """
+    Creates (or replaces) the synthetic catalog entries and season tables.
+    Returns {'seasons': [(league, season year, season_id)], 'teams': {season_id: {teamid: name}}, 'rows': n}.
+    """
+    drop_dataset(leagues, seasons, first_season_id)
+    rng = np.random.default_rng(seed)
+    layout = dataset_layout(leagues, seasons, first_season_id)
+    teams_by_season = {}
+    total_rows = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        _ensure_catalog_tables(cursor)
+        cursor.executemany(
+            'INSERT INTO "possible_leagues_and_seasons_NEW" (name, season_year, season_id, data_available)'
+            ' VALUES (%s, %s, %s, %s)',
+            [(name, year, season_id, 'yes') for name, year, season_id in layout],
+        )
+        cursor.executemany(
+            'INSERT INTO possible_leagues_and_seasons (season_id, name, season_year) VALUES (%s, %s, %s)',
+            [(season_id, name, year) for name, year, season_id in layout],
+        )
+        for position, (name, year, season_id) in enumerate(layout):
+            matches, team_names = season_matches(position // seasons, season_label(year), teams, game_weeks, rng)
+            rows = [row for match in matches for row in ingest.match_rows(match)]
+            table_name = season_table_name(season_id)
+            ingest.create_season_table(cursor, table_name)
+            ingest.copy_rows(cursor, table_name, rows)
+            if connection.vendor == 'postgresql':
+                indexes.create_season_indexes(cursor, table_name, concurrently=False)
+            teams_by_season[season_id] = team_names
+            total_rows += len(rows)
+    catalog.invalidate_catalog()
+    if connection.vendor == 'postgresql':
+        # Team aggregates, game-week rollup, team dimension and data versions (they need PostgreSQL)
+        for _, _, season_id in layout:
+            aggregates.refresh_season(season_id, force=True)
+            aggregates.refresh_season_gameweeks(season_id, force=True)
+            teams.refresh_team_season(season_id, force=True)
+    return {'seasons': layout, 'teams': teams_by_season, 'rows': total_rows}
+
+
+def drop_dataset(leagues=5, seasons=2, first_season_id=FIRST_SEASON_ID):
+    """Drops the season tables and catalog rows of a synthetic dataset; the catalog tables themselves stay."""
+    season_ids = [season_id for _, _, season_id in dataset_layout(leagues, seasons, first_season_id)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        _ensure_catalog_tables(cursor)
+        for season_id in season_ids:
+            cursor.execute(f"DROP TABLE IF EXISTS {season_table_name(season_id)}")
+        placeholders = ', '.join(['%s'] * len(season_ids))
+        cursor.execute(f'DELETE FROM "possible_leagues_and_seasons_NEW" WHERE season_id IN ({placeholders})', season_ids)
+        cursor.execute(f'DELETE FROM possible_leagues_and_seasons WHERE season_id IN ({placeholders})', season_ids)
+    catalog.invalidate_catalog()
+
+
+# --- Measuring ---
+
+def _pooled_queries():
+    stats = db.pool_stats()
+    return stats.get('prepared_hits', 0) + stats.get('prepared_statements', 0)
+
+
+class QueryCounter:
+    """
+    Counts the queries run while active: on Django connections of every thread (through an
+    execute wrapper added to each connection as it is opened) and on the db.py pool.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._wrapped = []
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def _attach(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+            self._wrapped.append(connection)
+
+    def __enter__(self):
+        connection_created.connect(self._attach)
+        for wrapper in connections.all(initialized_only=True):
+            self._attach(connection=wrapper)
+        self._pool_start = _pooled_queries()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.count += _pooled_queries() - self._pool_start
+        connection_created.disconnect(self._attach)
+        for wrapper in self._wrapped:
+            if self in wrapper.execute_wrappers:
+                wrapper.execute_wrappers.remove(self)
+
+
+def _request(client, method, path, data):
+    # The views print progress; keep it out of the benchmark report
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = getattr(client, method)(path, data)
+    if response.status_code != 200:
+        raise RuntimeError(f"{method.upper()} {path} returned {response.status_code}")
+    if getattr(response, 'streaming', False):
+        b''.join(response.streaming_content)
+    return response
+
+
+def run_scenario(name, method, path, data=None, requests=20, warmup=2):
+    """
+    Times `requests` requests of one view after `warmup` untimed ones.
+    Returns a JSON-ready dict of latency percentiles (ms), queries per request and peak memory (KiB).
+    """
+    client = Client()
+    data = data or {}
+    for _ in range(warmup):
+        _request(client, method, path, data)
+
+    latencies = []
+    with QueryCounter() as counter:
+        for _ in range(requests):
+            started = time.perf_counter()
+            _request(client, method, path, data)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    # One more request under tracemalloc, which would distort the timings above
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    _request(client, method, path, data)
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    if not tracing:
+        tracemalloc.stop()
+
+    latencies = np.array(latencies)
+    result = {
+        'name': name,
+        'method': method.upper(),
+        'path': path,
+        'params': data,
+        'requests': requests,
+        'mean_ms': round(float(latencies.mean()), 3),
+        'min_ms': round(float(latencies.min()), 3),
+        'max_ms': round(float(latencies.max()), 3),
+        'queries_per_request': round(counter.count / requests, 2),
+        'peak_memory_kib': round(peak / 1024, 1),
+    }
+    for percentile, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        result[f"p{percentile}_ms"] = round(float(value), 3)
+    return result
+
+
+# --- Scenarios ---
+
+SCENARIOS = ('league_data', 'visualisation_data', 'league_visualisation_data', 'match_details', 'upcoming_games')
+SCENARIO_KPI = 'corners_for'
+UPCOMING_START = date(2024, 9, 1)
+
+
+def current_competition_teams(dataset):
+    """{season_id: team ids} of the newest season of every synthetic league, the competitions of upcoming fixtures."""
+    newest = {}
+    for league, _, season_id in dataset['seasons']:
+        newest.setdefault(league, season_id)
+    return {season_id: list(dataset['teams'][season_id]) for season_id in newest.values()}
+
+
+def scenario_requests(dataset, days=7):
+    """{scenario: (method, path, data)} for the first league's newest season of a synthetic dataset."""
+    league, year, season_id = dataset['seasons'][0]
+    team = next(iter(dataset['teams'][season_id].values()))
+    season = {'league': league, 'season': year}
+    end = UPCOMING_START + timedelta(days=days - 1)
+    return {
+        'league_data': ('get', reverse('football_data'), season),
+        'visualisation_data': ('get', reverse('visualisation_data'), {**season, 'kpi': SCENARIO_KPI, 'team': team}),
+        'league_visualisation_data': (
+            'get', reverse('league_visualisation_data'), {**season, 'kpi': SCENARIO_KPI, 'compare_all': '1'},
+        ),
+        'match_details': ('get', reverse('match_details', args=[team, league, year]), {}),
+        'upcoming_games': (
+            'post', reverse('upcoming_games'),
+            {'startdate': UPCOMING_START.isoformat(), 'enddate': end.isoformat()},
+        ),
+    }
+
+
+def run_benchmark(dataset, scenarios=SCENARIOS, requests=20, warmup=2, days=7, latency=0.0, games_per_day=10):
+    """
+    Runs the scenarios against a synthetic dataset, upcoming_games against a fixtures stub
+    with `latency` seconds per request. Returns the list of run_scenario() results.
+    """
+    planned = scenario_requests(dataset, days)
+    stub = FixturesStubServer(
+        latency=latency, games_per_day=games_per_day, teams_by_competition=current_competition_teams(dataset),
+    )
+    results = []
+    with stub, override_settings(
+        ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ['testserver'],
+        FOOTBALL_DATA_API_URL=stub.url,
+        FIXTURES_CACHE_ALIAS=None,  # every request goes to the stub
+    ):
+        fixtures.reset_fixtures_client()
+        try:
+            for name in scenarios:
+                method, path, data = planned[name]
+                results.append(run_scenario(name, method, path, data, requests, warmup))
+        finally:
+            fixtures.reset_fixtures_client()
+    return results
@@ -0,0 +1,181 @@
+"""
+In-process cache of the league/season catalog.
+
+Both `possible_leagues_and_seasons_NEW` and `possible_leagues_and_seasons` are
+small and change only when new seasons are loaded, so they are read once into
+an indexed LeagueCatalog and shared by every view until the TTL runs out or
+invalidate_catalog() is called.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from .kpis import season_table_name
+
+
+DEFAULT_CATALOG_TTL = 600  # seconds
+
+
+class LeagueCatalog:
+    """
+    Indexed snapshot of the league/season tables.
+
+    `available_*` lookups mirror the old queries against
+    possible_leagues_and_seasons_NEW filtered on data_available = 'yes';
+    `all_*` lookups mirror the queries against possible_leagues_and_seasons.
+    """
+
+    def __init__(self, new_rows, old_rows, ttl=DEFAULT_CATALOG_TTL):
+        self.loaded_at = time.monotonic()
+        self.ttl = ttl
+        # Changes only when the catalog rows change; part of the HTTP ETags of the data pages
+        self.fingerprint = hashlib.md5(
+            repr((sorted(map(repr, new_rows)), sorted(map(repr, old_rows)))).encode()
+        ).hexdigest()
+
+        self._season_ids = {}           # (league name, season year) -> season_id
+        self._league_by_season_id = {}  # season_id -> league name
+        self._season_year_by_id = {}    # season_id -> season year
+        available_seasons = {}          # league name -> set of season years
+        all_leagues = set()
+        all_season_years = set()
+
+        # possible_leagues_and_seasons is what most views used for season_id lookups,
+        # so it wins over the NEW table when both know about the same key.
+        for season_id, name, season_year in old_rows:
+            self._season_ids.setdefault((name, str(season_year)), season_id)
+            self._league_by_season_id.setdefault(season_id, name)
+            self._season_year_by_id.setdefault(season_id, season_year)
+            all_leagues.add(name)
+            all_season_years.add(season_year)
+
+        for name, season_year, season_id, data_available in new_rows:
+            self._season_ids.setdefault((name, str(season_year)), season_id)
+            self._league_by_season_id.setdefault(season_id, name)
+            self._season_year_by_id.setdefault(season_id, season_year)
+            if data_available == 'yes':
+                available_seasons.setdefault(name, set()).add(season_year)
+
+        # Newest season of every league, for the nightly ingestion of the running seasons
+        current = {}
+        for season_id, name in self._league_by_season_id.items():
+            key = (str(self._season_year_by_id[season_id]), season_id)
+            if name not in current or key > current[name]:
+                current[name] = key
+        self._current_season_ids = sorted(season_id for _, season_id in current.values())
+        # season_id lookups validate request parameters, which arrive as strings
+        self._season_id_keys = frozenset(str(season_id) for season_id in self._league_by_season_id)
+
+        self._available_leagues = sorted(available_seasons)
+        self._available_seasons = {name: sorted(years) for name, years in available_seasons.items()}
+        self._all_leagues = sorted(all_leagues)
+        self._all_season_years = sorted(all_season_years, reverse=True)
+
+    def is_expired(self):
+        return time.monotonic() - self.loaded_at >= self.ttl
+
+    def leagues(self):
+        """League names with data available, sorted by name."""
+        return list(self._available_leagues)
+
+    def seasons_for_league(self, league_name):
+        """Season years with data available for a league, sorted ascending."""
+        return list(self._available_seasons.get(league_name, []))
+
+    def all_leagues(self):
+        """Every league name in possible_leagues_and_seasons, sorted by name."""
+        return list(self._all_leagues)
+
+    def all_season_years(self):
+        """Every season year in possible_leagues_and_seasons, newest first."""
+        return list(self._all_season_years)
+
+    def season_id(self, league_name, season_year):
+        """Returns the season_id for (league, season year) or None if unknown."""
+        if league_name is None or season_year is None:
+            return None
+        return self._season_ids.get((league_name, str(season_year)))
+
+    def league_name(self, season_id):
+        """Reverse lookup used for the competition_id of upcoming fixtures."""
+        return self._league_by_season_id.get(season_id)
+
+    def season_year(self, season_id):
+        return self._season_year_by_id.get(season_id)
+
+    def season_ids(self):
+        """Every known season_id."""
+        return list(self._league_by_season_id)
+
+    def has_season_id(self, season_id):
+        """True when season_id (an int or its string form) is in the catalog."""
+        return str(season_id) in self._season_id_keys
+
+    def current_season_ids(self):
+        """The season_id of the newest season of every league."""
+        return list(self._current_season_ids)
+
+
+def read_catalog_rows():
+    """(new_rows, old_rows) of possible_leagues_and_seasons_NEW and possible_leagues_and_seasons."""
+    with connection.cursor() as cursor:
+        cursor.execute('''SELECT name, season_year, season_id, data_available FROM "possible_leagues_and_seasons_NEW"''')
+        new_rows = cursor.fetchall()
+        cursor.execute('''SELECT season_id, name, season_year FROM possible_leagues_and_seasons''')
+        old_rows = cursor.fetchall()
+    return new_rows, old_rows
+
+
+def load_catalog(ttl=None):
+    """
+    Reads both catalog tables in one round trip each and builds a LeagueCatalog.
+    With the snapshot backend the catalog saved with the snapshot is used instead.
+    """
+    from .snapshot import get_engine  # snapshot -> db -> catalog
+
+    if ttl is None:
+        ttl = getattr(settings, 'FOOTBALL_CATALOG_TTL', DEFAULT_CATALOG_TTL)
+    engine = get_engine()
+    catalog_rows = engine.catalog_rows() if engine is not None else None
+    if catalog_rows is not None:
+        return LeagueCatalog(*catalog_rows, ttl=ttl)
+    return LeagueCatalog(*read_catalog_rows(), ttl=ttl)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Returns the shared catalog, reloading it when it has expired or been invalidated."""
+    global _catalog
+    catalog = _catalog
+    if catalog is None or catalog.is_expired():
+        with _catalog_lock:
+            if _catalog is None or _catalog.is_expired():
+                _catalog = load_catalog()
+            catalog = _catalog
+    return catalog
+
+
+def invalidate_catalog():
+    """Drops the cached catalog so the next get_catalog() call reloads it (e.g. after loading a new season)."""
+    global _catalog
+    with _catalog_lock:
+        _catalog = None
+
+
+def existing_season_ids(cursor, season_ids):
+    """Returns the season_ids (in the given order) whose match_data_{season_id}_final table exists."""
+    season_ids = list(season_ids)
+    if not season_ids:
+        return []
+    cursor.execute(
+        "SELECT t FROM unnest(%s::text[]) AS t WHERE to_regclass(t) IS NOT NULL",
+        [[season_table_name(season_id) for season_id in season_ids]],
+    )
+    existing_tables = {row[0] for row in cursor.fetchall()}
+    return [season_id for season_id in season_ids if season_table_name(season_id) in existing_tables]
@@ -0,0 +1,130 @@
+"""
+Compact columnar JSON for the chart endpoints (format=columnar).
+
+The default payloads of visualisation_data and league_visualisation_data are shaped
+for Chart.js: every dataset repeats its colours, labels are "GW n" strings built per
+point and Decimals are encoded one by one. A columnar payload instead carries the
+shared arrays once (game weeks, colours, histogram bin labels) and one typed
+numeric array per series, with null for a missing value (a gap in the line):
+
+    {"format": "columnar", "game_weeks": [1, 2, ...],
+     "colors": [...], "background_colors": [...],
+     "series": [{"label": "Arsenal", "color": 0, "values": [5.0, null, 7.0, ...]}, ...],
+     "histogram": {"labels": ["2 - 3", ...], "series": [{"label": "Arsenal", "color": 0, "counts": [...]}]},
+     "descriptive_stats": {...}, ...}
+
+Series are NumPy arrays, encoded with orjson when it is installed (the json module
+otherwise). The body is gzipped once when the client accepts it and, for requests
+with a season ETag (see versions.py), both encodings are cached per ETag in the
+default cache, so repeated requests skip the queries and the encoding altogether.
+"""
+import gzip
+import importlib.util
+import json
+import re
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import quote_etag
+
+from . import timing
+
+
+FORMAT = 'columnar'
+CONTENT_TYPE = 'application/json'
+DEFAULT_CACHE_TTL = 3600  # seconds; a new data version changes the ETag anyway
+DEFAULT_GZIP_MIN_BYTES = 200  # smaller bodies are sent as they are
+GZIP_LEVEL = 6
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def orjson_available():
+    return importlib.util.find_spec('orjson') is not None
+
+
+def requested(request):
+    """True when the request asks for format=columnar."""
+    return request.GET.get('format') == FORMAT
+
+
+def column(values):
+    """
+    A series as a numeric array: None (and NaN) become null, Decimals numbers.
+    Whole numbers without gaps are sent as integers ("5" rather than "5.0").
+    """
+    array = np.array(values, dtype=float)
+    if len(array) and np.isfinite(array).all() and (array == np.floor(array)).all():
+        return array.astype(np.int64)
+    return array
+
+
+def counts(values):
+    return np.asarray(values, dtype=np.int64)
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, np.ndarray):
+        # NaN isn't valid JSON; orjson writes null for it too
+        return [None if item != item else item for item in value.tolist()]
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode(payload):
+    """The payload as compact JSON bytes."""
+    if orjson_available():
+        import orjson
+
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, separators=(',', ':'), allow_nan=False).encode()
+
+
+def _cache_key(request):
+    # The season ETag covers the data versions and the full path (so the other parameters too)
+    state = getattr(request, '_season_state', None)
+    return f"columnar:{state[0]}" if state else None
+
+
+def _response(request, body, compressed, etag=None):
+    if compressed is not None and ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+        response = HttpResponse(compressed, content_type=CONTENT_TYPE)
+        response['Content-Encoding'] = 'gzip'
+        if etag:
+            # Weak: the same ETag is sent for both encodings (like GZipMiddleware)
+            response['ETag'] = f"W/{quote_etag(etag)}"
+    else:
+        response = HttpResponse(body, content_type=CONTENT_TYPE)
+    if compressed is not None:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def cached_response(request):
+    """The cached response of a columnar request, or None when it has to be built."""
+    key = _cache_key(request)
+    if key is None:
+        return None
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    return _response(request, *cached, etag=request._season_state[0])
+
+
+def columnar_response(request, payload):
+    """Encodes (and gzips) a columnar payload, caching both bodies under the request's season ETag."""
+    with timing.span('serialize'):
+        body = encode(payload)
+        compressed = None
+        if len(body) >= getattr(settings, 'COLUMNAR_GZIP_MIN_BYTES', DEFAULT_GZIP_MIN_BYTES):
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    key = _cache_key(request)
+    if key is not None:
+        cache.set(key, (body, compressed), getattr(settings, 'COLUMNAR_CACHE_TTL', DEFAULT_CACHE_TTL))
+    return _response(request, body, compressed, etag=request._season_state[0] if key else None)
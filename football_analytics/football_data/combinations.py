@@ -0,0 +1,230 @@
+"""
+Accumulator (combination) calculator for upcoming fixtures.
+
+For every fixture and selected market (e.g. "corners over/under 9.5") the
+probability of each side is estimated from the teams' season distributions: the
+per-match counts of the home team and of the away team give two empirical
+distributions, whose convolution is the distribution of the match total.
+Selections are treated as independent, so the probability of a combination is
+the product of its legs' probabilities, with at most one leg per fixture.
+
+top_combinations() ranks the k-fold combinations by joint probability without
+enumerating them. It is a branch-and-bound search over log-probabilities:
+fixtures are sorted by their best leg, so the best completion of a partial
+combination is bounded by the next best legs, and any branch whose bound can't
+beat the current top N is cut. The last leg of a combination is chosen for
+all the remaining fixtures at once with NumPy.
+"""
+import heapq
+import math
+
+import numpy as np
+
+from . import db, timing
+from .fixture_stats import load_by_competition, teams_by_competition
+
+
+# market -> (per-team column, label)
+MARKETS = {
+    'corners': ('corners_for', 'Corners'),
+    'shots': ('shots_for', 'Shots'),
+    'shots_on_target': ('shotsontarget_for', 'Shots on target'),
+    'cards': ('yellow_cards_for', 'Yellow cards'),
+}
+SIDES = ('over', 'under')
+DEFAULT_LEGS = 3
+MAX_LEGS = 10
+DEFAULT_TOP = 20
+MAX_TOP = 200
+
+
+class CombinationError(ValueError):
+    """Invalid markets or calculator options."""
+
+
+def parse_market(spec):
+    """'corners:9.5' -> ('corners', 9.5)."""
+    market, _, line = spec.partition(':')
+    if market not in MARKETS:
+        raise CombinationError(f"Unknown market {market!r}, expected one of {', '.join(MARKETS)}")
+    try:
+        line = float(line)
+    except ValueError:
+        raise CombinationError(f"Invalid line in {spec!r}, expected e.g. {market}:9.5")
+    if not math.isfinite(line) or line < 0:
+        raise CombinationError(f"Invalid line in {spec!r}")
+    return market, line
+
+
+def count_pmf(values):
+    """Empirical distribution of non-negative per-match counts (NaN ignored), indexed by count."""
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+    counts = np.bincount(np.clip(np.rint(values), 0, None).astype(int))
+    return counts / counts.sum()
+
+
+def total_pmf(home_values, away_values):
+    """Distribution of the match total of two teams' counts, or None when a team has no data."""
+    home = count_pmf(home_values)
+    away = count_pmf(away_values)
+    if home is None or away is None:
+        return None
+    return np.convolve(home, away)
+
+
+def over_under(pmf, line):
+    """(P(total > line), P(total < line)); a total equal to the line (a push) counts for neither."""
+    totals = np.arange(len(pmf))
+    return float(pmf[totals > line].sum()), float(pmf[totals < line].sum())
+
+
+def market_columns(markets):
+    """The per-team columns the markets need, without duplicates."""
+    return list(dict.fromkeys(MARKETS[market][0] for market, _ in markets))
+
+
+def fixture_legs(fixtures, markets, team_values, min_probability=0.0):
+    """
+    The possible legs of every fixture, most likely first: a list (one per fixture) of
+    [{'market', 'side', 'line', 'probability'}]. team_values is {competition_id: db.fetch_team_values() result}
+    for the market_columns() of markets.
+    """
+    columns = market_columns(markets)
+    legs_by_fixture = []
+    for game in fixtures:
+        values = team_values.get(game["competition_id"], {})
+        home = values.get(game["homeID"])
+        away = values.get(game["awayID"])
+        legs = []
+        if home is not None and away is not None:
+            for market, line in markets:
+                index = columns.index(MARKETS[market][0])
+                pmf = total_pmf(home[1][:, index], away[1][:, index])
+                if pmf is None:
+                    continue
+                for side, probability in zip(SIDES, over_under(pmf, line)):
+                    if probability > 0 and probability >= min_probability:
+                        legs.append({'market': market, 'side': side, 'line': line, 'probability': probability})
+        legs.sort(key=lambda leg: leg['probability'], reverse=True)
+        legs_by_fixture.append(legs)
+    return legs_by_fixture
+
+
+@timing.timed('compute')
+def top_combinations(leg_log_probs, legs, top):
+    """
+    Best `top` combinations of `legs` legs from different fixtures, by joint probability.
+    leg_log_probs is a list (one per fixture) of log-probabilities sorted in descending order.
+    Returns [(joint log-probability, ((fixture index, leg index), ...))], best first.
+    """
+    # Fixtures with their best leg first: the bound of r more legs from position j on is then
+    # the sum of the best legs of the r fixtures at j, j+1, ...
+    order = sorted(
+        (fixture for fixture, log_probs in enumerate(leg_log_probs) if len(log_probs)),
+        key=lambda fixture: leg_log_probs[fixture][0],
+        reverse=True,
+    )
+    n = len(order)
+    if legs < 1 or n < legs or top < 1:
+        return []
+    best = np.array([leg_log_probs[fixture][0] for fixture in order])
+    bound_prefix = np.concatenate([[0.0], np.cumsum(best)])
+
+    # Every leg of the fixtures from position j on, flattened, for the vectorized last leg
+    flat_log_probs = np.concatenate([np.asarray(leg_log_probs[fixture], dtype=float) for fixture in order])
+    flat_position = np.concatenate([np.full(len(leg_log_probs[fixture]), j) for j, fixture in enumerate(order)])
+    flat_leg = np.concatenate([np.arange(len(leg_log_probs[fixture])) for fixture in order])
+    flat_start = np.concatenate([[0], np.cumsum([len(leg_log_probs[fixture]) for fixture in order])])
+
+    heap = []  # min-heap of (log-probability, tie-breaker, legs) holding the best combinations so far
+    counter = 0
+
+    def threshold():
+        return heap[0][0] if len(heap) >= top else -math.inf
+
+    def push(score, chosen):
+        nonlocal counter
+        counter += 1
+        item = (score, -counter, chosen)
+        if len(heap) < top:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    def search(start, remaining, score, chosen):
+        if remaining == 1:
+            scores = score + flat_log_probs[flat_start[start]:]
+            candidates = np.nonzero(scores > threshold())[0]
+            if len(candidates) > top:
+                candidates = candidates[np.argpartition(-scores[candidates], top - 1)[:top]]
+            for index in candidates[np.argsort(-scores[candidates], kind='stable')]:
+                flat_index = flat_start[start] + index
+                leg = (order[flat_position[flat_index]], int(flat_leg[flat_index]))
+                push(float(scores[index]), chosen + (leg,))
+            return
+        for j in range(start, n - remaining + 1):
+            # Bounds only shrink as j grows (fixtures are sorted by their best leg)
+            if score + bound_prefix[j + remaining] - bound_prefix[j] <= threshold():
+                return
+            rest_bound = bound_prefix[j + remaining] - bound_prefix[j + 1]
+            for leg_index, log_prob in enumerate(leg_log_probs[order[j]]):
+                if score + log_prob + rest_bound <= threshold():
+                    break  # the other legs of this fixture are less likely still
+                search(j + 1, remaining - 1, score + log_prob, chosen + ((order[j], leg_index),))
+
+    search(0, legs, 0.0, ())
+    return [(score, chosen) for score, _, chosen in sorted(heap, reverse=True)]
+
+
+def build_combinations(games_data, markets, legs=DEFAULT_LEGS, top=DEFAULT_TOP, min_probability=0.0, catalog=None):
+    """
+    Ranks the `legs`-fold combinations of the not yet played fixtures in games_data
+    (as returned by the fixtures client) for the given [(market, line)].
+    Returns {'fixtures': number considered, 'combinations': [...]}.
+    """
+    if not markets:
+        raise CombinationError("At least one market is required")
+    if not 1 <= legs <= MAX_LEGS:
+        raise CombinationError(f"legs must be between 1 and {MAX_LEGS}")
+    top = max(1, min(top, MAX_TOP))
+
+    fixtures = [game for game in games_data if game.get("status") != "complete"]
+    columns = market_columns(markets)
+    team_values, _ = load_by_competition(
+        teams_by_competition(fixtures),
+        lambda competition_id, team_ids: db.fetch_team_values(competition_id, team_ids, columns),
+    )
+    legs_by_fixture = fixture_legs(fixtures, markets, team_values, min_probability)
+    ranked = top_combinations(
+        [np.log([leg['probability'] for leg in fixture]) if fixture else np.empty(0) for fixture in legs_by_fixture],
+        legs,
+        top,
+    )
+
+    def describe(fixture_index, leg_index):
+        game = fixtures[fixture_index]
+        leg = legs_by_fixture[fixture_index][leg_index]
+        values = team_values.get(game["competition_id"], {})
+        return {
+            'date': game.get("date"),
+            'league': catalog.league_name(game["competition_id"]) if catalog else None,
+            'home_team_name': values[game["homeID"]][0],
+            'away_team_name': values[game["awayID"]][0],
+            'market': leg['market'],
+            'selection': f"{MARKETS[leg['market']][1]} {leg['side']} {leg['line']:g}",
+            'probability': round(leg['probability'], 4),
+        }
+
+    return {
+        'fixtures': sum(1 for fixture in legs_by_fixture if fixture),
+        'combinations': [
+            {
+                'probability': round(math.exp(score), 6),
+                'fair_odds': round(math.exp(-score), 2),
+                'legs': [describe(fixture_index, leg_index) for fixture_index, leg_index in chosen],
+            }
+            for score, chosen in ranked
+        ],
+    }
@@ -0,0 +1,104 @@
+"""
+KPI correlation matrices for the correlations page.
+
+All 20 KPI columns of the selected season tables are fetched in a single
+UNION ALL query and the full Pearson or Spearman matrix is computed with NumPy.
+Rows with a missing value in any KPI are dropped before computing, so every
+coefficient in a matrix is based on the same matches.
+
+Results are cached per (season_id set, method, home/away) in the default cache,
+keyed on the seasons' data versions (versions.py) too, so an ingest that changes a
+season makes its cached matrices unreachable.
+"""
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from . import db, timing, versions
+from .kpis import KPI_COLUMNS
+
+
+METHODS = ('pearson', 'spearman')
+DEFAULT_CACHE_TTL = 3600  # seconds
+DEFAULT_MAX_SEASONS = 100
+
+
+def load_kpi_matrix(season_ids, home_or_away=None):
+    """
+    Fetches every KPI column of the given seasons (one query for those not snapshotted).
+    Returns a float array of shape (matches, len(KPI_COLUMNS)) with NaN for NULLs.
+    """
+    return db.fetch_kpi_matrix(season_ids, home_or_away)
+
+
+def rank_columns(matrix):
+    """Ranks every column independently, giving tied values their average rank."""
+    ranks = np.empty_like(matrix, dtype=float)
+    n = matrix.shape[0]
+    for j in range(matrix.shape[1]):
+        sorter = np.argsort(matrix[:, j], kind='mergesort')
+        sorted_col = matrix[sorter, j]
+        new_value = np.r_[True, sorted_col[1:] != sorted_col[:-1]]
+        dense = np.cumsum(new_value)
+        bounds = np.r_[np.nonzero(new_value)[0], n]
+        ranks[sorter, j] = 0.5 * (bounds[dense] + bounds[dense - 1] + 1)
+    return ranks
+
+
+@timing.timed('compute')
+def correlation_matrix(matrix, method='pearson'):
+    """
+    Computes the KPI x KPI correlation matrix. Rows containing NaN are dropped first.
+    Returns (coefficients, number of rows used). Constant columns give NaN coefficients.
+    """
+    complete = matrix[~np.isnan(matrix).any(axis=1)]
+    n_rows = complete.shape[0]
+    n_cols = matrix.shape[1]
+    if n_rows < 2:
+        return np.full((n_cols, n_cols), np.nan), n_rows
+    if method == 'spearman':
+        complete = rank_columns(complete)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        coefficients = np.corrcoef(complete, rowvar=False)
+    return np.atleast_2d(coefficients), n_rows
+
+
+def _cache_key(season_ids, method, home_or_away, season_versions):
+    # Seasons without a recorded version are keyed as such; they change the key once recorded
+    known = {str(season_id): version for season_id, (version, _) in season_versions.items()}
+    seasons = ','.join(f"{season_id}:{known.get(str(season_id), '-')}" for season_id in sorted(season_ids))
+    raw = f"{method}|{home_or_away or 'all'}|{seasons}"
+    return "correlations:" + hashlib.md5(raw.encode()).hexdigest()
+
+
+def get_correlations(season_ids, method='pearson', home_or_away=None):
+    """
+    Returns the correlation result for a set of seasons, from the cache when possible:
+    {'method', 'home_or_away', 'season_ids', 'n_rows', 'columns', 'matrix'}.
+    Matrix entries are rounded to 4 decimals, with None where undefined.
+    """
+    max_seasons = getattr(settings, 'CORRELATIONS_MAX_SEASONS', DEFAULT_MAX_SEASONS)
+    season_ids = sorted(set(season_ids))[:max_seasons]
+    key = _cache_key(season_ids, method, home_or_away, versions.get_versions())
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    season_ids = db.existing_season_ids(season_ids)
+    matrix = load_kpi_matrix(season_ids, home_or_away)
+    coefficients, n_rows = correlation_matrix(matrix, method)
+    result = {
+        'method': method,
+        'home_or_away': home_or_away,
+        'season_ids': season_ids,
+        'n_rows': n_rows,
+        'columns': list(KPI_COLUMNS),
+        'matrix': [
+            [None if np.isnan(value) else round(float(value), 4) for value in row]
+            for row in coefficients
+        ],
+    }
+    cache.set(key, result, getattr(settings, 'CORRELATIONS_CACHE_TTL', DEFAULT_CACHE_TTL))
+    return result
@@ -0,0 +1,946 @@
+"""
+Data access layer for the match_data_{season_id}_final tables.
+
+Every read query of the views goes through the helpers at the bottom of this
+module (fetch_kpi_series, fetch_team_aggregates, ...). They
+
+* validate the dynamic identifiers: season tables must belong to a season_id in
+  the catalog and KPI columns must be in KPI_COLUMNS;
+* run on a connection from a thread-safe pool instead of Django's per-request
+  connection, so requests don't pay for the connection setup to the database;
+* execute as server-side prepared statements, cached per connection and per SQL
+  text (i.e. per query template and table), so identical queries are planned once.
+
+pool_stats() reports pool saturation (connections in use, waits for a free
+connection, wait times). Set FOOTBALL_DB_POOL['ENABLED'] = False, or use a
+non-PostgreSQL database, to run the same helpers on Django's connection.
+With FOOTBALL_DATA_BACKEND = 'snapshot', seasons in the local snapshot are
+answered from memory-mapped columns instead (see snapshot.py).
+The async views use the same queries through async_db.
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from . import aggregates, snapshot, timing
+from .catalog import existing_season_ids as _existing_season_ids, get_catalog
+from .kpis import AVERAGE_ONLY_KPIS, KPI_COLUMNS, season_table_name
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_POOL_SETTINGS = {
+    'ENABLED': True,
+    'MIN_CONNECTIONS': 1,
+    'MAX_CONNECTIONS': 10,
+    'TIMEOUT': 10,                    # seconds to wait for a free connection
+    'MAX_PREPARED_PER_CONNECTION': 256,
+}
+
+# Columns shown on the match details page (and exported)
+MATCH_COLUMNS = [
+    'team_name', 'opponent_name', 'homeoraway', 'season', 'game_week',
+] + KPI_COLUMNS + ['stadium_name']
+# Every column the app reads from the season tables
+TABLE_COLUMNS = MATCH_COLUMNS + ['teamid', 'points']
+# Columns that can be read as numbers (correlations, regressions)
+NUMERIC_COLUMNS = KPI_COLUMNS + ['points']
+DEFAULT_FORM_WINDOW = 5  # matches in a team's form (last N game weeks)
+MAX_FORM_WINDOW = 50
+# Order of a team's matches, most recent first, for its form
+FORM_ORDER = "game_week DESC NULLS LAST, opponent_name ASC NULLS LAST"
+
+
+class InvalidIdentifier(ValueError):
+    """A season or column name that is not known to the catalog."""
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within the configured timeout."""
+
+
+def pool_settings():
+    return {**DEFAULT_POOL_SETTINGS, **getattr(settings, 'FOOTBALL_DB_POOL', {})}
+
+
+_PLACEHOLDER = re.compile(r"%%|%s")
+
+
+def _to_positional(sql):
+    """Turns psycopg2 %s placeholders into the $1, $2... form PREPARE expects."""
+    counter = iter(range(1, 10000))
+    return _PLACEHOLDER.sub(lambda m: '%' if m.group() == '%%' else f"${next(counter)}", sql)
+
+
+def _statement_name(sql):
+    return "fa_" + hashlib.md5(sql.encode()).hexdigest()[:20]
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool that blocks (up to timeout) when every
+    connection is in use, and keeps the prepared statements of each connection.
+    Returned connections stay open for the next checkout; only broken ones are closed.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, max_prepared, **connect_kwargs):
+        self._connect_kwargs = connect_kwargs
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_prepared = max_prepared
+        self._idle = []  # open connections not in use, most recently returned last
+        # connection -> OrderedDict of statement names, least recently used first; an entry
+        # goes away with its connection, so a new connection never inherits stale names
+        self._prepared = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'in_use': 0,
+            'peak_in_use': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'connections_opened': 0,
+            'prepared_statements': 0,
+            'prepared_hits': 0,
+        }
+        for _ in range(min(minconn, maxconn)):
+            self._idle.append(self._connect())
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(**self._connect_kwargs)
+        conn.autocommit = True  # read queries; no transaction left open between checkouts
+        with self._lock:
+            self._stats['connections_opened'] += 1
+        return conn
+
+    def _getconn(self):
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.closed:
+                    return conn
+        return self._connect()
+
+    def _putconn(self, conn, discard):
+        if discard:
+            self._prepared.pop(conn, None)
+            if not conn.closed:
+                conn.close()
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def connection(self):
+        import psycopg2
+
+        started = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['waits'] += 1
+            if not self._slots.acquire(timeout=self.timeout):
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise PoolTimeout(f"No database connection free after {self.timeout}s ({self.maxconn} in use)")
+        wait_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self._stats
+            stats['checkouts'] += 1
+            stats['in_use'] += 1
+            stats['peak_in_use'] = max(stats['peak_in_use'], stats['in_use'])
+            stats['total_wait_ms'] += wait_ms
+            stats['max_wait_ms'] = max(stats['max_wait_ms'], wait_ms)
+
+        conn = None
+        broken = False
+        try:
+            conn = self._getconn()
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if conn is not None:
+                self._putconn(conn, broken or bool(conn.closed))
+            with self._lock:
+                self._stats['in_use'] -= 1
+            self._slots.release()
+
+    def execute(self, cursor, sql, params=None):
+        """Executes sql as a prepared statement on the cursor's connection, preparing it on first use."""
+        started = time.perf_counter()
+        try:
+            self._execute(cursor, sql, params)
+        finally:
+            timing.record_query(sql, (time.perf_counter() - started) * 1000)
+
+    def _execute(self, cursor, sql, params):
+        import psycopg2
+
+        params = list(params or [])
+        name = _statement_name(sql)
+        prepared = self._prepared.setdefault(cursor.connection, OrderedDict())
+        if name in prepared:
+            prepared.move_to_end(name)
+            with self._lock:
+                self._stats['prepared_hits'] += 1
+        else:
+            try:
+                cursor.execute(f"PREPARE {name} AS {_to_positional(sql)}")
+                with self._lock:
+                    self._stats['prepared_statements'] += 1
+            except psycopg2.errors.DuplicatePreparedStatement:
+                pass  # prepared earlier on this session, e.g. before our bookkeeping was reset
+            prepared[name] = True
+            if len(prepared) > self.max_prepared:
+                oldest, _ = prepared.popitem(last=False)
+                cursor.execute(f"DEALLOCATE {oldest}")
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['max_connections'] = self.maxconn
+        stats['utilisation'] = round(stats['in_use'] / self.maxconn, 3)
+        stats['avg_wait_ms'] = round(stats['total_wait_ms'] / stats['checkouts'], 3) if stats['checkouts'] else 0.0
+        stats['total_wait_ms'] = round(stats['total_wait_ms'], 3)
+        stats['max_wait_ms'] = round(stats['max_wait_ms'], 3)
+        return stats
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._putconn(conn, discard=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pooling_enabled():
+    return pool_settings()['ENABLED'] and connection.vendor == 'postgresql'
+
+
+def connect_kwargs():
+    """libpq connection parameters of DATABASES['default']."""
+    db = settings.DATABASES['default']
+    return dict(
+        dbname=db['NAME'],
+        user=db.get('USER'),
+        password=db.get('PASSWORD'),
+        host=db.get('HOST') or None,
+        port=db.get('PORT') or None,
+        **db.get('OPTIONS', {}),
+    )
+
+
+def get_pool():
+    """Returns the process-wide pool, created on first use from DATABASES['default']."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                options = pool_settings()
+                _pool = ConnectionPool(
+                    options['MIN_CONNECTIONS'],
+                    options['MAX_CONNECTIONS'],
+                    options['TIMEOUT'],
+                    options['MAX_PREPARED_PER_CONNECTION'],
+                    **connect_kwargs(),
+                )
+    return _pool
+
+
+def pool_stats():
+    """Saturation metrics of the pool, or {'enabled': False} when queries run on Django's connection."""
+    if not pooling_enabled():
+        return {'enabled': False}
+    return dict(get_pool().stats(), enabled=True)
+
+
+@contextmanager
+def get_cursor():
+    """Yields a cursor on a pooled connection (or on Django's connection when pooling is off)."""
+    if not pooling_enabled():
+        with connection.cursor() as cursor:
+            yield cursor
+        return
+    with get_pool().connection() as conn:
+        with conn.cursor() as cursor:
+            yield cursor
+
+
+def execute(cursor, sql, params=None):
+    """Runs sql on a cursor from get_cursor(), as a cached prepared statement when pooling is on."""
+    if pooling_enabled():
+        get_pool().execute(cursor, sql, params)
+    else:
+        cursor.execute(sql, params)
+
+
+def close_thread_connection():
+    """Closes Django's connection for the current worker thread when pooling is off (pooled connections are returned already)."""
+    if not pooling_enabled():
+        connection.close()
+
+
+# --- Identifier validation ---
+
+def season_table(season_id):
+    """Returns the match_data table of a season_id known to the catalog, or raises InvalidIdentifier."""
+    if not str(season_id).isdigit() or not get_catalog().has_season_id(season_id):
+        raise InvalidIdentifier(f"Unknown season_id {season_id!r}")
+    return season_table_name(season_id)
+
+
+def kpi_column(kpi):
+    if kpi not in KPI_COLUMNS:
+        raise InvalidIdentifier(f"Unknown KPI column {kpi!r}")
+    return kpi
+
+
+# --- Query helpers used by the views ---
+
+def existing_season_ids(season_ids):
+    """Filters season_ids down to those in the catalog whose table exists (or that are snapshotted)."""
+    catalog = get_catalog()
+    season_ids = [season_id for season_id in season_ids if catalog.has_season_id(season_id)]
+    snapshotted = {season_id for season_id in season_ids if snapshot.snapshot_season(season_id) is not None}
+    to_check = [season_id for season_id in season_ids if season_id not in snapshotted]
+    if to_check:
+        with get_cursor() as cursor:
+            snapshotted.update(_existing_season_ids(cursor, to_check))
+    return [season_id for season_id in season_ids if season_id in snapshotted]
+
+
+def fetch_team_names(season_id):
+    """Distinct team names of a season, sorted."""
+    table_name = season_table(season_id)
+    season_snapshot = snapshot.snapshot_season(season_id)
+    if season_snapshot is not None:
+        return season_snapshot.team_names()
+    with get_cursor() as cursor:
+        execute(cursor, f'''SELECT DISTINCT team_name FROM "{table_name}" ORDER BY team_name''')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def kpi_series_query(table_name, kpi):
+    """SQL of fetch_kpi_series; its parameter is the list of team names."""
+    return f"""
+        SELECT team_name, game_week, "{kpi}"
+        FROM "{table_name}"
+        WHERE team_name = ANY(%s)
+        ORDER BY game_week
+    """
+
+
+def fetch_kpi_series(season_id, kpi, team_names):
+    """
+    Fetches KPI data for several teams of a season in a single query.
+    Returns a dict {team_name: [(game_week, kpi_value), ...]} ordered by game_week;
+    teams without rows are missing from the dict.
+    """
+    table_name = season_table(season_id)
+    kpi = kpi_column(kpi)
+    season_snapshot = snapshot.snapshot_season(season_id)
+    if season_snapshot is not None:
+        return season_snapshot.kpi_series(kpi, team_names)
+    try:
+        with get_cursor() as cursor:
+            execute(cursor, kpi_series_query(table_name, kpi), [list(team_names)])
+            rows = cursor.fetchall()
+    except Exception as e:
+        logger.exception("Error in fetch_kpi_series for %s, KPI %s in %s", team_names, kpi, table_name)
+        return {} # Return empty dict on error to allow the view to continue if possible
+
+    # Split the rows per team in one pass; ORDER BY game_week keeps each team's series ordered
+    data_by_team = {}
+    for team_name, game_week, kpi_value in rows:
+        data_by_team.setdefault(team_name, []).append((game_week, kpi_value))
+    return data_by_team
+
+
+def fetch_kpi_series_across_seasons(season_ids, kpi, team_name):
+    """
+    Fetches a team's KPI data from several season tables in one UNION ALL query.
+    Returns a dict {season_id: [(game_week, kpi_value), ...]} ordered by game_week;
+    seasons without rows for the team are missing from the dict.
+    All season tables must exist (see existing_season_ids).
+    """
+    if not season_ids:
+        return {}
+    kpi = kpi_column(kpi)
+    data_by_season = {}
+    queried = []
+    for season_id in season_ids:
+        season_table(season_id)
+        season_snapshot = snapshot.snapshot_season(season_id)
+        if season_snapshot is None:
+            queried.append(season_id)
+        else:
+            series = season_snapshot.kpi_series(kpi, [team_name]).get(team_name)
+            if series:
+                data_by_season[season_id] = series
+
+    if queried:
+        query = " UNION ALL ".join(
+            f"""SELECT {position} AS season_position, game_week, "{kpi}" FROM "{season_table(season_id)}" WHERE team_name = %s"""
+            for position, season_id in enumerate(queried)
+        )
+        query += " ORDER BY season_position, game_week"
+        with get_cursor() as cursor:
+            execute(cursor, query, [team_name] * len(queried))
+            rows = cursor.fetchall()
+        for position, game_week, kpi_value in rows:
+            data_by_season.setdefault(queried[position], []).append((game_week, kpi_value))
+
+    # Keep the order of season_ids
+    return {season_id: data_by_season[season_id] for season_id in season_ids if season_id in data_by_season}
+
+
+def team_matches_query(table_name):
+    """SQL of fetch_team_matches; its parameter is the team name."""
+    return f"""
+        SELECT {', '.join(MATCH_COLUMNS)}
+        FROM {table_name}
+        WHERE team_name = %s
+        ORDER BY game_week
+    """
+
+
+def fetch_team_matches(season_id, team_name):
+    """Every match of a team in a season, ordered by game week. Returns (rows, column_names)."""
+    table_name = season_table(season_id)
+    season_snapshot = snapshot.snapshot_season(season_id)
+    if season_snapshot is not None:
+        return season_snapshot.team_matches(team_name)
+    with get_cursor() as cursor:
+        execute(cursor, team_matches_query(table_name), [team_name])
+        return cursor.fetchall(), [col[0] for col in cursor.description]
+
+
+def _aggregate_columns(view_type):
+    # Aliases stay avg_<kpi> in both views; totals sum every KPI except possession
+    columns = []
+    for kpi in KPI_COLUMNS:
+        if view_type == 'totals' and kpi not in AVERAGE_ONLY_KPIS:
+            columns.append((f"SUM({kpi})", f"sum_{kpi}", f"avg_{kpi}"))
+        else:
+            columns.append((f"ROUND(CAST(AVG({kpi}) AS NUMERIC), 2)", f"avg_{kpi}", f"avg_{kpi}"))
+    return columns
+
+
+def fetch_team_aggregates(season_id, view_type='averages', home_or_away=None):
+    """
+    League table of a season: team_name, games_played, total_points and one avg_<kpi>
+    column per KPI (totals in the totals view). Read from team_season_aggregates when the
+    season has been built (manage.py refresh_team_aggregates), otherwise aggregated live.
+    Returns (rows, column_names).
+    """
+    table_name = season_table(season_id)
+    season_snapshot = snapshot.snapshot_season(season_id)
+    if season_snapshot is not None:
+        return season_snapshot.team_aggregates(view_type, home_or_away)
+    columns = _aggregate_columns(view_type)
+    with get_cursor() as cursor:
+        precomputed_query = f"""
+            SELECT team_name, games_played, total_points, {', '.join(f"{stored} AS {alias}" for _, stored, alias in columns)}
+            FROM {aggregates.AGGREGATES_TABLE}
+            WHERE season_id = %s AND scope = %s
+            ORDER BY total_points DESC
+        """
+        try:
+            execute(cursor, precomputed_query, [season_id, home_or_away or aggregates.ALL_GAMES_SCOPE])
+            rows = cursor.fetchall()
+            if rows:
+                return rows, [col[0] for col in cursor.description]
+        except Exception as e:
+            logger.warning("Aggregates not available for season %s: %s", season_id, e)
+
+        live_query = f"""
+            SELECT
+                team_name,
+                count(points) AS games_played,
+                SUM(points) AS total_points,
+                {', '.join(f"{expression} AS {alias}" for expression, _, alias in columns)}
+            FROM {table_name}
+        """
+        if home_or_away:
+            live_query += " WHERE homeoraway = %s"
+            params = [home_or_away]
+        else:
+            params = []
+        live_query += " GROUP BY team_name ORDER BY total_points DESC"
+        execute(cursor, live_query, params)
+        return cursor.fetchall(), [col[0] for col in cursor.description]
+
+
+def _form_columns():
+    # avg_<kpi> for every KPI, then sum_<kpi> for the KPIs that can be summed
+    columns = [(f"ROUND(CAST(AVG({kpi}) AS NUMERIC), 2)", f"avg_{kpi}") for kpi in KPI_COLUMNS]
+    columns += [(f"SUM({kpi})", f"sum_{kpi}") for kpi in KPI_COLUMNS if kpi not in AVERAGE_ONLY_KPIS]
+    return columns
+
+
+def fetch_team_form(season_id, window=None, home_or_away=None):
+    """
+    Form table of a season: every team's last `window` matches (home or away matches
+    only with home_or_away), in one query with a ROW_NUMBER() window per team.
+    Columns: team_name, games_played, total_points, avg_<kpi> for every KPI and
+    sum_<kpi> for every summable KPI. Returns (rows, column_names).
+    """
+    table_name = season_table(season_id)
+    window = form_window(window)
+    season_snapshot = snapshot.snapshot_season(season_id)
+    if season_snapshot is not None:
+        return season_snapshot.team_form(window, home_or_away)
+    where = "WHERE homeoraway = %s" if home_or_away else ""
+    params = [home_or_away] if home_or_away else []
+    query = f"""
+        SELECT
+            team_name,
+            COUNT(*) AS games_played,
+            SUM(points) AS total_points,
+            {', '.join(f"{expression} AS {alias}" for expression, alias in _form_columns())}
+        FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY team_name ORDER BY {FORM_ORDER}) AS form_rank
+            FROM {table_name}
+            {where}
+        ) recent
+        WHERE form_rank <= %s
+        GROUP BY team_name
+        ORDER BY total_points DESC
+    """
+    with get_cursor() as cursor:
+        execute(cursor, query, params + [window])
+        return cursor.fetchall(), [col[0] for col in cursor.description]
+
+
+def league_gameweek_query(table_name, kpi, aggregation_type='averages'):
+    """Live game-week aggregation of one season table, for validated identifiers (see leagues_gameweek_query)."""
+    agg_function = f"SUM({kpi})" if aggregation_type == 'totals' else f"AVG({kpi})"
+    return f"""
+        SELECT
+            game_week,
+            {agg_function} as aggregated_value,
+            COUNT(*) as games_count
+        FROM {table_name}
+        WHERE {kpi} IS NOT NULL
+        GROUP BY game_week
+        ORDER BY game_week
+    """
+
+
+def fetch_league_gameweek_aggregates(season_id, kpi, aggregation_type='averages'):
+    """Per game week: (game_week, SUM or AVG of the KPI over all teams, number of team-matches)."""
+    return fetch_leagues_gameweek_aggregates([season_id], kpi, aggregation_type).get(season_id, [])
+
+
+def gameweek_rollup_query(kpi, aggregation_type='averages'):
+    """
+    SQL reading the league_gameweek_aggregates rollup (see aggregates.py) of the seasons in its
+    one parameter, a list of season ids; for a validated KPI column.
+    """
+    if aggregation_type == 'totals':
+        value = f"sum_{kpi}"
+    else:
+        value = f"CAST(sum_{kpi} AS DOUBLE PRECISION) / NULLIF(count_{kpi}, 0)"
+    return f"""
+        SELECT season_id, game_week, {value} AS aggregated_value, count_{kpi} AS games_count
+        FROM {aggregates.GAMEWEEK_TABLE}
+        WHERE season_id = ANY(%s)
+        ORDER BY season_id, game_week
+    """
+
+
+def leagues_gameweek_query(table_names, kpi, aggregation_type='averages'):
+    """
+    league_gameweek_query of several season tables in one UNION ALL statement; every row starts
+    with the position of its table in table_names.
+    """
+    branches = [
+        f"SELECT {position} AS season_position, game_week, aggregated_value, games_count"
+        f" FROM ({league_gameweek_query(table_name, kpi, aggregation_type)}) season_{position}"
+        for position, table_name in enumerate(table_names)
+    ]
+    return " UNION ALL ".join(branches) + " ORDER BY season_position, game_week"
+
+
+def split_gameweek_seasons(season_ids, kpi, aggregation_type='averages'):
+    """
+    Validates the seasons and the KPI of fetch_leagues_gameweek_aggregates. Returns
+    (kpi column, {season_id: rows} of the snapshotted seasons, season ids to query).
+    """
+    kpi = kpi_column(kpi)
+    results = {}
+    queried = []
+    for season_id in season_ids:
+        season_table(season_id)
+        season_snapshot = snapshot.snapshot_season(season_id)
+        if season_snapshot is None:
+            queried.append(season_id)
+        else:
+            results[season_id] = season_snapshot.league_gameweek_aggregates(kpi, aggregation_type)
+    return kpi, results, queried
+
+
+def group_rollup_rows(season_ids, rows):
+    """
+    {season_id: [(game_week, aggregated_value, games_count)]} of gameweek_rollup_query rows.
+    Every rolled-up season gets an entry; game weeks without a value for the KPI are left out.
+    """
+    by_key = {str(season_id): season_id for season_id in season_ids}
+    grouped = {}
+    for season_key, game_week, value, games_count in rows:
+        season_rows = grouped.setdefault(by_key[str(season_key)], [])
+        if games_count:
+            season_rows.append((game_week, value, games_count))
+    return grouped
+
+
+def group_union_rows(season_ids, rows):
+    """{season_id: rows} of leagues_gameweek_query rows, for the seasons listed in the query."""
+    grouped = {}
+    for position, *row in rows:
+        grouped.setdefault(season_ids[position], []).append(tuple(row))
+    return grouped
+
+
+def fetch_leagues_gameweek_aggregates(season_ids, kpi, aggregation_type='averages'):
+    """
+    fetch_league_gameweek_aggregates of several seasons at once: {season_id: rows}, seasons
+    without rows left out. Rolled-up seasons are read from league_gameweek_aggregates in one
+    query; the others (not refreshed yet) are aggregated live in one UNION ALL query.
+    """
+    kpi, results, queried = split_gameweek_seasons(season_ids, kpi, aggregation_type)
+    if queried:
+        with get_cursor() as cursor:
+            try:
+                execute(cursor, gameweek_rollup_query(kpi, aggregation_type), [list(queried)])
+                results.update(group_rollup_rows(queried, cursor.fetchall()))
+            except Exception as e:
+                logger.warning("Game-week aggregates not available: %s", e)
+            live = [season_id for season_id in queried if season_id not in results]
+            if live:
+                execute(cursor, leagues_gameweek_query([season_table(s) for s in live], kpi, aggregation_type))
+                results.update(group_union_rows(live, cursor.fetchall()))
+    return {season_id: results[season_id] for season_id in season_ids if results.get(season_id)}
+
+
+def competition_team_stats_query(table_name):
+    """
+    SQL of fetch_competition_team_stats; its parameters are the form window and the list of team ids.
+    Season and form averages come from one scan: ROW_NUMBER() ranks every team's matches, most recent first.
+    """
+    return f"""
+        SELECT teamid,
+               MAX(team_name) AS team_name,
+               AVG(corners_for) AS corners_avg,
+               AVG(shots_for) AS shots_avg,
+               AVG(shotsontarget_for) AS shots_on_target_avg,
+               AVG(yellow_cards_for) AS yellow_cards_avg,
+               AVG(CASE WHEN in_form THEN corners_for END) AS corners_form,
+               AVG(CASE WHEN in_form THEN shots_for END) AS shots_form,
+               AVG(CASE WHEN in_form THEN shotsontarget_for END) AS shots_on_target_form,
+               AVG(CASE WHEN in_form THEN yellow_cards_for END) AS yellow_cards_form
+        FROM (
+            SELECT teamid, team_name, corners_for, shots_for, shotsontarget_for, yellow_cards_for,
+                   ROW_NUMBER() OVER (PARTITION BY teamid ORDER BY {FORM_ORDER}) <= %s AS in_form
+            FROM {table_name}
+            WHERE teamid = ANY(%s)
+        ) matches
+        GROUP BY teamid
+    """
+
+
+def form_window(window=None):
+    """The form window: window if given, else the FORM_WINDOW setting; raises ValueError outside 1..MAX_FORM_WINDOW."""
+    window = int(window if window is not None else getattr(settings, 'FORM_WINDOW', DEFAULT_FORM_WINDOW))
+    if not 1 <= window <= MAX_FORM_WINDOW:
+        raise ValueError(f"The form window must be between 1 and {MAX_FORM_WINDOW}")
+    return window
+
+
+def fetch_competition_team_stats(competition_id, team_ids, window=None):
+    """
+    Returns {teamid: (team_name, corners_avg, shots_avg, shots_on_target_avg, yellow_cards_avg,
+    corners_form, shots_form, shots_on_target_form, yellow_cards_form)} for the given teams of
+    one competition, in a single query. The *_form averages cover each team's last `window`
+    matches (FORM_WINDOW by default).
+    Raises if the competition is unknown or has no match_data table.
+    """
+    table_name = season_table(competition_id)
+    window = form_window(window)
+    season_snapshot = snapshot.snapshot_season(competition_id)
+    if season_snapshot is not None:
+        return season_snapshot.competition_team_stats(team_ids, window)
+    with get_cursor() as cursor:
+        execute(cursor, competition_team_stats_query(table_name), [window, list(team_ids)])
+        return {row[0]: row[1:] for row in cursor.fetchall()}
+
+
+def fetch_team_values(competition_id, team_ids, columns):
+    """
+    Per-match values of numeric columns for the given teams of one competition, in a single query:
+    {teamid: (team_name, float array of shape (matches, len(columns)))}, NaN for NULLs.
+    """
+    table_name = season_table(competition_id)
+    columns = list(columns)
+    for column in columns:
+        if column not in NUMERIC_COLUMNS:
+            raise InvalidIdentifier(f"Unknown numeric column {column!r}")
+    season_snapshot = snapshot.snapshot_season(competition_id)
+    if season_snapshot is not None:
+        return season_snapshot.team_values(team_ids, columns)
+    query = f"""
+        SELECT teamid, team_name, {', '.join(columns)}
+        FROM {table_name}
+        WHERE teamid = ANY(%s)
+    """
+    with get_cursor() as cursor:
+        execute(cursor, query, [list(team_ids)])
+        rows = cursor.fetchall()
+    names = {}
+    values = {}
+    for teamid, team_name, *row in rows:
+        values.setdefault(teamid, []).append(row)
+        # MAX(team_name), as in fetch_competition_team_stats
+        if team_name is not None and (teamid not in names or team_name > names[teamid]):
+            names[teamid] = team_name
+    # float() handles Decimal columns; None becomes NaN
+    return {teamid: (names.get(teamid), np.array(team_rows, dtype=float)) for teamid, team_rows in values.items()}
+
+
+def fetch_season_matrices(season_ids, columns=KPI_COLUMNS, home_or_away=None):
+    """
+    Numeric columns (KPIs or points) of the given seasons as {season_id: float array of shape
+    (matches, len(columns))}, NaN for NULLs, in the order of season_ids; seasons without rows are left out.
+    Seasons that are not snapshotted are fetched in one UNION ALL query.
+    """
+    columns = list(columns)
+    for column in columns:
+        if column not in NUMERIC_COLUMNS:
+            raise InvalidIdentifier(f"Unknown numeric column {column!r}")
+    matrices = {}
+    queried = []
+    for season_id in season_ids:
+        season_table(season_id)
+        season_snapshot = snapshot.snapshot_season(season_id)
+        if season_snapshot is None:
+            queried.append(season_id)
+        else:
+            matrices[season_id] = season_snapshot.matrix(columns, home_or_away)
+
+    if queried:
+        where = " WHERE homeoraway = %s" if home_or_away else ""
+        query = " UNION ALL ".join(
+            f"SELECT {position} AS season_position, {', '.join(columns)} FROM {season_table(season_id)}{where}"
+            for position, season_id in enumerate(queried)
+        )
+        params = [home_or_away] * len(queried) if home_or_away else []
+        with get_cursor() as cursor:
+            execute(cursor, query, params)
+            rows = cursor.fetchall()
+        if rows:
+            # float() handles Decimal columns; None becomes NaN
+            array = np.array(rows, dtype=float)
+            positions = array[:, 0].astype(int)
+            for position, season_id in enumerate(queried):
+                matrices[season_id] = array[positions == position, 1:]
+
+    return {
+        season_id: matrices[season_id]
+        for season_id in season_ids
+        if season_id in matrices and len(matrices[season_id])
+    }
+
+
+def fetch_kpi_matrix(season_ids, home_or_away=None):
+    """
+    Every KPI column of the given seasons as a float array of shape (matches, len(KPI_COLUMNS)),
+    NaN for NULLs.
+    """
+    matrices = fetch_season_matrices(season_ids, KPI_COLUMNS, home_or_away)
+    if not matrices:
+        return np.empty((0, len(KPI_COLUMNS)))
+    return np.concatenate(list(matrices.values()))
+
+
+def iter_matches(season_ids, columns=MATCH_COLUMNS, team_names=None, home_or_away=None, itersize=2000):
+    """
+    Streams match rows of one or more seasons, season by season, ordered by game week.
+    Rows are read through a server-side (named) cursor itersize rows at a time, so memory
+    stays flat whatever the table size. Identifiers are validated before the iterator is
+    returned; the connection is held until the iterator is exhausted or closed.
+    """
+    tables = [season_table(season_id) for season_id in season_ids]
+    for column in columns:
+        if column not in TABLE_COLUMNS:
+            raise InvalidIdentifier(f"Unknown match column {column!r}")
+
+    conditions = []
+    params = []
+    if team_names:
+        conditions.append("team_name = ANY(%s)")
+        params.append(list(team_names))
+    if home_or_away:
+        conditions.append("homeoraway = %s")
+        params.append(home_or_away)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    queries = [
+        f"SELECT {', '.join(columns)} FROM {table_name}{where} ORDER BY game_week, team_name"
+        for table_name in tables
+    ]
+
+    def fetch_batches(cursor):
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                return
+            yield from rows
+
+    def stream_pooled():
+        with get_pool().connection() as conn:
+            # Named cursors live inside a transaction; give the connection back in autocommit
+            conn.autocommit = False
+            try:
+                for position, query in enumerate(queries):
+                    with conn.cursor(name=f"fa_export_{position}") as cursor:
+                        cursor.itersize = itersize
+                        cursor.execute(query, params)
+                        yield from fetch_batches(cursor)
+            finally:
+                if not conn.closed:
+                    conn.rollback()
+                    conn.autocommit = True
+
+    def stream_django():
+        for query in queries:
+            # A named cursor on PostgreSQL, a plain one elsewhere
+            with connection.chunked_cursor() as cursor:
+                cursor.execute(query, params)
+                yield from fetch_batches(cursor)
+
+    return stream_pooled() if pooling_enabled() else stream_django()
+
+
+def fetch_team_season_ids(team_name):
+    """
+    season_ids in which a team has matches, from team_season_aggregates.
+    Returns None when the aggregates are not available (see refresh_team_aggregates).
+    """
+    try:
+        with get_cursor() as cursor:
+            execute(cursor, f"""
+                SELECT season_id FROM {aggregates.AGGREGATES_TABLE}
+                WHERE team_name = %s AND scope = %s
+            """, [team_name, aggregates.ALL_GAMES_SCOPE])
+            rows = cursor.fetchall()
+    except Exception as e:
+        logger.warning("Aggregates not available for team season lookup: %s", e)
+        return None
+    return [row[0] for row in rows] or None
+
+
+# Explorer order within a season. NULLs are coalesced so that every row has a keyset
+# value the (game_week, opponent_name) < (...) comparison can step past; they sort last.
+def match_window_order():
+    """
+    (expression, placeholder) of the explorer sort keys, newest first. Game week and opponent
+    are not unique within a season, so the physical row id comes last as a tiebreaker: ctid
+    on PostgreSQL (compared as a tid, stored as its text in a cursor), rowid elsewhere.
+    """
+    row_id = ("ctid", "%s::tid") if connection.vendor == 'postgresql' else ("rowid", "%s")
+    return [("COALESCE(game_week, -1)", "%s"), ("COALESCE(opponent_name, '')", "%s"), row_id]
+
+
+def match_window_query(table_names, team_name, opponent=None, home_or_away=None, kpi_ranges=None, after=None, limit=50):
+    """
+    (sql, params) of fetch_match_window over the given season tables: rows are
+    (season position, sort keys..., *MATCH_COLUMNS).
+    """
+    window_order = match_window_order()
+    expressions = [expression for expression, _ in window_order]
+    conditions = ["team_name = %s"]
+    params = [team_name]
+    if opponent:
+        conditions.append("opponent_name = %s")
+        params.append(opponent)
+    if home_or_away:
+        conditions.append("homeoraway = %s")
+        params.append(home_or_away)
+    for kpi, (minimum, maximum) in (kpi_ranges or {}).items():
+        kpi = kpi_column(kpi)
+        if minimum is not None:
+            conditions.append(f"{kpi} >= %s")
+            params.append(minimum)
+        if maximum is not None:
+            conditions.append(f"{kpi} <= %s")
+            params.append(maximum)
+
+    order = ", ".join(f"{expression} DESC" for expression in expressions)
+    # A UNION can only be ordered by its output columns, so the keys are selected too
+    sort_columns = ", ".join(f"{expression} AS sort_{i}" for i, expression in enumerate(expressions))
+    union_order = ", ".join(f"sort_{i} DESC" for i in range(len(expressions)))
+    branches = []
+    query_params = []
+    for position, table_name in enumerate(table_names):
+        branch_conditions = list(conditions)
+        branch_params = list(params)
+        if position == 0 and after is not None:
+            placeholders = ", ".join(placeholder for _, placeholder in window_order)
+            branch_conditions.append(f"({', '.join(expressions)}) < ({placeholders})")
+            branch_params.extend(after)
+        # Each branch stops after limit rows, so a page never reads more than limit rows per season
+        branches.append(f"""
+            SELECT * FROM (
+                SELECT {position} AS season_position, {sort_columns}, {', '.join(MATCH_COLUMNS)}
+                FROM {table_name}
+                WHERE {' AND '.join(branch_conditions)}
+                ORDER BY {order}
+                LIMIT %s
+            ) AS season_{position}
+        """)
+        query_params.extend(branch_params + [limit])
+    query = " UNION ALL ".join(branches) + f" ORDER BY season_position, {union_order} LIMIT %s"
+    query_params.append(limit)
+    return query, query_params
+
+
+def fetch_match_window(season_ids, team_name, opponent=None, home_or_away=None, kpi_ranges=None, after=None, limit=50):
+    """
+    The next matches of a team over consecutive seasons, in one UNION ALL query.
+    season_ids are in page order (newest first); within a season matches run from the latest
+    game week back. after is the sort key of the last row already returned from the first
+    season. kpi_ranges is {kpi: (minimum or None, maximum or None)}.
+    Returns at most limit (season_id, sort key, (*MATCH_COLUMNS)) rows.
+    """
+    query, query_params = match_window_query(
+        [season_table(season_id) for season_id in season_ids],
+        team_name, opponent, home_or_away, kpi_ranges, after, limit,
+    )
+
+    with get_cursor() as cursor:
+        execute(cursor, query, query_params)
+        skip = 1 + len(match_window_order())
+        # psycopg returns a ctid as its text, which is what a cursor stores
+        return [(season_ids[row[0]], list(row[1:skip]), tuple(row[skip:])) for row in cursor.fetchall()]
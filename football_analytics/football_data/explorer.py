@@ -0,0 +1,118 @@
+"""
+Cross-season match explorer.
+
+Lists every match of a team (optionally against one opponent) over all the
+seasons and leagues it played in, newest season and latest game week first,
+with keyset pagination: the cursor of a page is the season_id and sort key (game
+week, opponent, row id) of its last row, and the next page continues strictly after it.
+A page queries only the season tables it needs, up to EXPLORER_SEASON_WINDOW at a
+time, each with its own LIMIT, so page 50 costs the same as page 1. The seasons of
+a listing are looked up once and cached for EXPLORER_SEASONS_CACHE_TTL seconds.
+"""
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import db
+from .catalog import get_catalog
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+DEFAULT_SEASON_WINDOW = 8
+DEFAULT_SEASONS_CACHE_TTL = 300  # seconds
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(season_id, key):
+    raw = json.dumps([season_id, *key]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        season_id, game_week, opponent_name, row_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor {token!r}") from e
+    return season_id, (game_week, opponent_name, row_id)
+
+
+def team_seasons(team_name, opponent=None):
+    """
+    season_ids the team (and the opponent, if given) played in, newest season first.
+    Falls back to every season in the catalog when the team aggregates are not built.
+    Cached per catalog, so the following pages of a listing don't check the season tables again.
+    """
+    catalog = get_catalog()
+    raw = json.dumps([catalog.fingerprint, team_name, opponent])
+    key = "explorer-seasons:" + hashlib.md5(raw.encode()).hexdigest()
+    season_ids = cache.get(key)
+    if season_ids is None:
+        season_ids = _team_seasons(catalog, team_name, opponent)
+        cache.set(key, season_ids, getattr(settings, 'EXPLORER_SEASONS_CACHE_TTL', DEFAULT_SEASONS_CACHE_TTL))
+    return season_ids
+
+
+def _team_seasons(catalog, team_name, opponent):
+    season_ids = db.fetch_team_season_ids(team_name)
+    if season_ids is None:
+        season_ids = catalog.season_ids()
+    elif opponent:
+        opponent_season_ids = db.fetch_team_season_ids(opponent)
+        if opponent_season_ids is not None:
+            season_ids = set(season_ids) & set(opponent_season_ids)
+    season_ids = db.existing_season_ids([str(season_id) for season_id in season_ids])
+    return sorted(
+        season_ids,
+        key=lambda season_id: (str(catalog.season_year(int(season_id)) or ''), int(season_id)),
+        reverse=True,
+    )
+
+
+def explore_matches(team_name, opponent=None, home_or_away=None, kpi_ranges=None, cursor=None,
+                    page_size=DEFAULT_PAGE_SIZE):
+    """
+    Returns (rows, next_cursor). Rows are (season_id, *db.MATCH_COLUMNS) tuples;
+    next_cursor is None on the last page.
+    Raises InvalidCursor for a malformed cursor or one from another team's listing.
+    """
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    window = getattr(settings, 'EXPLORER_SEASON_WINDOW', DEFAULT_SEASON_WINDOW)
+    season_ids = team_seasons(team_name, opponent)
+
+    position = 0
+    after = None
+    if cursor:
+        cursor_season_id, after = decode_cursor(cursor)
+        if str(cursor_season_id) not in season_ids:
+            raise InvalidCursor(f"Cursor season {cursor_season_id} is not part of this listing")
+        position = season_ids.index(str(cursor_season_id))
+
+    page = []
+    while len(page) < page_size and position < len(season_ids):
+        page.extend(db.fetch_match_window(
+            season_ids[position:position + window],
+            team_name,
+            opponent=opponent,
+            home_or_away=home_or_away,
+            kpi_ranges=kpi_ranges,
+            after=after,
+            limit=page_size - len(page),
+        ))
+        # A window that did not fill the page has no rows left
+        position += window
+        after = None
+
+    rows = [(season_id,) + values for season_id, _, values in page]
+    next_cursor = None
+    if len(page) == page_size:
+        season_id, key, _ = page[-1]
+        next_cursor = encode_cursor(season_id, key)
+    return rows, next_cursor
@@ -0,0 +1,76 @@
+"""
+CSV and NDJSON export of the match_data_{season_id}_final tables.
+
+Rows come from db.iter_matches() and are encoded one at a time, so an export of
+any size is produced with flat memory and its first bytes are available as soon
+as the first batch arrives. Used by the export_matches view and management command.
+"""
+import csv
+import datetime
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+from . import db
+
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+BASE_COLUMNS = ['team_name', 'opponent_name', 'homeoraway', 'season', 'game_week']
+DEFAULT_ITERSIZE = 2000
+
+
+def export_columns(kpis=None):
+    """The match_details columns, optionally restricted to a subset of KPIs."""
+    if not kpis:
+        return list(db.MATCH_COLUMNS)
+    return BASE_COLUMNS + [db.kpi_column(kpi) for kpi in kpis] + ['stadium_name']
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_rows(columns, rows, fmt='csv'):
+    """Yields the export line by line: a header row for CSV, one object per line for NDJSON."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+
+
+def stream_export(season_ids, fmt='csv', team_names=None, kpis=None, home_or_away=None):
+    """
+    Returns an iterator over the encoded export of the given seasons.
+    Raises db.InvalidIdentifier for unknown seasons or KPIs and ValueError for an unknown format,
+    before anything is read.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}, expected one of {', '.join(FORMATS)}")
+    columns = export_columns(kpis)
+    rows = db.iter_matches(
+        season_ids,
+        columns=columns,
+        team_names=team_names,
+        home_or_away=home_or_away,
+        itersize=getattr(settings, 'EXPORT_ITERSIZE', DEFAULT_ITERSIZE),
+    )
+    return encode_rows(columns, rows, fmt)
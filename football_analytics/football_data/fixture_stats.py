@@ -0,0 +1,129 @@
+"""
+Team names and season averages for the teams playing upcoming fixtures.
+
+upcoming_games needs, for every competition in the fixture list, the names and
+a few KPI averages of the teams playing in it. Each competition is looked up with
+one combined query restricted to that competition's team ids, and competitions
+are queried concurrently on a bounded thread pool, each worker on a pooled connection.
+aload_competition_team_stats() does the same on the event loop, through async_db.
+load_by_competition() runs any other per-competition lookup (e.g. the per-match
+values of combinations.py) on the same pool.
+
+resolve_team_seasons() maps the fixture teams to seasons through the team
+dimension (teams.py) first, so a team whose competition table doesn't exist yet
+is looked up in its latest season instead of being dropped.
+"""
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import async_db, timing
+from .db import close_thread_connection, fetch_competition_team_stats
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def teams_by_competition(games_data):
+    """Groups the home and away team ids of the fixtures by competition_id."""
+    competition_teams = {}
+    for game in games_data:
+        teams = competition_teams.setdefault(game["competition_id"], set())
+        teams.add(game["homeID"])
+        teams.add(game["awayID"])
+    return competition_teams
+
+
+def resolve_team_seasons(games_data, team_index):
+    """
+    The season every fixture team's stats are read from, with one TeamIndex lookup per team
+    (see teams.TeamIndex.resolve): returns ({(competition_id, teamid): season_id}, {season_id: team ids}).
+    With an empty index every team stays in its fixture's competition.
+    """
+    team_seasons = {}
+    season_teams = {}
+    for game in games_data:
+        competition_id = game["competition_id"]
+        for team_id in (game["homeID"], game["awayID"]):
+            key = (competition_id, team_id)
+            if key not in team_seasons:
+                season_id = team_seasons[key] = team_index.resolve(competition_id, team_id)
+                season_teams.setdefault(season_id, set()).add(team_id)
+    return team_seasons, season_teams
+
+
+def load_by_competition(competition_teams, fetch, max_workers=None):
+    """
+    Runs fetch(competition_id, team_ids) for every competition concurrently.
+    competition_teams is {competition_id: team ids}, as returned by teams_by_competition()
+    (or {season_id: team ids} from resolve_team_seasons()).
+    Returns (results, timings) where timings is {competition_id: milliseconds}.
+    Competitions whose table is missing or whose query fails are left out of results.
+    """
+    if not competition_teams:
+        return {}, {}
+    if max_workers is None:
+        max_workers = getattr(settings, 'UPCOMING_DB_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+
+    def run(competition_id):
+        started = time.perf_counter()
+        try:
+            result = fetch(competition_id, competition_teams[competition_id])
+        except Exception as e:
+            logger.warning("Skipping table for competition ID %s: %s", competition_id, e)
+            result = None
+        finally:
+            # Without the pool, worker threads get their own Django connection; don't leave it open
+            close_thread_connection()
+        return competition_id, result, (time.perf_counter() - started) * 1000
+
+    results = {}
+    timings = {}
+    workers = min(max_workers, len(competition_teams))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='competition-stats') as executor:
+        for competition_id, result, elapsed_ms in executor.map(timing.propagate(run), sorted(competition_teams)):
+            timings[competition_id] = round(elapsed_ms, 1)
+            if result is not None:
+                results[competition_id] = result
+    return results, timings
+
+
+def load_competition_team_stats(competition_teams, max_workers=None):
+    """
+    Looks up the names and averages of every competition's teams concurrently.
+    Returns (stats_by_competition, timings), see load_by_competition().
+    """
+    return load_by_competition(competition_teams, fetch_competition_team_stats, max_workers)
+
+
+async def aload_competition_team_stats(competition_teams, max_concurrency=None):
+    """Async load_competition_team_stats(): at most max_concurrency competitions are queried at once."""
+    if not competition_teams:
+        return {}, {}
+    if max_concurrency is None:
+        max_concurrency = getattr(settings, 'UPCOMING_DB_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(competition_id):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                stats = await async_db.fetch_competition_team_stats(competition_id, competition_teams[competition_id])
+            except Exception as e:
+                logger.warning("Skipping table for competition ID %s: %s", competition_id, e)
+                stats = None
+            return competition_id, stats, (time.perf_counter() - started) * 1000
+
+    stats_by_competition = {}
+    timings = {}
+    for competition_id, stats, elapsed_ms in await asyncio.gather(*(run(c) for c in sorted(competition_teams))):
+        timings[competition_id] = round(elapsed_ms, 1)
+        if stats is not None:
+            stats_by_competition[competition_id] = stats
+    return stats_by_competition, timings
@@ -0,0 +1,308 @@
+"""
+Client for the football-data-api `todays-matches` endpoint.
+
+upcoming_games needs one request per day of the selected range. FixturesClient
+fetches the days concurrently with a bounded worker pool over a single pooled
+keep-alive session, retries transient failures with backoff and always returns
+the games in date order, whatever order the responses arrive in.
+AsyncFixturesClient does the same on the event loop with httpx, for the async
+upcoming_games view; the days are fetched concurrently under a semaphore.
+
+Responses are cached per date in the `fixtures` cache: past dates never change
+and are kept forever, today and future dates expire after FIXTURES_CACHE_TTL.
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as date_type
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import timing
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BASE_URL = "https://api.football-data-api.com/todays-matches"
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_ASYNC_MAX_CONNECTIONS = 100  # shared by every request on an event loop
+DEFAULT_TIMEOUT = 10        # seconds, per request
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+DEFAULT_CACHE_ALIAS = 'fixtures'
+DEFAULT_CACHE_TTL = 900     # seconds, for today and future dates
+CACHE_KEY_PREFIX = 'fixtures:date:'
+
+
+def _get_cache(alias):
+    if alias is None:
+        return None
+    try:
+        return caches[alias]
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+# Hit/miss counters for this process. Kept in memory rather than in the cache backend
+# because the file cache has no atomic increment and the fetch runs on several threads.
+_cache_stats = {'hits': 0, 'misses': 0}
+_cache_stats_lock = threading.Lock()
+
+
+def _count(counter):
+    with _cache_stats_lock:
+        _cache_stats[counter] += 1
+
+
+def fixture_cache_stats():
+    """Returns the hit/miss counters of the fixture cache for this process."""
+    with _cache_stats_lock:
+        hits = _cache_stats['hits']
+        misses = _cache_stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def reset_fixture_cache_stats():
+    with _cache_stats_lock:
+        _cache_stats['hits'] = 0
+        _cache_stats['misses'] = 0
+
+
+class BaseFixturesClient:
+    """Settings, caching rules and response parsing shared by the sync and async clients."""
+
+    def __init__(self, base_url=None, api_key=None, max_workers=None, timeout=None,
+                 retries=None, backoff_factor=None, cache_alias=DEFAULT_CACHE_ALIAS, cache_ttl=None):
+        self.base_url = base_url or getattr(settings, 'FOOTBALL_DATA_API_URL', DEFAULT_BASE_URL)
+        self.api_key = api_key if api_key is not None else getattr(settings, 'FOOTBALL_DATA_API_KEY', '')
+        self.max_workers = max_workers or getattr(settings, 'FIXTURES_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+        self.timeout = timeout or getattr(settings, 'FIXTURES_TIMEOUT', DEFAULT_TIMEOUT)
+        if retries is None:
+            retries = getattr(settings, 'FIXTURES_RETRIES', DEFAULT_RETRIES)
+        if backoff_factor is None:
+            backoff_factor = getattr(settings, 'FIXTURES_BACKOFF_FACTOR', DEFAULT_BACKOFF_FACTOR)
+        # cache_alias=None disables caching (used by benchmarks to measure the raw fetch)
+        if cache_alias == DEFAULT_CACHE_ALIAS:
+            cache_alias = getattr(settings, 'FIXTURES_CACHE_ALIAS', DEFAULT_CACHE_ALIAS)
+        self.cache_alias = cache_alias
+        self.cache_ttl = cache_ttl or getattr(settings, 'FIXTURES_CACHE_TTL', DEFAULT_CACHE_TTL)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+    def _cache_timeout(self, date_str):
+        """Past dates are final and cached forever (None); today and later expire after cache_ttl."""
+        if date_str < date_type.today().isoformat():
+            return None
+        return self.cache_ttl
+
+    def _params(self, date_str):
+        return {
+            "key": self.api_key,
+            "date": date_str,
+        }
+
+    def _parse_response(self, date_str, status_code, data):
+        """Returns the games of a response, or None when the API answered with an error."""
+        if status_code != 200:
+            logger.warning("API error for %s: %s", date_str, status_code)
+            return None
+        if not data.get("success"):
+            return None
+        games = data["data"]
+        for game in games:
+            game["date"] = date_str  # Add the date to the game
+        return games
+
+
+class FixturesClient(BaseFixturesClient):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,  # hand the last response back so the status can be reported
+        )
+        # One connection per worker so concurrent requests never wait for a free socket
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def fetch_date(self, date):
+        """
+        Fetches the fixtures for one date (a date/datetime or 'YYYY-MM-DD' string),
+        from the cache when possible.
+        Returns the list of games with a 'date' key added, or [] when the API reports an error.
+        Network errors that survive the retries are raised.
+        """
+        date_str = date if isinstance(date, str) else date.strftime('%Y-%m-%d')
+        cache = _get_cache(self.cache_alias)
+        if cache is None:
+            games = self._fetch_from_api(date_str)
+            return [] if games is None else games
+
+        key = CACHE_KEY_PREFIX + date_str
+        games = cache.get(key)
+        if games is not None:
+            _count('hits')
+            return games
+
+        _count('misses')
+        games = self._fetch_from_api(date_str)
+        if games is None:
+            return []  # errors are not cached, the next request retries upstream
+        cache.set(key, games, timeout=self._cache_timeout(date_str))
+        return games
+
+    def _fetch_from_api(self, date_str):
+        """Returns the games for date_str, or None when the API answered with an error."""
+        with timing.span('api'):
+            response = self.session.get(self.base_url, params=self._params(date_str), timeout=self.timeout)
+            data = response.json() if response.status_code == 200 else None
+        return self._parse_response(date_str, response.status_code, data)
+
+    def fetch_range(self, dates):
+        """
+        Fetches the fixtures for every date concurrently.
+        Returns one flat list of games ordered by date (and by API order within a date).
+        """
+        dates = list(dates)
+        if not dates:
+            return []
+        workers = min(self.max_workers, len(dates))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fixtures') as executor:
+            # map() yields results in input order, so the output is deterministic
+            results = list(executor.map(timing.propagate(self.fetch_date), dates))
+        return [game for games in results for game in games]
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_fixtures_client():
+    """Returns the process-wide client so its keep-alive connections are reused across requests."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = FixturesClient()
+    return _client
+
+
+def reset_fixtures_client():
+    """Closes the process-wide client, so the next get_fixtures_client() picks up changed settings."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+
+
+class AsyncFixturesClient(BaseFixturesClient):
+    """
+    Async counterpart of FixturesClient, on an httpx.AsyncClient.
+    An instance belongs to the event loop it is first used on; use get_async_fixtures_client().
+    """
+
+    def __init__(self, max_connections=None, **kwargs):
+        import httpx
+
+        super().__init__(**kwargs)
+        # max_workers bounds the dates of one request in flight; max_connections bounds the whole loop
+        max_connections = max_connections or getattr(settings, 'FIXTURES_ASYNC_MAX_CONNECTIONS', DEFAULT_ASYNC_MAX_CONNECTIONS)
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+
+    async def fetch_date(self, date):
+        """Same contract as FixturesClient.fetch_date."""
+        date_str = date if isinstance(date, str) else date.strftime('%Y-%m-%d')
+        cache = _get_cache(self.cache_alias)
+        if cache is None:
+            games = await self._fetch_from_api(date_str)
+            return [] if games is None else games
+
+        key = CACHE_KEY_PREFIX + date_str
+        games = await cache.aget(key)
+        if games is not None:
+            _count('hits')
+            return games
+
+        _count('misses')
+        games = await self._fetch_from_api(date_str)
+        if games is None:
+            return []
+        await cache.aset(key, games, timeout=self._cache_timeout(date_str))
+        return games
+
+    async def _fetch_from_api(self, date_str):
+        """Retries transport errors and RETRY_STATUS_CODES with exponential backoff, like the sync client."""
+        with timing.span('api'):
+            return await self._fetch_with_retries(date_str)
+
+    async def _fetch_with_retries(self, date_str):
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = await self.client.get(self.base_url, params=self._params(date_str))
+            except self._httpx.TransportError:
+                if last_attempt:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    data = response.json() if response.status_code == 200 else None
+                    return self._parse_response(date_str, response.status_code, data)
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def fetch_range(self, dates):
+        """Fetches every date concurrently, at most max_workers at a time; games are returned in date order."""
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def fetch(date):
+            async with semaphore:
+                return await self.fetch_date(date)
+
+        # gather() returns results in input order, so the output is deterministic
+        results = await asyncio.gather(*(fetch(date) for date in dates))
+        return [game for games in results for game in games]
+
+    async def close(self):
+        await self.client.aclose()
+
+
+# httpx connections are bound to the event loop that opened them: one client per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_fixtures_client():
+    """Returns the client of the running event loop, so keep-alive connections are reused across requests."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncFixturesClient()
+    return client
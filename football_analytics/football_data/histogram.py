@@ -0,0 +1,120 @@
+"""
+Histogram binning shared by the team and league visualisation endpoints.
+
+Edges are computed once from a reference dataset (the primary team/league) or,
+with shared=True, from every dataset, and each dataset is then counted with a
+binary search over the edges, so counting costs O(values * log(bins)).
+
+Bins are half-open [lower, upper) except the last one, which includes its upper
+edge. Values outside the edges are not counted. Integer bins are only used when
+every value is a whole number, since a bin labelled "2 - 3" would otherwise also
+count 3.5; fractional data falls back to the regular bins.
+"""
+import math
+from bisect import bisect_right
+
+from . import timing
+
+
+DEFAULT_BINS = 5
+MAX_BINS = 50
+
+
+def parse_bins(value, default=DEFAULT_BINS):
+    """Parses a bin count from a request parameter, clamped to 1..MAX_BINS."""
+    try:
+        bins = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(bins, MAX_BINS))
+
+
+def parse_flag(value, default):
+    """Parses an on/off request parameter; missing or 'auto' returns default."""
+    if value is None or value == '' or value.lower() == 'auto':
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def histogram_edges(values, bins=DEFAULT_BINS, integer=False):
+    """
+    Returns (edges, labels) for the given values.
+    With integer=True the edges fall on whole numbers, so count KPIs such as
+    corners or cards get bins like "3" or "4 - 5" instead of fractional ranges.
+    integer=True is ignored when any value is fractional.
+    """
+    if not values:
+        return [], []
+    min_val = min(values)
+    max_val = max(values)
+    if integer and all_integral(values):
+        return _integer_edges(min_val, max_val, bins)
+
+    if min_val == max_val:
+        return [min_val, max_val], [f"{min_val:.2f}"]
+
+    bin_width = (max_val - min_val) / bins
+    if bin_width == 0: bin_width = 1 # Fallback for extremely small range
+    edges = [min_val + i * bin_width for i in range(bins + 1)]
+    if edges[bins] < max_val: edges[bins] = max_val
+    labels = []
+    for i in range(bins):
+        label_edge_upper = f"<{edges[i+1]:.2f}"
+        if i == bins - 1: label_edge_upper = f"{edges[i+1]:.2f}" # Inclusive for last bin label text
+        labels.append(f"{edges[i]:.2f} - {label_edge_upper}")
+    return edges, labels
+
+
+def all_integral(values):
+    """True when every value is a whole number (1 and 1.0 are, 1.5 is not)."""
+    return all(float(val).is_integer() for val in values)
+
+
+def _integer_edges(min_val, max_val, bins):
+    low = math.floor(min_val)
+    high = math.ceil(max_val)
+    distinct = high - low + 1
+    width = max(1, math.ceil(distinct / bins))
+    num_bins = math.ceil(distinct / width)
+    edges = [low + i * width for i in range(num_bins + 1)]
+    labels = []
+    for i in range(num_bins):
+        first, last = edges[i], edges[i + 1] - 1
+        labels.append(str(first) if first == last else f"{first} - {last}")
+    # The last bin is inclusive, so its upper edge is the last value it holds
+    edges[-1] = edges[-2] + width - 1
+    return edges, labels
+
+
+def histogram_counts(values, edges):
+    """Counts values into the bins defined by edges (see module docstring for the boundaries)."""
+    num_bins = len(edges) - 1
+    if num_bins < 1:
+        return []
+    counts = [0] * num_bins
+    lowest, highest = edges[0], edges[-1]
+    for val in values:
+        if val < lowest or val > highest:
+            continue
+        i_bin = bisect_right(edges, val) - 1
+        if i_bin >= num_bins: i_bin = num_bins - 1 # Upper edge of the last bin is inclusive
+        counts[i_bin] += 1
+    return counts
+
+
+@timing.timed('compute')
+def build_histograms(datasets, bins=DEFAULT_BINS, integer=False, shared=False):
+    """
+    Bins several datasets on common edges.
+    datasets is a list of numeric value lists; the first one is the reference whose
+    range defines the edges, unless shared=True, in which case the edges span every dataset.
+    Integer bins need every dataset to be integral, as each one is counted on the same edges.
+    Returns (labels, [counts for each dataset]).
+    """
+    integer = integer and all(all_integral(values) for values in datasets)
+    if shared:
+        reference = [val for values in datasets for val in values]
+    else:
+        reference = datasets[0] if datasets else []
+    edges, labels = histogram_edges(reference, bins=bins, integer=integer)
+    return labels, [histogram_counts(values, edges) for values in datasets]
@@ -0,0 +1,163 @@
+"""
+Indexes of the match_data_{season_id}_final tables and an audit of their query plans.
+
+The views look season rows up by team_name (ordered by game_week), by teamid
+(upcoming fixtures) and by homeoraway and team_name (home/away filters), so every
+season table should carry the SEASON_INDEXES. ensure_season_indexes() creates the
+missing ones, CONCURRENTLY so reads are not blocked, and rebuilds indexes left
+invalid by an interrupted concurrent build. An index counts as present when any
+valid index of the table starts with the same columns, whatever its name.
+
+audit_season() runs EXPLAIN on the selective query templates of the views and
+reports the sequential scans of season tables with at least min_rows rows.
+Full-season aggregates (league tables, per-game-week averages) read every row by
+design and are not audited. Run it with `python manage.py audit_season_indexes`.
+"""
+import json
+
+from django.db import connection
+
+from . import db
+
+
+# (name suffix, columns)
+SEASON_INDEXES = [
+    ('team_gw', ('team_name', 'game_week')),
+    ('teamid', ('teamid',)),
+    ('ha_team', ('homeoraway', 'team_name')),
+]
+DEFAULT_MIN_ROWS = 5000
+
+
+def index_name(table_name, suffix):
+    return f"{table_name}_{suffix}_idx"
+
+
+def table_indexes(cursor, table_name):
+    """{index name: (is valid, column names in index order)} of a table."""
+    cursor.execute("""
+        SELECT c.relname, i.indisvalid, array_agg(a.attname::text ORDER BY k.ord)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        CROSS JOIN LATERAL unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+        WHERE i.indrelid = to_regclass(%s)
+        GROUP BY c.relname, i.indisvalid
+    """, [table_name])
+    return {name: (valid, tuple(columns)) for name, valid, columns in cursor.fetchall()}
+
+
+def missing_indexes(cursor, table_name):
+    """
+    [(name, columns, invalid)] of the SEASON_INDEXES the table lacks; invalid is True when an
+    index of that name exists but is unusable (a failed CREATE INDEX CONCURRENTLY).
+    """
+    existing = table_indexes(cursor, table_name)
+    valid_columns = [columns for valid, columns in existing.values() if valid]
+    missing = []
+    for suffix, columns in SEASON_INDEXES:
+        if any(have[:len(columns)] == columns for have in valid_columns):
+            continue
+        name = index_name(table_name, suffix)
+        missing.append((name, columns, name in existing))
+    return missing
+
+
+def create_season_indexes(cursor, table_name, concurrently=True):
+    """
+    Creates the missing SEASON_INDEXES of a table and returns their names.
+    concurrently=True needs autocommit (CREATE INDEX CONCURRENTLY can't run in a transaction).
+    """
+    mode = "CONCURRENTLY " if concurrently else ""
+    created = []
+    for name, columns, invalid in missing_indexes(cursor, table_name):
+        if invalid:
+            cursor.execute(f"DROP INDEX {mode}IF EXISTS {name}")
+        cursor.execute(f"CREATE INDEX {mode}IF NOT EXISTS {name} ON {table_name} ({', '.join(columns)})")
+        created.append(name)
+    if created:
+        cursor.execute(f"ANALYZE {table_name}")  # fresh statistics so the planner picks the new indexes up
+    return created
+
+
+def ensure_season_indexes(table_name, dry_run=False):
+    """Creates the missing indexes of a season table concurrently. Returns the names created (or to create)."""
+    with connection.cursor() as cursor:
+        if dry_run:
+            return [name for name, _, _ in missing_indexes(cursor, table_name)]
+        return create_season_indexes(cursor, table_name, concurrently=True)
+
+
+# --- Plan audit ---
+
+def audit_queries(table_name, sample):
+    """
+    (label, sql, params) of the selective queries the views run on a season table, built
+    by the same db.py functions, with the team, team id and homeoraway of one of its rows
+    as parameters.
+    """
+    explorer_sql, explorer_params = db.match_window_query([table_name], sample['team_name'], home_or_away=sample['homeoraway'])
+    return [
+        ('kpi series (visualisation)', db.kpi_series_query(table_name, 'goals_scored'), [[sample['team_name']]]),
+        ('team matches (match details)', db.team_matches_query(table_name), [sample['team_name']]),
+        ('home/away matches (explorer)', explorer_sql, explorer_params),
+        ('competition team stats (upcoming games)',
+         db.competition_team_stats_query(table_name),
+         [db.DEFAULT_FORM_WINDOW, [sample['teamid']]]),
+    ]
+
+
+def _sample_row(cursor, table_name):
+    cursor.execute(f"""
+        SELECT team_name, teamid, homeoraway FROM {table_name}
+        WHERE team_name IS NOT NULL AND teamid IS NOT NULL AND homeoraway IS NOT NULL
+        LIMIT 1
+    """)
+    row = cursor.fetchone()
+    return None if row is None else dict(zip(['team_name', 'teamid', 'homeoraway'], row))
+
+
+def _table_rows(cursor, table_name):
+    """Estimated row count from the statistics, counted when the table was never analyzed."""
+    cursor.execute("SELECT reltuples::BIGINT FROM pg_class WHERE oid = to_regclass(%s)", [table_name])
+    estimate = cursor.fetchone()[0]
+    if estimate is not None and estimate >= 0:
+        return estimate
+    cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+    return cursor.fetchone()[0]
+
+
+def _seq_scans(plan):
+    """Relation names of the Seq Scan nodes of an EXPLAIN (FORMAT JSON) plan tree."""
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan.get('Relation Name')
+    for child in plan.get('Plans', []):
+        yield from _seq_scans(child)
+
+
+def explain(cursor, sql, params=None):
+    """The root plan node of sql."""
+    cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']
+
+
+def audit_season(table_name, min_rows=DEFAULT_MIN_ROWS):
+    """
+    Returns [(label, total cost, flagged)] for every audited query of the table, where flagged
+    is True when the plan scans the table sequentially and it has at least min_rows rows.
+    Returns [] for an empty table.
+    """
+    with connection.cursor() as cursor:
+        sample = _sample_row(cursor, table_name)
+        if sample is None:
+            return []
+        large = _table_rows(cursor, table_name) >= min_rows
+        results = []
+        for label, sql, params in audit_queries(table_name, sample):
+            plan = explain(cursor, sql, params)
+            flagged = large and table_name in set(_seq_scans(plan))
+            results.append((label, plan.get('Total Cost'), flagged))
+        return results
@@ -0,0 +1,250 @@
+"""
+Incremental loading of finished matches into the match_data_{season_id}_final tables.
+
+Matches come from the football-data-api `league-matches` endpoint (or from a
+JSON file with the same match objects) and every finished match becomes two
+rows, one per team, in the table's column layout (db.TABLE_COLUMNS).
+
+Only game weeks from the latest one already in the table onwards are written:
+that game week is reloaded too, so matches played after the previous run are
+picked up; a season whose reloaded rows are unchanged is not written. The rows
+of those game weeks are replaced with COPY (batched INSERTs on other databases)
+in one transaction, which also recomputes the season's team aggregates, game-week
+rollup and team dimension rows and bumps its data version (see aggregates.py,
+teams.py and versions.py). Tables of new seasons are created with the indexes of
+indexes.py and the change trigger of aggregates.py. Run it with `python manage.py ingest_matches`.
+"""
+import csv
+import io
+import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+from . import aggregates, db, indexes, teams
+from .kpis import AVERAGE_ONLY_KPIS, KPI_COLUMNS
+
+
+DEFAULT_LEAGUE_MATCHES_URL = "https://api.football-data-api.com/league-matches"
+DEFAULT_PAGE_SIZE = 1000    # matches per API page (the API maximum)
+DEFAULT_MAX_WORKERS = 4     # seasons fetched from the API at the same time
+INSERT_BATCH_SIZE = 500
+COMPLETE_STATUS = 'complete'
+
+COLUMNS = db.TABLE_COLUMNS
+
+# KPI column -> (home team field, away team field) of an API match; the "against"
+# columns take the opponent's field
+KPI_FIELDS = {
+    'goals': ('homeGoalCount', 'awayGoalCount'),
+    'corners': ('team_a_corners', 'team_b_corners'),
+    'offsides': ('team_a_offsides', 'team_b_offsides'),
+    'yellow_cards': ('team_a_yellow_cards', 'team_b_yellow_cards'),
+    'red_cards': ('team_a_red_cards', 'team_b_red_cards'),
+    'shotsontarget': ('team_a_shotsOnTarget', 'team_b_shotsOnTarget'),
+    'shotsofftarget': ('team_a_shotsOffTarget', 'team_b_shotsOffTarget'),
+    'shots': ('team_a_shots', 'team_b_shots'),
+    'fouls': ('team_a_fouls', 'team_b_fouls'),
+    'possession': ('team_a_possession', 'team_b_possession'),
+}
+# goals are stored as goals_scored/goals_conceded, everything else as <kpi>_for/<kpi>_against
+KPI_COLUMN_NAMES = {
+    kpi: ('goals_scored', 'goals_conceded') if kpi == 'goals' else (f"{kpi}_for", f"{kpi}_against")
+    for kpi in KPI_FIELDS
+}
+
+
+class IngestError(Exception):
+    """The source could not be read."""
+
+
+def _stat(match, field):
+    """A match statistic, or None when the API has none (it reports missing values as -1)."""
+    value = match.get(field)
+    if value is None or value == '' or value == -1:
+        return None
+    return value
+
+
+def _points(goals_for, goals_against):
+    if goals_for is None or goals_against is None:
+        return None
+    if goals_for > goals_against:
+        return 3
+    return 1 if goals_for == goals_against else 0
+
+
+def match_rows(match):
+    """The home and the away row of a finished match, as tuples in COLUMNS order."""
+    rows = []
+    for side, (team_field, opponent_field, id_field) in enumerate((
+        ('home_name', 'away_name', 'homeID'),
+        ('away_name', 'home_name', 'awayID'),
+    )):
+        values = {
+            'team_name': match[team_field],
+            'opponent_name': match[opponent_field],
+            'homeoraway': 'Homegame' if side == 0 else 'Awaygame',
+            'season': match.get('season'),
+            'game_week': match.get('game_week'),
+            'stadium_name': match.get('stadium_name') or None,
+            'teamid': match[id_field],
+        }
+        for kpi, fields in KPI_FIELDS.items():
+            for_column, against_column = KPI_COLUMN_NAMES[kpi]
+            values[for_column] = _stat(match, fields[side])
+            values[against_column] = _stat(match, fields[1 - side])
+        values['points'] = _points(values['goals_scored'], values['goals_conceded'])
+        rows.append(tuple(values[column] for column in COLUMNS))
+    return rows
+
+
+# --- Sources ---
+
+def fetch_league_matches(season_id, session=None):
+    """Every match of a season from the API, following the pages."""
+    url = getattr(settings, 'FOOTBALL_DATA_LEAGUE_MATCHES_URL', DEFAULT_LEAGUE_MATCHES_URL)
+    session = session or requests.Session()
+    matches = []
+    page = 1
+    while True:
+        params = {
+            "key": getattr(settings, 'FOOTBALL_DATA_API_KEY', ''),
+            "season_id": season_id,
+            "max_per_page": DEFAULT_PAGE_SIZE,
+            "page": page,
+        }
+        response = session.get(url, params=params, timeout=getattr(settings, 'FIXTURES_TIMEOUT', 10))
+        if response.status_code != 200:
+            raise IngestError(f"API error for season {season_id}: {response.status_code}")
+        data = response.json()
+        if not data.get("success"):
+            raise IngestError(f"API error for season {season_id}: {data.get('message', 'unsuccessful response')}")
+        matches.extend(data["data"])
+        pager = data.get("pager") or {}
+        if page >= pager.get("max_page", 1):
+            return matches
+        page += 1
+
+
+def fetch_seasons(season_ids, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Fetches several seasons concurrently over one keep-alive session.
+    Returns {season_id: matches}; seasons whose fetch failed map to the exception.
+    """
+    session = requests.Session()
+
+    def run(season_id):
+        try:
+            return fetch_league_matches(season_id, session)
+        except (IngestError, requests.RequestException) as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(season_ids)))) as executor:
+        return dict(zip(season_ids, executor.map(run, season_ids)))
+
+
+def load_matches_file(path):
+    """
+    Matches from a JSON file: a `league-matches` response ({"data": [...]}) or a list of matches.
+    Returns {season_id: matches}, grouped by each match's competition_id.
+    """
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise IngestError(f"Cannot read {path}: {e}") from e
+    matches = data.get("data", []) if isinstance(data, dict) else data
+    by_season = {}
+    for match in matches:
+        by_season.setdefault(match["competition_id"], []).append(match)
+    return by_season
+
+
+# --- Writing ---
+
+def create_season_table(cursor, table_name):
+    """Creates a match_data table with the db.TABLE_COLUMNS layout, if it does not exist."""
+    kpi_columns_ddl = ", ".join(
+        f"{kpi} {'DOUBLE PRECISION' if kpi in AVERAGE_ONLY_KPIS else 'INTEGER'}" for kpi in KPI_COLUMNS
+    )
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            team_name TEXT,
+            opponent_name TEXT,
+            homeoraway TEXT,
+            season TEXT,
+            game_week INTEGER,
+            {kpi_columns_ddl},
+            stadium_name TEXT,
+            teamid INTEGER,
+            points INTEGER
+        )
+    """)
+
+
+def copy_rows(cursor, table_name, rows):
+    """Bulk-loads rows with COPY on PostgreSQL (psycopg 3 or psycopg2), with batched INSERTs elsewhere."""
+    if connection.vendor == 'postgresql':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)  # None is written as an empty, unquoted field: NULL in CSV COPY
+        copy_sql = f"COPY {table_name} ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        if is_psycopg3:
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+        else:
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+        return
+    insert = f"INSERT INTO {table_name} ({', '.join(COLUMNS)}) VALUES ({', '.join(['%s'] * len(COLUMNS))})"
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        cursor.executemany(insert, rows[start:start + INSERT_BATCH_SIZE])
+
+
+def ingest_season(season_id, matches, from_game_week=None):
+    """
+    Writes the finished matches of one season from the latest stored game week onwards
+    (or from from_game_week), replacing the rows of those game weeks.
+    Returns (status, rows written): status is 'ingested' or 'unchanged' (nothing to load).
+    Raises db.InvalidIdentifier for a season that is not in the catalog.
+    """
+    table_name = db.season_table(season_id)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if aggregates.season_table_exists(cursor, table_name):
+            if from_game_week is None:
+                cursor.execute(f"SELECT MAX(game_week) FROM {table_name}")
+                from_game_week = cursor.fetchone()[0]
+        else:
+            create_season_table(cursor, table_name)
+            if connection.vendor == 'postgresql':
+                # Empty table, so there is nothing to gain from building them concurrently
+                indexes.create_season_indexes(cursor, table_name, concurrently=False)
+                aggregates.ensure_change_tracking(cursor, season_id, table_name)
+        from_game_week = from_game_week or 0
+
+        # Matches without a game week count as game week 0, here and in the rows replaced below,
+        # so a reload from game week 0 replaces them instead of adding them again
+        rows = [
+            row
+            for match in matches
+            if match.get("status") == COMPLETE_STATUS and (match.get("game_week") or 0) >= from_game_week
+            for row in match_rows(match)
+        ]
+        if not rows:
+            return 'unchanged', 0
+
+        replaced = "COALESCE(game_week, 0) >= %s"
+        cursor.execute(f"SELECT {', '.join(COLUMNS)} FROM {table_name} WHERE {replaced}", [from_game_week])
+        if Counter(map(tuple, cursor.fetchall())) == Counter(rows):
+            return 'unchanged', 0  # the reloaded game weeks came back identical
+        cursor.execute(f"DELETE FROM {table_name} WHERE {replaced}", [from_game_week])
+        copy_rows(cursor, table_name, rows)
+        # Same transaction: recomputes the derived tables and moves the data version
+        aggregates.refresh_season(season_id, force=True)
+        aggregates.refresh_season_gameweeks(season_id, force=True)
+        teams.refresh_team_season(season_id, force=True)
+    return 'ingested', len(rows)
@@ -0,0 +1,37 @@
+"""
+KPI columns of the match_data_{season_id}_final tables.
+"""
+
+# KPI list: (value, display_label)
+KPIS = [
+    ('goals_scored', 'Goals Scored'),
+    ('goals_conceded', 'Goals Conceded'),
+    ('corners_for', 'Corners For'),
+    ('corners_against', 'Corners Against'),
+    ('offsides_for', 'Offsides For'),
+    ('offsides_against', 'Offsides Against'),
+    ('yellow_cards_for', 'Yellow Cards For'),
+    ('yellow_cards_against', 'Yellow Cards Against'),
+    ('red_cards_for', 'Red Cards For'),
+    ('red_cards_against', 'Red Cards Against'),
+    ('shotsontarget_for', 'Shots On Target For'),
+    ('shotsontarget_against', 'Shots On Target Against'),
+    ('shotsofftarget_for', 'Shots Off Target For'),
+    ('shotsofftarget_against', 'Shots Off Target Against'),
+    ('shots_for', 'Shots For'),
+    ('shots_against', 'Shots Against'),
+    ('fouls_for', 'Fouls For'),
+    ('fouls_against', 'Fouls Against'),
+    ('possession_for', 'Possession For'),
+    ('possession_against', 'Possession Against'),
+]
+
+KPI_COLUMNS = [value for value, _ in KPIS]
+KPI_LABELS = dict(KPIS)
+
+# KPIs that are averaged even in "totals" views (summing possession percentages is meaningless)
+AVERAGE_ONLY_KPIS = {'possession_for', 'possession_against'}
+
+
+def season_table_name(season_id):
+    return f"match_data_{season_id}_final"
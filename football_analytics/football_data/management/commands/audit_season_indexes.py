@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from football_data.catalog import existing_season_ids, get_catalog
+from football_data.indexes import DEFAULT_MIN_ROWS, audit_season, ensure_season_indexes
+from football_data.kpis import season_table_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the missing indexes of every season table (concurrently) and flags the view queries "
+        "whose plan scans a large season table sequentially. Run it after ingesting data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season-id', type=int, action='append', dest='season_ids',
+                            help='Only this season (can be repeated). Defaults to every season in the catalog.')
+        parser.add_argument('--dry-run', action='store_true', help='List the missing indexes without creating them')
+        parser.add_argument('--skip-explain', action='store_true', help='Only manage the indexes')
+        parser.add_argument('--min-rows', type=int, default=DEFAULT_MIN_ROWS,
+                            help='Flag sequential scans of tables with at least this many rows')
+
+    def handle(self, *args, **options):
+        season_ids = options['season_ids'] or sorted(get_catalog().season_ids())
+        with connection.cursor() as cursor:
+            season_ids = existing_season_ids(cursor, season_ids)
+
+        created_count = 0
+        flagged_count = 0
+        for season_id in season_ids:
+            table_name = season_table_name(season_id)
+            try:
+                created = ensure_season_indexes(table_name, dry_run=options['dry_run'])
+                audit = [] if options['skip_explain'] else audit_season(table_name, options['min_rows'])
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"Season {season_id}: {e}"))
+                continue
+
+            created_count += len(created)
+            for name in created:
+                self.stdout.write(f"Season {season_id}: {'missing' if options['dry_run'] else 'created'} index {name}")
+            for label, cost, flagged in audit:
+                if flagged:
+                    flagged_count += 1
+                    self.stdout.write(self.style.WARNING(
+                        f"Season {season_id}: sequential scan of {table_name} in {label} (cost {cost})"
+                    ))
+                elif options['verbosity'] > 1:
+                    self.stdout.write(f"Season {season_id}: {label} uses an index (cost {cost})")
+
+        action = 'missing' if options['dry_run'] else 'created'
+        summary = f"{len(season_ids)} season tables, {created_count} indexes {action}, {flagged_count} sequential scans flagged"
+        self.stdout.write(self.style.WARNING(summary) if flagged_count else self.style.SUCCESS(summary))
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from football_data import async_db, db
+from football_data.fixtures import AsyncFixturesClient, FixturesClient
+from football_data.stubs import FixturesStubServer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the sync and async paths of upcoming_games and league_visualisation_data: "
+        "one worker thread serving --requests slow requests one after the other, against one event loop "
+        "serving them all at once. Fixtures come from a local stub of the fixtures API; the per-league queries "
+        "are simulated with pg_sleep on the configured PostgreSQL database (skipped on other databases)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=10, help='Concurrent requests to serve')
+        parser.add_argument('--days', type=int, default=7, help='Dates per upcoming_games request')
+        parser.add_argument('--latency', type=float, default=0.2, help='Simulated upstream API latency in seconds')
+        parser.add_argument('--leagues', type=int, default=5, help='Leagues per league_visualisation_data request')
+        parser.add_argument('--db-latency', type=float, default=0.05, help='Simulated query time in seconds')
+        parser.add_argument('--workers', type=int, default=8, help='Concurrent dates per request (both clients)')
+
+    def handle(self, *args, **options):
+        start = date(2024, 9, 1)
+        dates = [start + timedelta(days=i) for i in range(options['days'])]
+        self.stdout.write(
+            f"Requests: {options['requests']}, dates per request: {len(dates)}, API latency: {options['latency']}s"
+        )
+
+        with FixturesStubServer(latency=options['latency']) as stub:
+            client_options = dict(base_url=stub.url, api_key='', max_workers=options['workers'], cache_alias=None)
+
+            client = FixturesClient(**client_options)
+            t0 = time.perf_counter()
+            sync_results = [client.fetch_range(dates) for _ in range(options['requests'])]
+            sync_elapsed = time.perf_counter() - t0
+            sync_peak, stub.peak_in_flight = stub.peak_in_flight, 0
+            client.close()
+
+            async def serve_fixtures():
+                async_client = AsyncFixturesClient(**client_options)
+                try:
+                    return await asyncio.gather(*(async_client.fetch_range(dates) for _ in range(options['requests'])))
+                finally:
+                    await async_client.close()
+
+            t0 = time.perf_counter()
+            async_results = asyncio.run(serve_fixtures())
+            async_elapsed = time.perf_counter() - t0
+            async_peak = stub.peak_in_flight
+
+        if [[g["id"] for g in games] for games in sync_results] != [[g["id"] for g in games] for games in async_results]:
+            self.stderr.write(self.style.ERROR("Async client returned different games than the sync client"))
+        self.report("Fixtures", sync_elapsed, async_elapsed)
+        self.stdout.write(f"Fixtures peak concurrent API calls: sync {sync_peak}, async {async_peak}")
+
+        if not async_db.async_enabled():
+            self.stdout.write(
+                "Per-league queries: skipped, needs PostgreSQL with FOOTBALL_DB_POOL['ENABLED'] and psycopg 3"
+            )
+            return
+
+        sleep_sql = "SELECT pg_sleep(%s)"
+        latency = options['db_latency']
+        self.stdout.write(f"Leagues per request: {options['leagues']}, query time: {latency}s")
+
+        t0 = time.perf_counter()
+        for _ in range(options['requests']):
+            for _ in range(options['leagues']):
+                with db.get_cursor() as cursor:
+                    db.execute(cursor, sleep_sql, [latency])
+                    cursor.fetchall()
+        sync_elapsed = time.perf_counter() - t0
+
+        async def serve_queries():
+            # The async pool caps the concurrent queries at FOOTBALL_DB_POOL['MAX_CONNECTIONS']
+            queries = options['requests'] * options['leagues']
+            await asyncio.gather(*(async_db.fetchall(sleep_sql, [latency]) for _ in range(queries)))
+            await async_db.get_async_pool().close()
+
+        t0 = time.perf_counter()
+        asyncio.run(serve_queries())
+        async_elapsed = time.perf_counter() - t0
+        self.report("Per-league queries", sync_elapsed, async_elapsed)
+
+    def report(self, label, sync_elapsed, async_elapsed):
+        self.stdout.write(f"{label}: sync {sync_elapsed * 1000:.1f} ms, async {async_elapsed * 1000:.1f} ms")
+        if async_elapsed > 0:
+            self.stdout.write(self.style.SUCCESS(f"{label} speed-up: {sync_elapsed / async_elapsed:.1f}x"))
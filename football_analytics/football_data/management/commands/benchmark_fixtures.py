@@ -0,0 +1,46 @@
+import time
+from datetime import date, timedelta
+
+import requests
+from django.core.management.base import BaseCommand
+
+from football_data.fixtures import FixturesClient
+from football_data.stubs import FixturesStubServer
+
+
+class Command(BaseCommand):
+    help = "Compares serial vs concurrent fixture fetching against a local stub of the fixtures API."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=14, help='Number of dates in the range')
+        parser.add_argument('--latency', type=float, default=0.2, help='Simulated upstream latency in seconds')
+        parser.add_argument('--workers', type=int, default=8, help='Worker pool size for the concurrent client')
+        parser.add_argument('--games-per-day', type=int, default=10)
+
+    def handle(self, *args, **options):
+        start = date(2024, 9, 1)
+        dates = [start + timedelta(days=i) for i in range(options['days'])]
+
+        with FixturesStubServer(latency=options['latency'], games_per_day=options['games_per_day']) as stub:
+            # Old behaviour: one requests.get per date, new connection each time
+            t0 = time.perf_counter()
+            serial_games = []
+            for d in dates:
+                response = requests.get(stub.url, params={"key": "", "date": d.strftime('%Y-%m-%d')})
+                serial_games.extend(response.json()["data"])
+            serial_elapsed = time.perf_counter() - t0
+
+            client = FixturesClient(base_url=stub.url, api_key='', max_workers=options['workers'], cache_alias=None)
+            t0 = time.perf_counter()
+            pooled_games = client.fetch_range(dates)
+            pooled_elapsed = time.perf_counter() - t0
+            client.close()
+
+        if [g["id"] for g in serial_games] != [g["id"] for g in pooled_games]:
+            self.stderr.write(self.style.ERROR("Concurrent client returned games in a different order"))
+
+        self.stdout.write(f"Dates: {len(dates)}, games: {len(pooled_games)}, latency: {options['latency']}s")
+        self.stdout.write(f"Serial:     {serial_elapsed * 1000:.1f} ms")
+        self.stdout.write(f"Concurrent: {pooled_elapsed * 1000:.1f} ms ({options['workers']} workers)")
+        if pooled_elapsed > 0:
+            self.stdout.write(self.style.SUCCESS(f"Speed-up: {serial_elapsed / pooled_elapsed:.1f}x"))
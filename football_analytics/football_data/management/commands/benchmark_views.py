@@ -0,0 +1,88 @@
+import json
+import platform
+import time
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from football_data import benchmark, db
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic catalog and match_data tables in the configured database and times "
+        "league_data_view, visualisation_data, league_visualisation_data, match_details and upcoming_games "
+        "(against a local stub of the fixtures API): latency percentiles, queries per request and peak memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leagues', type=int, default=5)
+        parser.add_argument('--seasons', type=int, default=2, help='Seasons per league')
+        parser.add_argument('--teams', type=int, default=20, help='Teams per league')
+        parser.add_argument('--game-weeks', type=int, default=38, help='Game weeks per season (at most a double round robin)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of the generated statistics')
+        parser.add_argument('--requests', type=int, default=20, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per scenario')
+        parser.add_argument('--days', type=int, default=7, help='Dates per upcoming_games request')
+        parser.add_argument('--latency', type=float, default=0.0, help='Simulated fixtures API latency in seconds')
+        parser.add_argument('--games-per-day', type=int, default=10)
+        parser.add_argument('--scenario', action='append', dest='scenarios', choices=benchmark.SCENARIOS,
+                            help='Only this scenario (can be repeated)')
+        parser.add_argument('--output', '-o', help='JSON results file (default: stdout)')
+        parser.add_argument('--keep', action='store_true', help='Keep the synthetic tables and catalog rows')
+
+    def handle(self, *args, **options):
+        if options['teams'] < 2 or options['leagues'] < 1 or options['seasons'] < 1 or options['game_weeks'] < 1:
+            raise CommandError("--leagues, --seasons and --game-weeks must be positive and --teams at least 2")
+        if options['requests'] < 1:
+            raise CommandError("--requests must be positive")
+        layout = (options['leagues'], options['seasons'], benchmark.FIRST_SEASON_ID)
+
+        t0 = time.perf_counter()
+        dataset = benchmark.generate_dataset(
+            *layout[:2], teams=options['teams'], game_weeks=options['game_weeks'], seed=options['seed'],
+        )
+        self.stderr.write(
+            f"Generated {len(dataset['seasons'])} seasons, {dataset['rows']} rows "
+            f"in {time.perf_counter() - t0:.1f}s ({connection.vendor})"
+        )
+        try:
+            results = []
+            for name in options['scenarios'] or benchmark.SCENARIOS:
+                result = benchmark.run_benchmark(
+                    dataset, [name], options['requests'], options['warmup'], options['days'],
+                    options['latency'], options['games_per_day'],
+                )[0]
+                self.stderr.write(
+                    f"{name:<28} p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms  "
+                    f"{result['queries_per_request']:6.1f} queries  {result['peak_memory_kib']:9.1f} KiB"
+                )
+                results.append(result)
+        finally:
+            if not options['keep']:
+                benchmark.drop_dataset(*layout)
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'pool': db.pool_stats().get('enabled', False),
+            'python': platform.python_version(),
+            'dataset': {
+                'leagues': options['leagues'],
+                'seasons': options['seasons'],
+                'teams': options['teams'],
+                'game_weeks': options['game_weeks'],
+                'seed': options['seed'],
+                'rows': dataset['rows'],
+            },
+            'options': {key: options[key] for key in ('requests', 'warmup', 'days', 'latency', 'games_per_day')},
+            'scenarios': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(output)
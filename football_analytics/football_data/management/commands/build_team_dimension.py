@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from football_data.teams import TEAMS_TABLE, build_team_dimension
+
+
+class Command(BaseCommand):
+    help = f"Builds {TEAMS_TABLE}: every teamid with its name, league and season in each season table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season-id', type=int, action='append', dest='season_ids',
+                            help='Only rebuild this season (can be repeated). Defaults to every season in the catalog.')
+
+    def handle(self, *args, **options):
+        results = build_team_dimension(options['season_ids'])
+        missing = [season_id for season_id, teams in results.items() if teams is None]
+        if options['verbosity'] > 1:
+            for season_id, teams in results.items():
+                self.stdout.write(f"Season {season_id}: {'missing table' if teams is None else f'{teams} teams'}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {sum(teams for teams in results.values() if teams is not None)} team seasons "
+            f"from {len(results) - len(missing)} seasons, missing table {len(missing)}"
+        ))
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from football_data import db
+from football_data.catalog import get_catalog
+from football_data.export import FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = "Streams match rows of one or more seasons as CSV or NDJSON to a file or stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season-id', type=int, action='append', dest='season_ids', default=[],
+                            help='Season to export (can be repeated)')
+        parser.add_argument('--league', action='append', dest='leagues', default=[],
+                            help='League name, combined with every --season (can be repeated)')
+        parser.add_argument('--season', action='append', dest='seasons', default=[],
+                            help='Season year, e.g. 2023/2024 (can be repeated)')
+        parser.add_argument('--all', action='store_true', help='Export every season in the catalog')
+        parser.add_argument('--team', action='append', dest='teams', default=[], help='Only this team (can be repeated)')
+        parser.add_argument('--kpi', action='append', dest='kpis', default=[], help='Only this KPI column (can be repeated)')
+        parser.add_argument('--home-or-away', choices=['Homegame', 'Awaygame'])
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        catalog = get_catalog()
+        season_ids = list(options['season_ids'])
+        if options['all']:
+            season_ids.extend(sorted(catalog.season_ids()))
+        for league in options['leagues']:
+            for season in options['seasons']:
+                season_id = catalog.season_id(league, season)
+                if season_id is None:
+                    self.stderr.write(self.style.WARNING(f"No season_id for {league} {season}"))
+                else:
+                    season_ids.append(season_id)
+        if not season_ids:
+            raise CommandError("Nothing to export: pass --season-id, --league with --season, or --all")
+
+        existing = db.existing_season_ids(list(dict.fromkeys(str(season_id) for season_id in season_ids)))
+        for season_id in season_ids:
+            if str(season_id) not in existing:
+                self.stderr.write(self.style.WARNING(f"Season {season_id}: no match data table, skipped"))
+        try:
+            content = stream_export(
+                existing,
+                fmt=options['format'],
+                team_names=options['teams'],
+                kpis=options['kpis'],
+                home_or_away=options['home_or_away'],
+            )
+        except db.InvalidIdentifier as e:
+            raise CommandError(str(e))
+
+        if not options['output']:
+            for chunk in content:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+            for chunk in content:
+                out.write(chunk)
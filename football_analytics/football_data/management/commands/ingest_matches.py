@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from football_data.catalog import get_catalog
+from football_data.ingest import DEFAULT_MAX_WORKERS, IngestError, fetch_seasons, ingest_season, load_matches_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads finished matches newer than what the season tables hold, from the football-data-api "
+        "or a JSON file, and refreshes the team aggregates and data versions of the seasons that changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season-id', type=int, action='append', dest='season_ids',
+                            help='Only ingest this season (can be repeated). Defaults to the newest season of every league.')
+        parser.add_argument('--file', help='Read the matches from this JSON file instead of the API')
+        parser.add_argument('--from-game-week', type=int,
+                            help='Reload from this game week instead of the latest one in the table')
+        parser.add_argument('--workers', type=int,
+                            default=getattr(settings, 'INGEST_MAX_WORKERS', DEFAULT_MAX_WORKERS),
+                            help='Seasons fetched from the API at the same time')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['file']:
+            try:
+                matches_by_season = load_matches_file(options['file'])
+            except IngestError as e:
+                raise CommandError(str(e))
+            if options['season_ids']:
+                matches_by_season = {
+                    season_id: matches for season_id, matches in matches_by_season.items()
+                    if season_id in options['season_ids']
+                }
+        else:
+            season_ids = options['season_ids'] or get_catalog().current_season_ids()
+            matches_by_season = fetch_seasons(season_ids, max_workers=options['workers'])
+
+        counts = {'ingested': 0, 'unchanged': 0, 'failed': 0}
+        total_rows = 0
+        for season_id, matches in sorted(matches_by_season.items()):
+            if isinstance(matches, Exception):
+                self.stderr.write(self.style.ERROR(f"Season {season_id}: {matches}"))
+                counts['failed'] += 1
+                continue
+            try:
+                status, rows = ingest_season(season_id, matches, from_game_week=options['from_game_week'])
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"Season {season_id}: {e}"))
+                counts['failed'] += 1
+                continue
+            counts[status] += 1
+            total_rows += rows
+            if options['verbosity'] > 1 or status == 'ingested':
+                self.stdout.write(f"Season {season_id}: {status} ({rows} rows)")
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingested {counts['ingested']} seasons ({total_rows} rows), unchanged {counts['unchanged']}, "
+            f"failed {counts['failed']} in {time.perf_counter() - started:.1f}s"
+        ))
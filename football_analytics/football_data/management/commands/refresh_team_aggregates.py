@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from football_data.aggregates import refresh_season, refresh_season_gameweeks
+from football_data.catalog import get_catalog
+from football_data.teams import refresh_team_season
+
+# Derived table -> refresh hook; each one only recomputes the seasons that changed since it last ran
+REFRESH_HOOKS = {
+    'aggregates': refresh_season,
+    'gameweeks': refresh_season_gameweeks,
+    'teams': refresh_team_season,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds team_season_aggregates, the game-week rollup and the team dimension for every season, "
+        "recomputing only seasons whose match data changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season-id', type=int, action='append', dest='season_ids',
+                            help='Only refresh this season (can be repeated). Defaults to every season in the catalog.')
+        parser.add_argument('--only', choices=REFRESH_HOOKS, action='append',
+                            help='Only refresh this derived table (can be repeated). Defaults to all of them.')
+        parser.add_argument('--force', action='store_true', help='Rebuild even if the source rows did not change')
+
+    def handle(self, *args, **options):
+        season_ids = options['season_ids'] or sorted(get_catalog().season_ids())
+        hooks = {name: REFRESH_HOOKS[name] for name in options['only'] or REFRESH_HOOKS}
+        counts = {'refreshed': 0, 'unchanged': 0, 'missing': 0}
+        for season_id in season_ids:
+            for name, refresh in hooks.items():
+                try:
+                    status = refresh(season_id, force=options['force'])
+                except Exception as e:
+                    self.stderr.write(self.style.ERROR(f"Season {season_id} ({name}): {e}"))
+                    continue
+                counts[status] += 1
+                if options['verbosity'] > 1 or status == 'refreshed':
+                    self.stdout.write(f"Season {season_id} ({name}): {status}")
+                if status == 'missing':
+                    break  # the other tables have nothing to build either
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {counts['refreshed']}, unchanged {counts['unchanged']}, "
+            f"missing table {counts['missing']}"
+        ))
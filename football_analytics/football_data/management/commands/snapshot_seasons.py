@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from football_data import snapshot
+from football_data.aggregates import season_fingerprint, season_table_exists
+from football_data.catalog import LeagueCatalog, invalidate_catalog, read_catalog_rows
+from football_data.kpis import season_table_name
+from football_data.versions import VERSIONS_TABLE, version_key
+
+
+class Command(BaseCommand):
+    help = "Dumps the league catalog and the season tables into the local columnar snapshot (one .npy file per column)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--season-id', type=int, action='append', dest='season_ids',
+                            help='Only snapshot this season (can be repeated). Defaults to every season in the catalog.')
+        parser.add_argument('--force', action='store_true', help='Rewrite seasons whose data did not change')
+        parser.add_argument('--dir', help='Snapshot directory (default: FOOTBALL_SNAPSHOT_DIR)')
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir']) if options['dir'] else snapshot.snapshot_dir()
+        new_rows, old_rows = read_catalog_rows()
+        snapshot.write_catalog(new_rows, old_rows, directory)
+        # Season ids are validated against the catalog, which may be the snapshot one just written
+        invalidate_catalog()
+
+        season_ids = options['season_ids'] or sorted(LeagueCatalog(new_rows, old_rows).season_ids())
+        counts = {'written': 0, 'unchanged': 0, 'missing': 0}
+        for season_id in season_ids:
+            try:
+                status = self.snapshot_season(season_id, directory, options['force'])
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"Season {season_id}: {e}"))
+                continue
+            counts[status] += 1
+            if options['verbosity'] > 1 or status == 'written':
+                self.stdout.write(f"Season {season_id}: {status}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot in {directory}: written {counts['written']}, unchanged {counts['unchanged']}, "
+            f"missing table {counts['missing']}"
+        ))
+
+    def snapshot_season(self, season_id, directory, force):
+        table_name = season_table_name(season_id)
+        with connection.cursor() as cursor:
+            if not season_table_exists(cursor, table_name):
+                return 'missing'
+            row_count, checksum = season_fingerprint(cursor, season_id)
+            updated_at = datetime.now(timezone.utc)
+            version = version_key(row_count, checksum)
+            try:
+                cursor.execute(f"SELECT row_count, checksum, updated_at FROM {VERSIONS_TABLE} WHERE season_id = %s", [season_id])
+                recorded = cursor.fetchone()
+                if recorded is not None and (recorded[0], recorded[1]) == (row_count, checksum):
+                    # The version the views serve, so snapshot ETags match the database's
+                    updated_at = recorded[2]
+                    version = version_key(row_count, checksum, updated_at)
+            except Exception:
+                pass  # versions not recorded yet (refresh_team_aggregates creates the table)
+
+        manifest = snapshot.read_manifest(season_id, directory)
+        if not force and manifest is not None and (manifest.get('format'), manifest['version']) == (snapshot.FORMAT, version):
+            return 'unchanged'
+        snapshot.write_season(season_id, version, updated_at, directory)
+        return 'written'
@@ -0,0 +1,154 @@
+"""
+Ordinary least squares regressions of one KPI (or points) on a set of predictor KPIs.
+
+Every numeric column of a season is fetched once, as a float matrix with one row
+per team-match, and cached per (season_id, home/away, data version) in the default
+cache, so trying other targets or predictors on the same seasons only refits.
+Seasons missing from the cache are fetched together in one UNION ALL query.
+
+The fit pools the rows of the selected seasons, drops rows with a missing value in
+the target or any predictor, and solves the least-squares problem with NumPy.
+Standard errors come from the residual variance and the pseudo-inverse of X'X, so
+collinear predictors give large (not failing) standard errors.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from . import db, timing, versions
+
+
+DEFAULT_CACHE_TTL = 3600  # seconds
+DEFAULT_MAX_SEASONS = 100
+COLUMNS = db.NUMERIC_COLUMNS
+INTERCEPT = 'intercept'
+
+
+class RegressionError(ValueError):
+    """The model cannot be fitted with the given target, predictors or data."""
+
+
+def _matrix_cache_key(season_id, home_or_away, known_versions):
+    # A new data version (e.g. after ingest_matches) makes the cached matrix unreachable
+    version = known_versions.get(str(season_id), (None,))[0]
+    return f"regression:matrix:{season_id}:{home_or_away or 'all'}:{version or 'unversioned'}"
+
+
+def load_season_matrices(season_ids, home_or_away=None):
+    """
+    {season_id: float array (matches, len(COLUMNS))} for the given seasons, from the cache when possible.
+    The seasons that are not cached are fetched in one query.
+    """
+    known_versions = {str(season_id): version for season_id, version in versions.get_versions().items()}
+    keys = {season_id: _matrix_cache_key(season_id, home_or_away, known_versions) for season_id in season_ids}
+    cached = cache.get_many(list(keys.values()))
+    matrices = {season_id: cached[key] for season_id, key in keys.items() if key in cached}
+    missing = [season_id for season_id in season_ids if season_id not in matrices]
+    if missing:
+        fetched = db.fetch_season_matrices(missing, COLUMNS, home_or_away)
+        cache.set_many(
+            {keys[season_id]: matrix for season_id, matrix in fetched.items()},
+            getattr(settings, 'REGRESSION_CACHE_TTL', DEFAULT_CACHE_TTL),
+        )
+        matrices.update(fetched)
+    return {season_id: matrices[season_id] for season_id in season_ids if season_id in matrices}
+
+
+def _summary(values):
+    quartiles = np.percentile(values, [0, 25, 50, 75, 100])
+    return {name: round(float(value), 4) for name, value in zip(['min', 'q1', 'median', 'q3', 'max'], quartiles)}
+
+
+@timing.timed('compute')
+def fit_ols(y, x):
+    """
+    Least squares fit of y on x (without intercept column) with an intercept.
+    Returns a dict with coefficients, standard errors and t values (intercept first),
+    r_squared, adj_r_squared, residual_std_error, residuals summary and n_obs.
+    """
+    n_obs, n_predictors = x.shape
+    design = np.column_stack([np.ones(n_obs), x])
+    n_params = n_predictors + 1
+    if n_obs <= n_params:
+        raise RegressionError(f"Not enough matches ({n_obs}) for {n_params} parameters")
+
+    coefficients, _, rank, _ = np.linalg.lstsq(design, y, rcond=None)
+    residuals = y - design @ coefficients
+    ss_res = float(residuals @ residuals)
+    centered = y - y.mean()
+    ss_tot = float(centered @ centered)
+    dof = n_obs - rank
+    sigma2 = ss_res / dof
+    covariance = sigma2 * np.linalg.pinv(design.T @ design)
+    std_errors = np.sqrt(np.clip(np.diag(covariance), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_values = coefficients / std_errors
+    r_squared = 1 - ss_res / ss_tot if ss_tot > 0 else None
+    return {
+        'coefficients': coefficients,
+        'std_errors': std_errors,
+        't_values': t_values,
+        'r_squared': r_squared,
+        'adj_r_squared': None if r_squared is None else 1 - (1 - r_squared) * (n_obs - 1) / dof,
+        'residual_std_error': float(np.sqrt(sigma2)),
+        'residuals': _summary(residuals),
+        'n_obs': n_obs,
+        'rank': int(rank),
+    }
+
+
+def _round(value):
+    if value is None or not np.isfinite(value):
+        return None
+    return round(float(value), 6)
+
+
+def run_regression(season_ids, target, predictors, home_or_away=None):
+    """
+    Regresses target on predictors over the pooled rows of the given seasons.
+    Returns the JSON-ready result; raises RegressionError for an invalid model.
+    """
+    predictors = list(dict.fromkeys(predictors))  # unique, in request order
+    if target not in COLUMNS:
+        raise RegressionError(f"Unknown target {target!r}")
+    if not predictors:
+        raise RegressionError("At least one predictor is required")
+    unknown = [predictor for predictor in predictors if predictor not in COLUMNS]
+    if unknown:
+        raise RegressionError(f"Unknown predictors: {', '.join(unknown)}")
+    if target in predictors:
+        raise RegressionError("The target can't also be a predictor")
+
+    max_seasons = getattr(settings, 'REGRESSION_MAX_SEASONS', DEFAULT_MAX_SEASONS)
+    season_ids = db.existing_season_ids(sorted(set(season_ids))[:max_seasons])
+    matrices = load_season_matrices(season_ids, home_or_away)
+    if not matrices:
+        raise RegressionError("No matches for the selected seasons")
+
+    indices = [COLUMNS.index(column) for column in [target] + predictors]
+    data = np.concatenate([matrix[:, indices] for matrix in matrices.values()])
+    data = data[~np.isnan(data).any(axis=1)]
+    fit = fit_ols(data[:, 0], data[:, 1:])
+
+    names = [INTERCEPT] + predictors
+    return {
+        'target': target,
+        'predictors': predictors,
+        'home_or_away': home_or_away,
+        'season_ids': list(matrices),
+        'n_obs': fit['n_obs'],
+        'rank': fit['rank'],
+        'coefficients': [
+            {
+                'name': name,
+                'estimate': _round(estimate),
+                'std_error': _round(std_error),
+                't_value': _round(t_value),
+            }
+            for name, estimate, std_error, t_value in zip(names, fit['coefficients'], fit['std_errors'], fit['t_values'])
+        ],
+        'r_squared': _round(fit['r_squared']),
+        'adj_r_squared': _round(fit['adj_r_squared']),
+        'residual_std_error': _round(fit['residual_std_error']),
+        'residuals': fit['residuals'],
+    }
@@ -0,0 +1,445 @@
+"""
+Local columnar snapshots of the season tables.
+
+`python manage.py snapshot_seasons` dumps every match_data_{season_id}_final table
+into FOOTBALL_SNAPSHOT_DIR, one NumPy .npy file per column, plus the league catalog:
+
+    <dir>/catalog.json
+    <dir>/seasons/<season_id>/manifest.json
+    <dir>/seasons/<season_id>/<column>.npy
+
+Numeric columns are float64 with NaN for NULL; NUMERIC columns also keep the
+decimal places of every value in <column>.scale.npy, so they are read back as the
+same Decimals PostgreSQL returns. Text columns are dictionary encoded as int32
+codes (-1 for NULL) with the labels in the manifest. SnapshotEngine memory-maps
+the files, so reading a season costs no database round trip and no copy until
+values are used.
+
+With FOOTBALL_DATA_BACKEND = 'snapshot' the catalog, the season data versions and
+the db helpers behind the league and form tables, KPI series, histograms, fixture stats and
+correlations read snapshotted seasons from here; seasons missing from the snapshot
+(e.g. the current one, if it was left out) still go to PostgreSQL.
+"""
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from . import db
+from .kpis import AVERAGE_ONLY_KPIS, KPI_COLUMNS
+
+
+CATALOG_FILE = "catalog.json"
+MANIFEST_FILE = "manifest.json"
+FORMAT = 2  # manifests of another format are rewritten by snapshot_seasons
+TEXT_COLUMNS = {'team_name', 'opponent_name', 'homeoraway', 'season', 'stadium_name'}
+TWO_PLACES = Decimal('0.01')
+_QUANTA = [Decimal(1).scaleb(-places) for places in range(128)]  # decimal places -> quantize() exponent
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'FOOTBALL_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'snapshot'))
+
+
+def snapshot_enabled():
+    return getattr(settings, 'FOOTBALL_DATA_BACKEND', 'postgres') == 'snapshot'
+
+
+# --- Writing ---
+
+def _decimal_places(value):
+    exponent = value.as_tuple().exponent if isinstance(value, Decimal) else 0
+    return -exponent if isinstance(exponent, int) and exponent < 0 else 0
+
+
+def _encode_column(name, values):
+    """Returns (array, column manifest entry), plus the decimal places of a NUMERIC column's values."""
+    if name in TEXT_COLUMNS:
+        labels = sorted({value for value in values if value is not None})
+        codes = {label: code for code, label in enumerate(labels)}
+        array = np.array([-1 if value is None else codes[value] for value in values], dtype=np.int32)
+        return array, {'kind': 'text', 'labels': labels}, None
+    array = np.array([np.nan if value is None else float(value) for value in values], dtype=np.float64)
+    integer = all(isinstance(value, int) for value in values if value is not None)
+    if any(isinstance(value, Decimal) for value in values):
+        # NUMERIC columns: the decimal places of every value, so decode() rebuilds the same Decimals
+        scales = np.array([_decimal_places(value) for value in values], dtype=np.int8)
+        return array, {'kind': 'numeric', 'integer': False, 'decimal': True}, scales
+    return array, {'kind': 'numeric', 'integer': integer}, None
+
+
+def write_season(season_id, version, updated_at, directory=None):
+    """Dumps one season table column by column. The season directory is replaced atomically."""
+    seasons_dir = (directory or snapshot_dir()) / "seasons"
+    seasons_dir.mkdir(parents=True, exist_ok=True)
+    columns = db.TABLE_COLUMNS
+    values = {column: [] for column in columns}
+    for row in db.iter_matches([season_id], columns=columns):
+        for column, value in zip(columns, row):
+            values[column].append(value)
+
+    target = seasons_dir / str(season_id)
+    staging = seasons_dir / f".{season_id}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir()
+    manifest = {
+        'format': FORMAT,
+        'season_id': season_id,
+        'version': version,
+        'updated_at': updated_at.isoformat() if updated_at else None,
+        'row_count': len(values[columns[0]]),
+        'columns': {},
+    }
+    for column in columns:
+        array, entry, scales = _encode_column(column, values[column])
+        np.save(staging / f"{column}.npy", array)
+        if scales is not None:
+            np.save(staging / f"{column}.scale.npy", scales)
+        manifest['columns'][column] = entry
+    (staging / MANIFEST_FILE).write_text(json.dumps(manifest))
+
+    # Swap directories; readers holding memory maps of the old files keep working
+    previous = seasons_dir / f".{season_id}.old"
+    shutil.rmtree(previous, ignore_errors=True)
+    if target.exists():
+        os.replace(target, previous)
+    os.replace(staging, target)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+def write_catalog(new_rows, old_rows, directory=None):
+    directory = directory or snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    staging = directory / f".{CATALOG_FILE}.tmp"
+    staging.write_text(json.dumps({
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'new_rows': [list(row) for row in new_rows],
+        'old_rows': [list(row) for row in old_rows],
+    }, default=str))
+    os.replace(staging, directory / CATALOG_FILE)
+
+
+def read_manifest(season_id, directory=None):
+    path = (directory or snapshot_dir()) / "seasons" / str(season_id) / MANIFEST_FILE
+    try:
+        return json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
+
+
+# --- Reading ---
+
+class SeasonSnapshot:
+    """Memory-mapped columns of one season, with the queries the views need."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        manifest = json.loads((self.path / MANIFEST_FILE).read_text())
+        self.season_id = manifest['season_id']
+        self.version = manifest['version']
+        self.updated_at = datetime.fromisoformat(manifest['updated_at']) if manifest['updated_at'] else None
+        self.row_count = manifest['row_count']
+        self._columns = manifest['columns']
+        self._codes = {
+            name: {label: code for code, label in enumerate(entry['labels'])}
+            for name, entry in self._columns.items() if entry['kind'] == 'text'
+        }
+        self._arrays = {}
+
+    def column(self, name):
+        array = self._arrays.get(name)
+        if array is None:
+            array = self._arrays[name] = np.load(self.path / f"{name}.npy", mmap_mode='r')
+        return array
+
+    def code(self, name, label):
+        """Dictionary code of a text value, or None if it never occurs."""
+        return self._codes[name].get(label)
+
+    def decode(self, name, index):
+        """Python values of a column for the given row positions (None for NULL)."""
+        entry = self._columns[name]
+        raw = self.column(name)[index]
+        if entry['kind'] == 'text':
+            labels = entry['labels']
+            return [None if code < 0 else labels[code] for code in raw.tolist()]
+        if entry['integer']:
+            return [None if value != value else int(value) for value in raw.tolist()]
+        if entry.get('decimal'):
+            # The Decimals PostgreSQL returns for NUMERIC, with the same number of decimal places
+            scales = self.column(f"{name}.scale")[index].tolist()
+            return [
+                None if value != value else Decimal(repr(value)).quantize(_QUANTA[scale])
+                for value, scale in zip(raw.tolist(), scales)
+            ]
+        return [None if value != value else value for value in raw.tolist()]
+
+    def _rows_matching(self, name, label):
+        code = self.code(name, label)
+        if code is None:
+            return np.zeros(self.row_count, dtype=bool)
+        return self.column(name) == code
+
+    def _by_game_week(self, index):
+        # ORDER BY game_week; NaN (NULL) sorts last as in PostgreSQL
+        return index[np.argsort(self.column('game_week')[index], kind='stable')]
+
+    def team_names(self):
+        return list(self._columns['team_name']['labels'])
+
+    def kpi_series(self, kpi, team_names):
+        codes = {self.code('team_name', name): name for name in team_names}
+        codes.pop(None, None)
+        index = self._by_game_week(np.nonzero(np.isin(self.column('team_name'), list(codes)))[0])
+        data_by_team = {}
+        teams = self.column('team_name')[index].tolist()
+        for team_code, game_week, kpi_value in zip(teams, self.decode('game_week', index), self.decode(kpi, index)):
+            data_by_team.setdefault(codes[team_code], []).append((game_week, kpi_value))
+        return data_by_team
+
+    def team_matches(self, team_name):
+        index = self._by_game_week(np.nonzero(self._rows_matching('team_name', team_name))[0])
+        columns = [self.decode(column, index) for column in db.MATCH_COLUMNS]
+        return list(zip(*columns)), list(db.MATCH_COLUMNS)
+
+    def _group_sums(self, name, groups, num_groups):
+        """Per group: (sum of non-NULL values, number of non-NULL values)."""
+        values = np.asarray(self.column(name)[groups[0]], dtype=np.float64)
+        present = ~np.isnan(values)
+        sums = np.bincount(groups[1][present], weights=values[present], minlength=num_groups)
+        counts = np.bincount(groups[1][present], minlength=num_groups)
+        return sums, counts
+
+    def _number(self, name, value):
+        return int(value) if self._columns[name]['integer'] else float(value)
+
+    def team_aggregates(self, view_type='averages', home_or_away=None):
+        """Same rows and columns as db.fetch_team_aggregates."""
+        mask = self.column('team_name') >= 0
+        if home_or_away:
+            mask &= self._rows_matching('homeoraway', home_or_away)
+        index = np.nonzero(mask)[0]
+        team_codes, inverse = np.unique(self.column('team_name')[index], return_inverse=True)
+        groups = (index, inverse)
+        labels = self._columns['team_name']['labels']
+
+        point_sums, games_played = self._group_sums('points', groups, len(team_codes))
+        rows = []
+        kpi_totals = {kpi: self._group_sums(kpi, groups, len(team_codes)) for kpi in KPI_COLUMNS}
+        for group, team_code in enumerate(team_codes.tolist()):
+            row = [
+                labels[team_code],
+                int(games_played[group]),
+                self._number('points', point_sums[group]) if games_played[group] else None,
+            ]
+            for kpi in KPI_COLUMNS:
+                sums, counts = kpi_totals[kpi]
+                if not counts[group]:
+                    row.append(None)
+                elif view_type == 'totals' and kpi not in AVERAGE_ONLY_KPIS:
+                    row.append(self._number(kpi, sums[group]))
+                else:
+                    row.append(Decimal(repr(float(sums[group] / counts[group]))).quantize(TWO_PLACES, ROUND_HALF_UP))
+            rows.append(tuple(row))
+        # ORDER BY total_points DESC puts NULLs first in PostgreSQL
+        rows.sort(key=lambda row: (row[2] is not None, -(row[2] or 0)))
+        columns = ['team_name', 'games_played', 'total_points'] + [f"avg_{kpi}" for kpi in KPI_COLUMNS]
+        return rows, columns
+
+    def league_gameweek_aggregates(self, kpi, aggregation_type='averages'):
+        """Same rows as db.fetch_league_gameweek_aggregates."""
+        values = np.asarray(self.column(kpi), dtype=np.float64)
+        index = np.nonzero(~np.isnan(values))[0]
+        game_weeks = np.asarray(self.column('game_week'), dtype=np.float64)[index]
+        week_values, inverse = np.unique(game_weeks, return_inverse=True)  # NaN weeks sort last
+        sums = np.bincount(inverse, weights=values[index], minlength=len(week_values))
+        counts = np.bincount(inverse, minlength=len(week_values))
+        rows = []
+        integer_weeks = self._columns['game_week']['integer']
+        for group, week in enumerate(week_values.tolist()):
+            game_week = None if week != week else (int(week) if integer_weeks else week)
+            value = self._number(kpi, sums[group]) if aggregation_type == 'totals' else float(sums[group] / counts[group])
+            rows.append((game_week, value, int(counts[group])))
+        return rows
+
+    def _form_order(self, index, by_team=None):
+        """
+        Rows sorted as db.FORM_ORDER (game_week DESC, then opponent_name, NULLs last),
+        grouped first by the codes of the by_team text column if given.
+        """
+        game_weeks = np.asarray(self.column('game_week')[index], dtype=np.float64)
+        opponents = self.column('opponent_name')[index].astype(np.int64)
+        keys = [
+            np.where(opponents < 0, np.iinfo(np.int64).max, opponents),
+            np.nan_to_num(-game_weeks, nan=np.inf),
+        ]
+        if by_team:
+            keys.append(self.column(by_team)[index])
+        return index[np.lexsort(keys)]
+
+    def competition_team_stats(self, team_ids, window):
+        """Same mapping as db.fetch_competition_team_stats."""
+        teamids = np.asarray(self.column('teamid'), dtype=np.float64)
+        columns = ('corners_for', 'shots_for', 'shotsontarget_for', 'yellow_cards_for')
+        stats = {}
+        for team_id in team_ids:
+            index = np.nonzero(teamids == float(team_id))[0]
+            if not len(index):
+                continue
+            names = [name for name in self.decode('team_name', index) if name is not None]
+            recent = self._form_order(index)[:window]
+            averages = []
+            for rows in (index, recent):
+                for column in columns:
+                    values = np.asarray(self.column(column)[rows], dtype=np.float64)
+                    values = values[~np.isnan(values)]
+                    averages.append(float(values.mean()) if len(values) else None)
+            stats[team_id] = (max(names) if names else None, *averages)
+        return stats
+
+    def team_form(self, window, home_or_away=None):
+        """Same rows and columns as db.fetch_team_form, in one sort and one pass over the season."""
+        mask = self.column('team_name') >= 0
+        if home_or_away:
+            mask &= self._rows_matching('homeoraway', home_or_away)
+        index = self._form_order(np.nonzero(mask)[0], by_team='team_name')
+        # Position of every match within its team's run of the sorted rows: keep the first `window`
+        teams = self.column('team_name')[index]
+        starts = np.r_[0, np.nonzero(np.diff(teams))[0] + 1]
+        ranks = np.arange(len(index)) - np.repeat(starts, np.diff(np.r_[starts, len(index)]))
+        index = index[ranks < window]
+
+        team_codes, inverse = np.unique(self.column('team_name')[index], return_inverse=True)
+        groups = (index, inverse)
+        labels = self._columns['team_name']['labels']
+        games_played = np.bincount(inverse, minlength=len(team_codes))
+        point_sums, point_counts = self._group_sums('points', groups, len(team_codes))
+        kpi_totals = {kpi: self._group_sums(kpi, groups, len(team_codes)) for kpi in KPI_COLUMNS}
+        summed = [kpi for kpi in KPI_COLUMNS if kpi not in AVERAGE_ONLY_KPIS]
+        rows = []
+        for group, team_code in enumerate(team_codes.tolist()):
+            row = [
+                labels[team_code],
+                int(games_played[group]),
+                self._number('points', point_sums[group]) if point_counts[group] else None,
+            ]
+            for kpi in KPI_COLUMNS:
+                sums, counts = kpi_totals[kpi]
+                row.append(
+                    Decimal(repr(float(sums[group] / counts[group]))).quantize(TWO_PLACES, ROUND_HALF_UP)
+                    if counts[group] else None
+                )
+            for kpi in summed:
+                sums, counts = kpi_totals[kpi]
+                row.append(self._number(kpi, sums[group]) if counts[group] else None)
+            rows.append(tuple(row))
+        # ORDER BY total_points DESC puts NULLs first in PostgreSQL
+        rows.sort(key=lambda row: (row[2] is not None, -(row[2] or 0)))
+        columns = (
+            ['team_name', 'games_played', 'total_points']
+            + [f"avg_{kpi}" for kpi in KPI_COLUMNS]
+            + [f"sum_{kpi}" for kpi in summed]
+        )
+        return rows, columns
+
+    def team_values(self, team_ids, columns):
+        """Same mapping as db.fetch_team_values."""
+        teamids = np.asarray(self.column('teamid'), dtype=np.float64)
+        values = {}
+        for team_id in team_ids:
+            index = np.nonzero(teamids == float(team_id))[0]
+            if not len(index):
+                continue
+            names = [name for name in self.decode('team_name', index) if name is not None]
+            matrix = np.column_stack([np.asarray(self.column(column)[index], dtype=np.float64) for column in columns])
+            values[team_id] = (max(names) if names else None, matrix)
+        return values
+
+    def matrix(self, columns, home_or_away=None):
+        """Numeric columns as a (matches, len(columns)) float array, NaN for NULL."""
+        if home_or_away:
+            index = np.nonzero(self._rows_matching('homeoraway', home_or_away))[0]
+        else:
+            index = slice(None)
+        return np.column_stack([np.asarray(self.column(column)[index], dtype=np.float64) for column in columns])
+
+    def kpi_matrix(self, home_or_away=None):
+        """Every KPI column as a (matches, len(KPI_COLUMNS)) float array, NaN for NULL."""
+        return self.matrix(KPI_COLUMNS, home_or_away)
+
+
+class SnapshotEngine:
+    """Read side of a snapshot directory. Seasons are reloaded when their manifest is rewritten."""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._seasons = {}  # season_id -> (manifest mtime, SeasonSnapshot)
+        self._lock = threading.Lock()
+
+    def season(self, season_id):
+        """The SeasonSnapshot of a season, or None if it is not in the snapshot."""
+        path = self.directory / "seasons" / str(season_id)
+        try:
+            mtime = (path / MANIFEST_FILE).stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._seasons.get(str(season_id))
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with self._lock:
+            season = SeasonSnapshot(path)
+            self._seasons[str(season_id)] = (mtime, season)
+        return season
+
+    def season_ids(self):
+        seasons_dir = self.directory / "seasons"
+        if not seasons_dir.exists():
+            return []
+        return [path.name for path in seasons_dir.iterdir() if (path / MANIFEST_FILE).exists()]
+
+    def catalog_rows(self):
+        """(new_rows, old_rows) of the snapshotted catalog, or None if there is none."""
+        try:
+            catalog = json.loads((self.directory / CATALOG_FILE).read_text())
+        except FileNotFoundError:
+            return None
+        return [tuple(row) for row in catalog['new_rows']], [tuple(row) for row in catalog['old_rows']]
+
+    def versions(self):
+        """{season_id: (version, updated_at)} of the snapshotted seasons."""
+        versions = {}
+        for season_id in self.season_ids():
+            season = self.season(season_id)
+            if season is not None and season.version:
+                versions[season.season_id] = (season.version, season.updated_at)
+        return versions
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The shared SnapshotEngine when FOOTBALL_DATA_BACKEND is 'snapshot', otherwise None."""
+    global _engine
+    if not snapshot_enabled():
+        return None
+    directory = snapshot_dir()
+    if _engine is None or _engine.directory != Path(directory):
+        with _engine_lock:
+            if _engine is None or _engine.directory != Path(directory):
+                _engine = SnapshotEngine(directory)
+    return _engine
+
+
+def snapshot_season(season_id):
+    """The SeasonSnapshot to serve a season from, or None to query PostgreSQL."""
+    engine = get_engine()
+    return engine.season(season_id) if engine is not None else None
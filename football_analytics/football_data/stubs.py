@@ -0,0 +1,128 @@
+"""
+Local stand-ins for external services, used to benchmark offline.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # the default backlog of 5 drops bursts of concurrent connections
+
+
+class FixturesStubServer:
+    """
+    Minimal HTTP server that answers like the football-data-api `todays-matches` endpoint.
+
+    Every response is delayed by `latency` seconds to simulate the round trip to the real API.
+    Games are generated deterministically from the requested date, so repeated runs are comparable.
+    peak_in_flight is the most requests ever handled at once. With `gate`, every response is held
+    until that many requests are in flight (or `gate_timeout` seconds pass), so a test can tell a
+    client that sends them concurrently from one that doesn't without measuring time.
+
+        with FixturesStubServer(latency=0.2) as stub:
+            client = FixturesClient(base_url=stub.url)
+    """
+
+    def __init__(self, latency=0.0, games_per_day=10, competition_ids=(1,), team_ids=None, host='127.0.0.1', port=0,
+                 teams_by_competition=None, gate=None, gate_timeout=5.0):
+        self.latency = latency
+        self.gate = gate
+        self.gate_timeout = gate_timeout
+        self.games_per_day = games_per_day
+        self.competition_ids = list(competition_ids)
+        self.team_ids = list(team_ids) if team_ids else list(range(1, 2 * games_per_day + 1))
+        # {competition_id: team ids}: games are then played between teams of the same competition
+        self.teams_by_competition = {
+            competition_id: list(ids) for competition_id, ids in (teams_by_competition or {}).items()
+        }
+        if self.teams_by_competition:
+            self.competition_ids = list(self.teams_by_competition)
+        self.request_count = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._condition = threading.Condition()
+        self._server = _StubHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/todays-matches"
+
+    def games_for_date(self, date_str):
+        seed = int(date_str.replace('-', ''))
+        games = []
+        for i in range(self.games_per_day):
+            competition_id = self.competition_ids[(seed + i) % len(self.competition_ids)]
+            team_ids = self.teams_by_competition.get(competition_id, self.team_ids)
+            home = team_ids[(seed + 2 * i) % len(team_ids)]
+            away = team_ids[(seed + 2 * i + 1) % len(team_ids)]
+            games.append({
+                "id": seed * 100 + i,
+                "competition_id": competition_id,
+                "homeID": home,
+                "awayID": away,
+                "season": "2024/2025",
+                "status": "incomplete",
+                "roundID": seed % 1000,
+                "game_week": (seed + i) % 38 + 1,
+            })
+        return games
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._condition:
+                    stub.request_count += 1
+                    stub.in_flight += 1
+                    stub.peak_in_flight = max(stub.peak_in_flight, stub.in_flight)
+                    stub._condition.notify_all()
+                    if stub.gate:
+                        stub._condition.wait_for(lambda: stub.peak_in_flight >= stub.gate, stub.gate_timeout)
+                try:
+                    self.respond()
+                finally:
+                    with stub._condition:
+                        stub.in_flight -= 1
+
+            def respond(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                query = parse_qs(urlparse(self.path).query)
+                date_str = query.get('date', [''])[0]
+                if not date_str:
+                    body = {"success": False, "message": "date parameter missing"}
+                else:
+                    body = {"success": True, "data": stub.games_for_date(date_str)}
+                payload = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass  # keep benchmark output clean
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,186 @@
+"""
+The team dimension: which teamid played in which season, under which name.
+
+team_dimension holds one row per (teamid, season_id) with the team's name in that
+season table, the season's league and year and the number of match rows. It is
+built from every season table by `python manage.py build_team_dimension` and kept
+up to date by refresh_team_season(), which ingestion and refresh_team_aggregates run
+for every changed season.
+
+The table is read into a TeamIndex shared by every request (like the catalog, for
+TEAM_INDEX_TTL seconds or until invalidate_team_index()). upcoming_games resolves
+each fixture team with one dictionary lookup: the fixture's own season when the
+team has matches in it, else the team's latest season, e.g. when the competition's
+table has not been loaded yet or the team was just promoted. The fixture's team names
+come from the index too, and so does its league when the competition is not in the
+catalog yet but all its teams resolve to seasons of the same league.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import aggregates
+from .catalog import get_catalog
+from .kpis import season_table_name
+
+
+logger = logging.getLogger(__name__)
+
+
+TEAMS_TABLE = "team_dimension"
+DEFAULT_TEAM_INDEX_TTL = 600  # seconds
+
+
+def ensure_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TEAMS_TABLE} (
+            teamid INTEGER NOT NULL,
+            season_id INTEGER NOT NULL,
+            team_name TEXT NOT NULL,
+            league TEXT,
+            season_year TEXT,
+            matches BIGINT NOT NULL,
+            PRIMARY KEY (teamid, season_id)
+        )
+    """)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS {TEAMS_TABLE}_season_idx ON {TEAMS_TABLE} (season_id)")
+
+
+def refresh_season_teams(cursor, season_id, league=None, season_year=None):
+    """Replaces the team_dimension rows of one season from its match_data table (in the caller's transaction)."""
+    ensure_table(cursor)
+    cursor.execute(f"DELETE FROM {TEAMS_TABLE} WHERE season_id = %s", [season_id])
+    cursor.execute(f"""
+        INSERT INTO {TEAMS_TABLE} (teamid, season_id, team_name, league, season_year, matches)
+        SELECT teamid, %s, MAX(team_name), %s, %s, COUNT(*)
+        FROM {season_table_name(season_id)}
+        WHERE teamid IS NOT NULL AND team_name IS NOT NULL
+        GROUP BY teamid
+    """, [season_id, league, None if season_year is None else str(season_year)])
+    return cursor.rowcount
+
+
+def refresh_team_season(season_id, force=False):
+    """
+    Rebuilds the team_dimension rows of one season if its table changed since they were built
+    (see aggregates.refresh_derived); the shared index is reloaded once the transaction commits.
+    """
+    catalog = get_catalog()
+
+    def rebuild(cursor, season_id, table_name):
+        refresh_season_teams(cursor, season_id, catalog.league_name(season_id), catalog.season_year(season_id))
+
+    status = aggregates.refresh_derived(season_id, TEAMS_TABLE, rebuild, force)
+    if status == 'refreshed':
+        transaction.on_commit(invalidate_team_index)
+    return status
+
+
+def build_team_dimension(season_ids=None):
+    """
+    Rebuilds the team_dimension rows of the given seasons (every catalog season by default),
+    one transaction per season. Returns {season_id: number of teams, or None when the table is missing}.
+    The rows of seasons whose table is missing are removed.
+    """
+    catalog = get_catalog()
+    if season_ids is None:
+        season_ids = sorted(catalog.season_ids())
+    with connection.cursor() as cursor:
+        existing_tables = set(connection.introspection.table_names(cursor))
+    results = {}
+    for season_id in season_ids:
+        if season_table_name(season_id) not in existing_tables:
+            with connection.cursor() as cursor:
+                ensure_table(cursor)
+                cursor.execute(f"DELETE FROM {TEAMS_TABLE} WHERE season_id = %s", [season_id])
+            results[season_id] = None
+            continue
+        with transaction.atomic(), connection.cursor() as cursor:
+            results[season_id] = refresh_season_teams(
+                cursor, season_id, catalog.league_name(season_id), catalog.season_year(season_id),
+            )
+    invalidate_team_index()
+    return results
+
+
+class TeamIndex:
+    """In-memory team_dimension: O(1) lookups of a team's name and league per season and of its latest season."""
+
+    def __init__(self, rows, ttl=DEFAULT_TEAM_INDEX_TTL):
+        self.loaded_at = time.monotonic()
+        self.ttl = ttl
+        self._names = {}    # (season_id, teamid) -> team name
+        self._seasons = {}  # teamid -> [(season year, season_id)], newest first
+        self._leagues = {}  # season_id -> league name
+        for teamid, season_id, team_name, league, season_year in rows:
+            self._names[(season_id, teamid)] = team_name
+            self._seasons.setdefault(teamid, []).append((str(season_year or ''), season_id))
+            if league is not None:
+                self._leagues[season_id] = league
+        for seasons in self._seasons.values():
+            seasons.sort(reverse=True)
+
+    def __len__(self):
+        return len(self._seasons)
+
+    def is_expired(self):
+        return time.monotonic() - self.loaded_at >= self.ttl
+
+    def team_name(self, teamid, season_id):
+        """The team's name in a season, or None when the team has no matches in it."""
+        return self._names.get((season_id, teamid))
+
+    def league_name(self, season_id):
+        return self._leagues.get(season_id)
+
+    def latest_season_id(self, teamid):
+        seasons = self._seasons.get(teamid)
+        return seasons[0][1] if seasons else None
+
+    def resolve(self, competition_id, teamid):
+        """
+        The season a fixture team's stats are read from: competition_id when the team has matches
+        in it, else the team's latest season; competition_id as well for teams the index doesn't know.
+        """
+        if (competition_id, teamid) in self._names:
+            return competition_id
+        return self.latest_season_id(teamid) or competition_id
+
+
+def load_team_index(ttl=None):
+    """Reads team_dimension into a TeamIndex; the index is empty when the table has not been built."""
+    if ttl is None:
+        ttl = getattr(settings, 'TEAM_INDEX_TTL', DEFAULT_TEAM_INDEX_TTL)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT teamid, season_id, team_name, league, season_year FROM {TEAMS_TABLE}")
+            rows = cursor.fetchall()
+    except Exception as e:
+        logger.warning("Team dimension not available (run build_team_dimension): %s", e)
+        rows = []
+    return TeamIndex(rows, ttl=ttl)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_team_index():
+    """Returns the shared TeamIndex, reloading it when it has expired or been invalidated."""
+    global _index
+    index = _index
+    if index is None or index.is_expired():
+        with _index_lock:
+            if _index is None or _index.is_expired():
+                _index = load_team_index()
+            index = _index
+    return index
+
+
+def invalidate_team_index():
+    global _index
+    with _index_lock:
+        _index = None
@@ -1,3 +1,872 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import itertools
+import json
+import tempfile
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from . import aggregates, async_db, catalog, columnar, combinations, db, explorer, fixtures, ingest, regression, snapshot, teams, versions, views
+from .catalog import LeagueCatalog
+from .correlations import _cache_key, correlation_matrix, rank_columns
+from .fixture_stats import resolve_team_seasons
+from .histogram import build_histograms, histogram_counts, histogram_edges, parse_bins, parse_flag
+from .stubs import FixturesStubServer
+
+
+# Rows as read from possible_leagues_and_seasons_NEW and possible_leagues_and_seasons
+NEW_ROWS = [
+    ('Premier League', '20232024', 101, 'yes'),
+    ('Premier League', '20222023', 100, 'yes'),
+    ('La Liga', '20232024', 201, 'no'),
+]
+OLD_ROWS = [
+    (100, 'Premier League', '20222023'),
+    (101, 'Premier League', '20232024'),
+    (200, 'La Liga', '20222023'),
+]
+
+
+class LeagueCatalogTests(SimpleTestCase):
+    def test_lookups(self):
+        league_catalog = LeagueCatalog(NEW_ROWS, OLD_ROWS)
+        self.assertEqual(league_catalog.leagues(), ['Premier League'])
+        self.assertEqual(league_catalog.seasons_for_league('Premier League'), ['20222023', '20232024'])
+        self.assertEqual(league_catalog.all_leagues(), ['La Liga', 'Premier League'])
+        self.assertEqual(league_catalog.all_season_years(), ['20232024', '20222023'])
+        self.assertEqual(league_catalog.season_id('La Liga', 20232024), 201)
+        self.assertIsNone(league_catalog.season_id('La Liga', None))
+        self.assertEqual(league_catalog.league_name(200), 'La Liga')
+        self.assertEqual(sorted(league_catalog.current_season_ids()), [101, 201])
+
+    def test_has_season_id_accepts_strings(self):
+        league_catalog = LeagueCatalog(NEW_ROWS, OLD_ROWS)
+        self.assertTrue(league_catalog.has_season_id(201))
+        self.assertTrue(league_catalog.has_season_id('201'))
+        self.assertFalse(league_catalog.has_season_id('999'))
+
+    def test_fingerprint_ignores_row_order(self):
+        self.assertEqual(
+            LeagueCatalog(NEW_ROWS, OLD_ROWS).fingerprint,
+            LeagueCatalog(NEW_ROWS[::-1], OLD_ROWS[::-1]).fingerprint,
+        )
+        self.assertNotEqual(LeagueCatalog(NEW_ROWS, OLD_ROWS).fingerprint, LeagueCatalog(NEW_ROWS[:1], OLD_ROWS).fingerprint)
+
+
+class CatalogCacheTests(SimpleTestCase):
+    def setUp(self):
+        catalog.invalidate_catalog()
+        self.addCleanup(catalog.invalidate_catalog)
+
+    def test_catalog_is_loaded_once_until_invalidated(self):
+        with mock.patch.object(catalog, 'load_catalog', side_effect=lambda: LeagueCatalog(NEW_ROWS, OLD_ROWS)) as load:
+            first = catalog.get_catalog()
+            self.assertIs(catalog.get_catalog(), first)
+            self.assertEqual(load.call_count, 1)
+            catalog.invalidate_catalog()
+            self.assertIsNot(catalog.get_catalog(), first)
+            self.assertEqual(load.call_count, 2)
+
+    def test_expired_catalog_is_reloaded(self):
+        with mock.patch.object(catalog, 'load_catalog', side_effect=lambda: LeagueCatalog(NEW_ROWS, OLD_ROWS, ttl=0)) as load:
+            catalog.get_catalog()
+            catalog.get_catalog()
+            self.assertEqual(load.call_count, 2)
+
+
+class TeamIndexTests(SimpleTestCase):
+    ROWS = [
+        (1, 100, 'Arsenal FC', 'Premier League', '20222023'),
+        (1, 101, 'Arsenal', 'Premier League', '20232024'),
+        (2, 100, 'Chelsea', 'Premier League', '20222023'),
+        (3, 200, 'Girona', 'La Liga', '20222023'),
+    ]
+
+    def test_resolve(self):
+        index = teams.TeamIndex(self.ROWS)
+        self.assertEqual(len(index), 3)
+        # The fixture's own season when the team played it, else its latest season
+        self.assertEqual(index.resolve(100, 1), 100)
+        self.assertEqual(index.resolve(102, 1), 101)
+        self.assertEqual(index.resolve(102, 2), 100)
+        self.assertEqual(index.resolve(102, 4), 102)
+        self.assertEqual(index.team_name(1, 100), 'Arsenal FC')
+        self.assertEqual(index.team_name(1, 101), 'Arsenal')
+        self.assertIsNone(index.team_name(1, 200))
+        self.assertEqual(index.league_name(200), 'La Liga')
+
+    def test_upcoming_names(self):
+        index = teams.TeamIndex(self.ROWS)
+        games_data = [
+            {'competition_id': 102, 'homeID': 1, 'awayID': 2},  # not in the catalog yet
+            {'competition_id': 103, 'homeID': 1, 'awayID': 3},  # teams from two leagues
+            {'competition_id': 100, 'homeID': 2, 'awayID': 4},
+        ]
+        team_seasons, _ = resolve_team_seasons(games_data, index)
+        league_names = views._upcoming_league_names(LeagueCatalog(NEW_ROWS, OLD_ROWS), index, team_seasons)
+        self.assertEqual(league_names, {102: 'Premier League', 100: 'Premier League'})
+
+        stats = (None, 5.0, 10.0, 4.0, 1.0, 6.0, 11.0, 5.0, 2.0)
+        stats_by_season = {101: {1: ('arsenal',) + stats[1:]}, 100: {2: ('chelsea',) + stats[1:]}}
+        games_data = [dict(game, date='2024-01-01') for game in games_data]
+        rows = views._upcoming_games_rows(games_data, league_names, index, team_seasons, stats_by_season, {})
+        self.assertEqual([(row['home_team_name'], row['away_team_name']) for row in rows], [('Arsenal', 'Chelsea')])
+
+
+def legacy_histogram(reference, values):
+    """The 5-bin loops visualisation_data used before histogram.py, kept as the reference output."""
+    if not reference:
+        return [], []
+    min_val, max_val = min(reference), max(reference)
+    num_bins = 5
+    if min_val == max_val:
+        labels, edges = [f"{min_val:.2f}"], [min_val, max_val]
+    else:
+        bin_width = (max_val - min_val) / num_bins
+        edges = [min_val + i * bin_width for i in range(num_bins + 1)]
+        if edges[num_bins] < max_val: edges[num_bins] = max_val
+        labels = []
+        for i in range(num_bins):
+            upper = f"{edges[i+1]:.2f}" if i == num_bins - 1 else f"<{edges[i+1]:.2f}"
+            labels.append(f"{edges[i]:.2f} - {upper}")
+    freqs = [0] * len(labels)
+    for val in values:
+        for i_bin in range(len(labels)):
+            is_last_bin = i_bin == len(labels) - 1
+            lower_b, upper_b = edges[i_bin], edges[i_bin + 1]
+            if (is_last_bin and lower_b <= val <= upper_b) or (not is_last_bin and lower_b <= val < upper_b):
+                freqs[i_bin] += 1
+    return labels, freqs
+
+
+class HistogramTests(SimpleTestCase):
+    def test_default_bins_match_the_legacy_loops(self):
+        primary = [3, 7, 4.5, 10, 0, 6, 6, 2.25, 9.99]
+        compared = [-1, 0, 5, 10, 11, 2.25]
+        labels, (primary_counts, compared_counts) = build_histograms([primary, compared])
+        self.assertEqual((labels, primary_counts), legacy_histogram(primary, primary))
+        self.assertEqual((labels, compared_counts), legacy_histogram(primary, compared))
+
+    def test_single_value(self):
+        labels, [counts] = build_histograms([[4, 4, 4]])
+        self.assertEqual(labels, ["4.00"])
+        self.assertEqual(counts, [3])
+
+    def test_empty_reference(self):
+        self.assertEqual(build_histograms([[], [1, 2]]), ([], [[], []]))
+
+    def test_integer_bins(self):
+        edges, labels = histogram_edges([0, 1, 2, 3, 4, 5, 6, 7], bins=4, integer=True)
+        self.assertEqual(labels, ["0 - 1", "2 - 3", "4 - 5", "6 - 7"])
+        self.assertEqual(histogram_counts([0, 1, 1, 3, 7, 8], edges), [3, 1, 0, 1])
+        self.assertEqual(histogram_edges([2, 4], bins=5, integer=True)[1], ["2", "3", "4"])
+
+    def test_integer_bins_need_integral_values(self):
+        self.assertEqual(histogram_edges([0, 1.5, 3], bins=2, integer=True)[1], ["0.00 - <1.50", "1.50 - 3.00"])
+        self.assertEqual(histogram_edges([0.0, 2.0, 3.0], bins=2, integer=True)[1], ["0 - 1", "2 - 3"])
+        # The compared dataset is counted on the same edges, so it must be integral too
+        labels, counts = build_histograms([[0, 1, 2, 3], [2.5]], bins=2, integer=True)
+        self.assertEqual(labels, ["0.00 - <1.50", "1.50 - 3.00"])
+        self.assertEqual(counts, [[2, 2], [0, 1]])
+
+    def test_shared_edges_span_every_dataset(self):
+        labels, counts = build_histograms([[0, 1], [0, 10]], bins=2, shared=True)
+        self.assertEqual(labels, ["0.00 - <5.00", "5.00 - 10.00"])
+        self.assertEqual(counts, [[2, 0], [1, 1]])
+
+    def test_parameters(self):
+        self.assertEqual(parse_bins(None), 5)
+        self.assertEqual(parse_bins('x'), 5)
+        self.assertEqual(parse_bins('0'), 1)
+        self.assertEqual(parse_bins('500'), 50)
+        self.assertFalse(parse_flag(None, False))
+        self.assertTrue(parse_flag('auto', True))
+        self.assertTrue(parse_flag('1', False))
+        self.assertFalse(parse_flag('off', True))
+
+
+class CorrelationTests(SimpleTestCase):
+    def test_pearson(self):
+        matrix = np.array([[1.0, 2.0, 5.0], [2.0, 4.0, 3.0], [3.0, 6.0, 4.0], [4.0, 8.0, 1.0]])
+        coefficients, n_rows = correlation_matrix(matrix, 'pearson')
+        self.assertEqual(n_rows, 4)
+        np.testing.assert_allclose(coefficients, np.corrcoef(matrix, rowvar=False))
+        self.assertAlmostEqual(coefficients[0, 1], 1.0)
+
+    def test_spearman_ranks_ties_by_their_average(self):
+        np.testing.assert_array_equal(
+            rank_columns(np.array([[10.0], [20.0], [20.0], [5.0]])), np.array([[2.0], [3.5], [3.5], [1.0]])
+        )
+        # Monotonic but not linear: Spearman 1, Pearson below 1
+        matrix = np.array([[1.0, 1.0], [2.0, 8.0], [3.0, 27.0], [4.0, 64.0]])
+        self.assertAlmostEqual(correlation_matrix(matrix, 'spearman')[0][0, 1], 1.0)
+        self.assertLess(correlation_matrix(matrix, 'pearson')[0][0, 1], 0.99)
+
+    def test_rows_with_missing_values_are_dropped(self):
+        matrix = np.array([[1.0, 2.0], [np.nan, 1.0], [2.0, 4.0], [3.0, 5.0]])
+        coefficients, n_rows = correlation_matrix(matrix)
+        self.assertEqual(n_rows, 3)
+        np.testing.assert_allclose(coefficients, np.corrcoef(matrix[[0, 2, 3]], rowvar=False))
+
+    def test_too_few_rows_and_constant_columns_are_undefined(self):
+        coefficients, n_rows = correlation_matrix(np.array([[1.0, 2.0]]))
+        self.assertEqual(n_rows, 1)
+        self.assertTrue(np.isnan(coefficients).all())
+        coefficients, _ = correlation_matrix(np.array([[1.0, 3.0], [2.0, 3.0], [3.0, 3.0]]))
+        self.assertTrue(np.isnan(coefficients[0, 1]))
+
+    def test_cache_key_follows_the_season_versions(self):
+        old = {1: ('10.3.1', None), 2: ('8.2.1', None)}
+        new = {1: ('12.4.2', None), 2: ('8.2.1', None)}
+        key = _cache_key([2, 1], 'pearson', None, old)
+        self.assertEqual(key, _cache_key([1, 2], 'pearson', None, old))
+        self.assertNotEqual(key, _cache_key([1, 2], 'pearson', None, new))
+        self.assertNotEqual(key, _cache_key([1, 2], 'spearman', None, old))
+        self.assertNotEqual(key, _cache_key([1, 2], 'pearson', None, {}))
+
+
+class SnapshotTypesTests(SimpleTestCase):
+    """A snapshotted season must give the views the same values, of the same types, as PostgreSQL."""
+
+    def setUp(self):
+        catalog._catalog = LeagueCatalog(NEW_ROWS, OLD_ROWS, ttl=3600)
+        self.addCleanup(catalog.invalidate_catalog)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        kpi_values = [Decimal('5.00'), Decimal('4.5'), None, Decimal('7'), Decimal('0.125')]
+        # NUMERIC KPIs with mixed decimal places, an integer game week (NULL once) and points
+        self.rows = []
+        for game_week, value in enumerate(kpi_values, start=1):
+            for team_name in ('Arsenal', 'Chelsea'):
+                row = {
+                    'team_name': team_name, 'opponent_name': 'Everton', 'homeoraway': 'Homegame',
+                    'season': '2022/2023', 'game_week': None if game_week == 3 else game_week,
+                    'stadium_name': None, 'teamid': 1, 'points': 3,
+                }
+                row.update({kpi: value for kpi in db.KPI_COLUMNS})
+                self.rows.append(tuple(row[column] for column in db.TABLE_COLUMNS))
+        with mock.patch.object(db, 'iter_matches', return_value=iter(self.rows)):
+            snapshot.write_season(100, 'v1', None, Path(directory.name))
+        self.season = snapshot.SeasonSnapshot(Path(directory.name) / 'seasons' / '100')
+
+    def database(self, rows, columns=None):
+        cursor = mock.Mock(description=[(column,) for column in columns or []])
+        cursor.fetchall.return_value = rows
+
+        @contextmanager
+        def get_cursor():
+            yield cursor
+
+        return mock.patch.multiple(db, get_cursor=get_cursor, execute=mock.Mock(), pooling_enabled=mock.Mock(return_value=False))
+
+    def by_game_week(self, rows):
+        # ORDER BY game_week, NULLs last
+        return sorted(rows, key=lambda row: (row[db.TABLE_COLUMNS.index('game_week')] is None,
+                                             row[db.TABLE_COLUMNS.index('game_week')] or 0))
+
+    def assertSameValues(self, from_database, from_snapshot):
+        self.assertEqual(from_snapshot, from_database)
+        self.assertEqual(json.dumps(from_snapshot, cls=DjangoJSONEncoder), json.dumps(from_database, cls=DjangoJSONEncoder))
+
+    def test_kpi_series(self):
+        columns = [db.TABLE_COLUMNS.index(column) for column in ('team_name', 'game_week', 'corners_for')]
+        rows = [tuple(row[i] for i in columns) for row in self.by_game_week(self.rows)]
+        with self.database(rows):
+            from_database = db.fetch_kpi_series(100, 'corners_for', ['Arsenal', 'Chelsea'])
+        with mock.patch.object(snapshot, 'snapshot_season', return_value=self.season):
+            from_snapshot = db.fetch_kpi_series(100, 'corners_for', ['Arsenal', 'Chelsea'])
+        self.assertSameValues(from_database, from_snapshot)
+        self.assertEqual([value for _, value in from_snapshot['Arsenal']][:2], [Decimal('5.00'), Decimal('4.5')])
+
+    def test_team_matches(self):
+        columns = [db.TABLE_COLUMNS.index(column) for column in db.MATCH_COLUMNS]
+        rows = [tuple(row[i] for i in columns) for row in self.by_game_week(self.rows) if row[0] == 'Chelsea']
+        with self.database(rows, db.MATCH_COLUMNS):
+            from_database = db.fetch_team_matches(100, 'Chelsea')
+        with mock.patch.object(snapshot, 'snapshot_season', return_value=self.season):
+            from_snapshot = db.fetch_team_matches(100, 'Chelsea')
+        self.assertSameValues(from_database, from_snapshot)
+
+
+class ExportSeasonsTests(SimpleTestCase):
+    @override_settings(EXPORT_MAX_SEASONS=2)
+    def test_duplicate_seasons_count_once_against_the_limit(self):
+        request = RequestFactory().get('/', {'season_id': ['101', '100', '101'], 'league': 'Premier League', 'season': '20232024'})
+        with mock.patch.object(views, 'get_catalog', return_value=LeagueCatalog(NEW_ROWS, OLD_ROWS)), \
+                mock.patch.object(db, 'existing_season_ids', side_effect=lambda ids: ids) as existing, \
+                mock.patch.object(views, 'stream_export', return_value=iter([])):
+            response = views.export_matches(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(existing.call_args.args[0], ['101', '100'])
+
+    @override_settings(EXPORT_MAX_SEASONS=1)
+    def test_too_many_distinct_seasons(self):
+        request = RequestFactory().get('/', {'season_id': ['101', '100']})
+        with mock.patch.object(views, 'get_catalog', return_value=LeagueCatalog(NEW_ROWS, OLD_ROWS)):
+            response = views.export_matches(request)
+        self.assertEqual(response.status_code, 400)
+
+
+class ExplorerCursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        token = explorer.encode_cursor('1234', [7, "Nott'm Forest", '(0,3)'])
+        self.assertNotIn('=', token)
+        self.assertEqual(explorer.decode_cursor(token), ('1234', (7, "Nott'm Forest", '(0,3)')))
+
+    def test_invalid_cursors(self):
+        for token in ('garbage', explorer.encode_cursor('1', [2, 'x', '(0,1)'])[:-3], 'WzEsMl0'):  # the last one is [1,2]
+            with self.assertRaises(explorer.InvalidCursor):
+                explorer.decode_cursor(token)
+
+    def test_keyset_ends_with_the_row_id(self):
+        with mock.patch.object(db.connection, 'vendor', 'postgresql'):
+            sql, params = db.match_window_query(['match_data_1_final'], 'A', after=(7, 'B', '(0,3)'), limit=2)
+        self.assertIn("(COALESCE(game_week, -1), COALESCE(opponent_name, ''), ctid) < (%s, %s, %s::tid)", sql)
+        self.assertIn("ctid DESC", sql)
+        self.assertEqual(params, ['A', 7, 'B', '(0,3)', 2, 2])
+
+    def test_rows_with_the_same_game_week_and_opponent_are_not_skipped(self):
+        # Three rows share game week 7 and opponent B; only the row id tells them apart
+        season_rows = [([7, 'B', '(0,%d)' % row_id], ('A', 'B', row_id)) for row_id in (3, 2, 1)]
+
+        def fetch_match_window(season_ids, team_name, after=None, limit=50, **filters):
+            return [('1', key, values) for key, values in season_rows if after is None or tuple(key) < after][:limit]
+
+        seen = []
+        cursor = None
+        with mock.patch.object(explorer, 'team_seasons', return_value=['1']), \
+                mock.patch.object(db, 'fetch_match_window', side_effect=fetch_match_window):
+            while True:
+                rows, cursor = explorer.explore_matches('A', cursor=cursor, page_size=2)
+                seen.extend(row[-1] for row in rows)
+                if cursor is None:
+                    break
+        self.assertEqual(seen, [3, 2, 1])
+
+
+class ExplorerSeasonsTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        league_catalog = LeagueCatalog(NEW_ROWS, OLD_ROWS)
+        patches = [
+            mock.patch.object(explorer, 'get_catalog', return_value=league_catalog),
+            mock.patch.object(db, 'fetch_team_season_ids', side_effect={'A': [100, 101, 200], 'B': [101, 200]}.get),
+            mock.patch.object(db, 'existing_season_ids', side_effect=lambda ids: [i for i in ids if i != '200']),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_newest_season_first_and_shared_with_the_opponent(self):
+        self.assertEqual(explorer.team_seasons('A'), ['101', '100'])
+        self.assertEqual(explorer.team_seasons('A', 'B'), ['101'])
+
+    def test_season_list_is_computed_once_per_listing(self):
+        explorer.team_seasons('A')
+        explorer.team_seasons('A')
+        self.assertEqual(db.existing_season_ids.call_count, 1)
+
+
+class PoolConnection:
+    """A psycopg2 connection stand-in recording the statements run on it."""
+
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.statements = []
+
+    def cursor(self):
+        return PoolCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+
+class PoolCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.connection.statements.append(sql.split(' (')[0])
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def make_pool(self, minconn=0, maxconn=4, max_prepared=10):
+        patcher = mock.patch('psycopg2.connect', side_effect=lambda **kwargs: PoolConnection())
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        return db.ConnectionPool(minconn, maxconn, 1, max_prepared)
+
+    def run_query(self, pool, sql, params=None):
+        with pool.connection() as conn, conn.cursor() as cursor:
+            pool.execute(cursor, sql, params)
+        return conn
+
+    def test_returned_connections_stay_open(self):
+        pool = self.make_pool(minconn=1)
+        with pool.connection() as first, pool.connection() as second, pool.connection() as third:
+            pass
+        self.assertEqual(self.connect.call_count, 3)
+        for conn in (first, second, third):
+            self.assertFalse(conn.closed)
+            self.assertTrue(conn.autocommit)
+        # Later checkouts reuse them without connecting again
+        with pool.connection(), pool.connection(), pool.connection():
+            pass
+        self.assertEqual(self.connect.call_count, 3)
+        self.assertEqual(pool.stats()['connections_opened'], 3)
+
+    def test_statement_prepared_once_per_connection(self):
+        pool = self.make_pool()
+        sql = "SELECT * FROM t WHERE a = %s"
+        conn = self.run_query(pool, sql, [1])
+        self.assertIs(self.run_query(pool, sql, [2]), conn)
+        name = db._statement_name(sql)
+        self.assertEqual(conn.statements, [f"PREPARE {name} AS SELECT * FROM t WHERE a = $1", f"EXECUTE {name}", f"EXECUTE {name}"])
+        self.assertEqual(pool.stats()['prepared_hits'], 1)
+
+    def test_least_recently_used_statement_deallocated(self):
+        pool = self.make_pool(max_prepared=2)
+        for sql in ("SELECT 1", "SELECT 2", "SELECT 1", "SELECT 3"):
+            conn = self.run_query(pool, sql)
+        self.assertIn(f"DEALLOCATE {db._statement_name('SELECT 2')}", conn.statements)
+        conn.statements.clear()
+        self.run_query(pool, "SELECT 2")
+        self.assertEqual(conn.statements[0], f"PREPARE {db._statement_name('SELECT 2')} AS SELECT 2")
+
+    def test_broken_connection_discarded(self):
+        import psycopg2
+
+        pool = self.make_pool()
+        conn = self.run_query(pool, "SELECT 1")
+        with self.assertRaises(psycopg2.OperationalError):
+            with pool.connection() as broken:
+                raise psycopg2.OperationalError("server closed the connection")
+        self.assertIs(broken, conn)
+        self.assertTrue(conn.closed)
+        # The replacement connection prepares the statement again
+        replacement = self.run_query(pool, "SELECT 1")
+        self.assertIsNot(replacement, conn)
+        self.assertEqual(replacement.statements[0], f"PREPARE {db._statement_name('SELECT 1')} AS SELECT 1")
+
+    def test_connection_closed_while_idle_is_replaced(self):
+        pool = self.make_pool()
+        conn = self.run_query(pool, "SELECT 1")
+        conn.close()
+        replacement = self.run_query(pool, "SELECT 1")
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(replacement.statements[0].startswith("PREPARE"))
+
+    def test_timeout_when_every_connection_is_in_use(self):
+        pool = self.make_pool(maxconn=1)
+        pool.timeout = 0.01
+        with pool.connection():
+            with self.assertRaises(db.PoolTimeout):
+                with pool.connection():
+                    pass
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+
+def driver_cursor_class():
+    """The cursor class of the PostgreSQL driver Django uses here."""
+    if is_psycopg3:
+        import psycopg
+
+        return psycopg.Cursor
+    import psycopg2.extensions
+
+    return psycopg2.extensions.cursor
+
+
+class CopyRowsTests(SimpleTestCase):
+    ROWS = [('Arsenal', None, 'Homegame'), ('Chelsea, FC', 'Arsenal', 'Awaygame')]
+
+    def test_copy_uses_the_installed_driver(self):
+        cursor = mock.create_autospec(driver_cursor_class(), instance=True)
+        with mock.patch.object(ingest, 'COLUMNS', ['team_name', 'opponent_name', 'homeoraway']):
+            ingest.copy_rows(cursor, 'match_data_1_final', self.ROWS)
+        expected_sql = "COPY match_data_1_final (team_name, opponent_name, homeoraway) FROM STDIN WITH (FORMAT csv)"
+        expected_csv = 'Arsenal,,Homegame\r\n"Chelsea, FC",Arsenal,Awaygame\r\n'
+        if is_psycopg3:
+            cursor.copy.assert_called_once_with(expected_sql)
+            cursor.copy.return_value.__enter__.return_value.write.assert_called_once_with(expected_csv)
+        else:
+            sql, buffer = cursor.copy_expert.call_args.args
+            self.assertEqual((sql, buffer.read()), (expected_sql, expected_csv))
+
+    def test_other_databases_insert_in_batches(self):
+        cursor = mock.Mock()
+        with mock.patch.object(ingest.connection, 'vendor', 'sqlite'), mock.patch.object(ingest, 'INSERT_BATCH_SIZE', 1):
+            ingest.copy_rows(cursor, 'match_data_1_final', self.ROWS)
+        self.assertEqual(cursor.executemany.call_count, 2)
+
+
+class StubDatabase:
+    """
+    Answers the game-week rollup and competition team stats queries of db.py and async_db
+    with canned rows. peak_in_flight is the most async queries ever awaited at once; with
+    `gate`, every async query is held until that many are in flight (at most `gate_timeout`
+    seconds), so concurrency is checked without measuring time.
+    """
+
+    def __init__(self, gate=None, gate_timeout=5.0):
+        self.gate = gate
+        self.gate_timeout = gate_timeout
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def rows(self, sql, params):
+        if aggregates.GAMEWEEK_TABLE in sql:
+            return [
+                (season_id, game_week, 2.0 + (season_id + game_week) % 5, 10)
+                for season_id in params[0] for game_week in range(1, 11)
+            ]
+        _, team_ids = params
+        return [(team_id, f"Team {team_id}") + (1.0 + team_id % 4,) * 8 for team_id in team_ids]
+
+    @contextmanager
+    def cursor(self):
+        yield StubCursor(self)
+
+    async def fetchall(self, sql, params=None):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            deadline = time.monotonic() + self.gate_timeout
+            while self.gate and self.peak_in_flight < self.gate and time.monotonic() < deadline:
+                await asyncio.sleep(0.001)
+            return self.rows(sql, params)
+        finally:
+            self.in_flight -= 1
+
+
+class StubCursor:
+    def __init__(self, database):
+        self.database = database
+        self.result = []
+
+    def execute(self, sql, params=None):
+        self.result = self.database.rows(sql, params)
+
+    def fetchall(self):
+        return self.result
+
+
+LEAGUES = ['Bundesliga', 'La Liga', 'Ligue 1', 'Premier League', 'Serie A']
+SEASON_ROWS = [(league, '20242025', 301 + i, 'yes') for i, league in enumerate(LEAGUES)]
+OLD_SEASON_ROWS = [(season_id, league, season_year) for league, season_year, season_id, _ in SEASON_ROWS]
+
+
+class RefreshStateCursor:
+    """Answers the queries of aggregates.refresh_derived: a season table of 10 rows written `changes` times."""
+
+    def __init__(self, changes, state):
+        self.changes = changes
+        self.state = state
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append(' '.join(sql.split()))
+
+    def fetchone(self):
+        sql = self.statements[-1]
+        if sql.startswith("SELECT (SELECT COUNT(*)"):
+            return (10, self.changes)
+        if aggregates.STATE_TABLE in sql:
+            return self.state
+        return (True,)  # the table and its change trigger exist
+
+
+class RefreshDerivedTests(SimpleTestCase):
+    def refresh(self, changes, state, force=False):
+        cursor = RefreshStateCursor(changes, state)
+        rebuild = mock.Mock()
+        with mock.patch.object(aggregates, 'connection') as connection, \
+                mock.patch.object(aggregates.transaction, 'atomic', contextmanager(lambda: (yield))), \
+                mock.patch.object(versions, 'store_season_version') as store_version:
+            connection.cursor.return_value = cursor
+            status = aggregates.refresh_derived(100, 'target', rebuild, force=force)
+        store_version.assert_called_once_with(cursor, 100, 10, changes, changed=force)
+        return status, rebuild, cursor
+
+    def test_unchanged_season_skipped(self):
+        status, rebuild, _ = self.refresh(3, (10, 3))
+        self.assertEqual(status, 'unchanged')
+        rebuild.assert_not_called()
+
+    def test_rows_written_in_place_refresh(self):
+        # Same row count, but the write counter moved
+        status, rebuild, cursor = self.refresh(4, (10, 3))
+        self.assertEqual(status, 'refreshed')
+        rebuild.assert_called_once_with(cursor, 100, 'match_data_100_final')
+        self.assertTrue(cursor.statements[-1].startswith(f"INSERT INTO {aggregates.STATE_TABLE}"))
+
+    def test_never_built_and_forced(self):
+        self.assertEqual(self.refresh(3, None)[0], 'refreshed')
+        self.assertEqual(self.refresh(3, (10, 3), force=True)[0], 'refreshed')
+
+
+class AsyncViewConcurrencyTests(SimpleTestCase):
+    """
+    REQUESTS requests served by the sync views, one after the other, and by the async views
+    on one event loop: the responses must match, and the async views must have every request's
+    API calls and queries in flight at once. The stubs hold each call until that happens, so
+    nothing depends on timing (manage.py benchmark_async measures the speed-up).
+    """
+
+    REQUESTS = 6
+
+    def setUp(self):
+        self.database = StubDatabase()
+        catalog._catalog = LeagueCatalog(SEASON_ROWS, OLD_SEASON_ROWS, ttl=3600)
+        teams.invalidate_team_index()
+        versions.invalidate_versions()
+        patches = [
+            mock.patch.object(db, 'pooling_enabled', return_value=False),
+            mock.patch.object(db, 'get_cursor', self.database.cursor),
+            mock.patch.object(async_db, 'async_enabled', return_value=True),
+            mock.patch.object(async_db, 'fetchall', self.database.fetchall),
+            mock.patch.object(teams, 'load_team_index', return_value=teams.TeamIndex([])),
+            mock.patch.object(versions, 'load_versions', return_value={}),
+            # The template output carries a fresh CSRF token per request; compare the games instead
+            mock.patch.object(views, 'render', side_effect=lambda request, template, context: HttpResponse(
+                json.dumps(context['games'], sort_keys=True)
+            )),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(catalog.invalidate_catalog)
+        self.addCleanup(teams.invalidate_team_index)
+        self.addCleanup(versions.invalidate_versions)
+        self.factory = RequestFactory()
+
+    def serve(self, sync_view, async_view, make_request, db_gate, stub=None, api_gate=None):
+        """(sync responses, async responses); the gates are only applied to the async views."""
+
+        async def serve_concurrently():
+            try:
+                return await asyncio.gather(*(async_view(make_request()) for _ in range(self.REQUESTS)))
+            finally:
+                await fixtures.get_async_fixtures_client().close()
+
+        sync_responses = [sync_view(make_request()) for _ in range(self.REQUESTS)]
+        self.database.gate = db_gate
+        if stub is not None:
+            stub.gate, stub.peak_in_flight = api_gate, 0
+        return sync_responses, asyncio.run(serve_concurrently())
+
+    def test_upcoming_games(self):
+        competition_teams = {301: list(range(1, 7)), 304: list(range(7, 13))}
+        dates = {'startdate': '2024-09-01', 'enddate': '2024-09-03'}
+        with FixturesStubServer(games_per_day=4, teams_by_competition=competition_teams) as stub, \
+                override_settings(FOOTBALL_DATA_API_URL=stub.url, FIXTURES_CACHE_ALIAS=None):
+            fixtures.reset_fixtures_client()
+            self.addCleanup(fixtures.reset_fixtures_client)
+            # Every request fetches 3 dates and queries 2 competitions
+            sync_responses, async_responses = self.serve(
+                views.upcoming_games, views.upcoming_games_async,
+                lambda: self.factory.post('/football/upcoming-games/', dates),
+                db_gate=self.REQUESTS * 2, stub=stub, api_gate=self.REQUESTS * 3,
+            )
+
+        games = json.loads(sync_responses[0].content)
+        self.assertEqual(len(games), 12)
+        self.assertEqual({game['league'] for game in games}, {'Bundesliga', 'Premier League'})
+        for response in sync_responses + async_responses:
+            self.assertEqual(response.content, sync_responses[0].content)
+        self.assertEqual(stub.peak_in_flight, self.REQUESTS * 3)
+        self.assertEqual(self.database.peak_in_flight, self.REQUESTS * 2)
+
+    def test_league_visualisation_data(self):
+        query = {'league': 'Premier League', 'season': '20242025', 'kpi': 'corners_for', 'compare_all': '1'}
+        # Every request reads the rollup of every league with one query
+        sync_responses, async_responses = self.serve(
+            views.league_visualisation_data, views.league_visualisation_data_async,
+            lambda: self.factory.get('/football/league-visualisation/data/', query),
+            db_gate=self.REQUESTS,
+        )
+
+        payload = json.loads(sync_responses[0].content)
+        self.assertEqual(len(payload['time_series_data']['datasets']), len(LEAGUES))
+        for response in sync_responses + async_responses:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content, sync_responses[0].content)
+        self.assertEqual(self.database.peak_in_flight, self.REQUESTS)
+
+
+def brute_force_combinations(leg_log_probs, legs, top):
+    """Every combination of `legs` legs from different fixtures, best `top` by joint log-probability."""
+    scored = []
+    for fixtures in itertools.combinations(range(len(leg_log_probs)), legs):
+        for chosen in itertools.product(*(range(len(leg_log_probs[fixture])) for fixture in fixtures)):
+            score = sum(leg_log_probs[fixture][leg] for fixture, leg in zip(fixtures, chosen))
+            scored.append((score, tuple(zip(fixtures, chosen))))
+    scored.sort(key=lambda item: item[0], reverse=True)
+    return scored[:top]
+
+
+class CombinationTests(SimpleTestCase):
+    def test_parse_market(self):
+        self.assertEqual(combinations.parse_market('corners:9.5'), ('corners', 9.5))
+        for spec in ('goals:2.5', 'corners', 'corners:x', 'corners:-1', 'corners:nan'):
+            with self.assertRaises(combinations.CombinationError):
+                combinations.parse_market(spec)
+
+    def test_total_pmf_and_over_under(self):
+        pmf = combinations.total_pmf(np.array([1.0, 2.0, np.nan]), np.array([0.0, 1.0]))
+        np.testing.assert_allclose(pmf, [0, 0.25, 0.5, 0.25])
+        self.assertEqual(combinations.over_under(pmf, 1.5), (0.75, 0.25))
+        # A total equal to the line is a push
+        self.assertEqual(combinations.over_under(pmf, 2), (0.25, 0.25))
+        self.assertIsNone(combinations.total_pmf(np.array([np.nan]), np.array([1.0])))
+
+    def test_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        for _ in range(20):
+            leg_log_probs = [
+                sorted(np.log(rng.uniform(0.05, 1, size=rng.integers(0, 5))).tolist(), reverse=True)
+                for _ in range(rng.integers(1, 8))
+            ]
+            for legs in (1, 2, 3):
+                for top in (1, 5, 50):
+                    expected = brute_force_combinations(leg_log_probs, legs, top)
+                    result = combinations.top_combinations(leg_log_probs, legs, top)
+                    np.testing.assert_allclose([score for score, _ in result], [score for score, _ in expected])
+                    for score, chosen in result:
+                        self.assertEqual(len({fixture for fixture, _ in chosen}), legs)
+                        self.assertAlmostEqual(score, sum(leg_log_probs[f][leg] for f, leg in chosen))
+
+    def test_too_few_fixtures(self):
+        self.assertEqual(combinations.top_combinations([[-0.1], [], [-0.2]], 3, 10), [])
+        self.assertEqual(combinations.top_combinations([[-0.1]], 1, 0), [])
+
+
+class ColumnarTests(SimpleTestCase):
+    PAYLOAD = {
+        'format': columnar.FORMAT,
+        'game_weeks': columnar.counts([1, 2, 3]),
+        'series': [
+            {'label': 'Arsenal', 'values': columnar.column([5, Decimal('6'), 7])},
+            {'label': 'Chelsea', 'values': columnar.column([Decimal('1.5'), None, 2.0])},
+        ],
+        'mean': Decimal('2.25'),
+        'total': np.int64(9),
+    }
+    EXPECTED = {
+        'format': 'columnar',
+        'game_weeks': [1, 2, 3],
+        'series': [
+            {'label': 'Arsenal', 'values': [5, 6, 7]},
+            {'label': 'Chelsea', 'values': [1.5, None, 2.0]},
+        ],
+        'mean': 2.25,
+        'total': 9,
+    }
+
+    def test_column(self):
+        self.assertEqual(columnar.column([5, Decimal('6')]).dtype, np.int64)
+        self.assertEqual(columnar.column([5, None]).dtype, float)
+        self.assertEqual(columnar.column([5.5, 6]).dtype, float)
+        self.assertEqual(len(columnar.column([])), 0)
+
+    def test_encoders_agree(self):
+        self.assertEqual(json.loads(columnar.encode(self.PAYLOAD)), self.EXPECTED)
+        with mock.patch.object(columnar, 'orjson_available', return_value=False):
+            self.assertEqual(json.loads(columnar.encode(self.PAYLOAD)), self.EXPECTED)
+
+    def test_default_rejects_unknown_types(self):
+        with self.assertRaises(TypeError):
+            columnar._default(object())
+
+    @override_settings(COLUMNAR_GZIP_MIN_BYTES=0)
+    def test_response_encodings(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        request._season_state = ('v1',)
+        cache.delete('columnar:v1')
+        try:
+            response = columnar.columnar_response(request, self.PAYLOAD)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['ETag'], 'W/"v1"')
+            self.assertEqual(json.loads(gzip.decompress(response.content)), self.EXPECTED)
+
+            plain = RequestFactory().get('/')
+            plain._season_state = ('v1',)
+            with mock.patch.object(columnar, 'encode') as encode:
+                response = columnar.cached_response(plain)
+            encode.assert_not_called()
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertIn('Accept-Encoding', response['Vary'])
+            self.assertEqual(json.loads(response.content), self.EXPECTED)
+        finally:
+            cache.delete('columnar:v1')
+
+
+class RegressionTests(SimpleTestCase):
+    def test_exact_fit(self):
+        x = np.array([[1.0, 0.0], [2.0, 1.0], [3.0, 0.0], [4.0, 1.0], [5.0, 3.0]])
+        y = 1.5 + 2.0 * x[:, 0] - 0.5 * x[:, 1]
+        fit = regression.fit_ols(y, x)
+        np.testing.assert_allclose(fit['coefficients'], [1.5, 2.0, -0.5], atol=1e-10)
+        self.assertAlmostEqual(fit['r_squared'], 1.0)
+        self.assertEqual((fit['n_obs'], fit['rank']), (5, 3))
+
+    def test_standard_errors(self):
+        x = np.array([[1.0], [2.0], [3.0], [4.0], [5.0]])
+        y = np.array([2.0, 4.0, 5.0, 4.0, 5.0])
+        fit = regression.fit_ols(y, x)
+        # Textbook simple regression: slope 0.6, intercept 2.2, SSE 2.4 on 3 degrees of freedom
+        np.testing.assert_allclose(fit['coefficients'], [2.2, 0.6])
+        sigma2 = 2.4 / 3
+        np.testing.assert_allclose(fit['std_errors'], [np.sqrt(sigma2 * (1 / 5 + 9 / 10)), np.sqrt(sigma2 / 10)])
+        self.assertAlmostEqual(fit['r_squared'], 0.6)
+        self.assertAlmostEqual(fit['adj_r_squared'], 1 - 0.4 * 4 / 3)
+        self.assertEqual(fit['residuals'], {'min': -0.8, 'q1': -0.6, 'median': -0.2, 'q3': 0.6, 'max': 1.0})
+
+    def test_collinear_predictors_do_not_fail(self):
+        x = np.array([[1.0, 2.0], [2.0, 4.0], [3.0, 6.0], [4.0, 8.0], [5.0, 10.0]])
+        fit = regression.fit_ols(np.array([1.0, 3.0, 2.0, 5.0, 4.0]), x)
+        self.assertEqual(fit['rank'], 2)
+        self.assertTrue(np.isfinite(fit['std_errors']).all())
+
+    def test_too_few_matches(self):
+        with self.assertRaises(regression.RegressionError):
+            regression.fit_ols(np.array([1.0, 2.0]), np.array([[1.0], [2.0]]))
+
+    def test_model_validation(self):
+        for target, predictors in (('nope', ['corners_for']), ('points', []), ('points', ['nope']), ('points', ['points'])):
+            with self.assertRaises(regression.RegressionError):
+                regression.run_regression([1], target, predictors)
+
+    def test_rows_with_missing_values_are_dropped(self):
+        target, predictor = regression.COLUMNS.index('points'), regression.COLUMNS.index('corners_for')
+        matrix = np.full((6, len(regression.COLUMNS)), np.nan)
+        matrix[:, target] = [3.0, 5.0, 7.0, 9.0, np.nan, 100.0]
+        matrix[:, predictor] = [1.0, 2.0, 3.0, 4.0, 5.0, np.nan]
+        with mock.patch.object(db, 'existing_season_ids', side_effect=list), \
+                mock.patch.object(regression, 'load_season_matrices', return_value={1: matrix}):
+            result = regression.run_regression([1], 'points', ['corners_for'])
+        self.assertEqual(result['n_obs'], 4)
+        self.assertEqual([c['estimate'] for c in result['coefficients']], [1.0, 2.0])
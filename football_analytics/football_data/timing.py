@@ -0,0 +1,246 @@
+"""
+Per-request timings: SQL, fixtures API and Python work, reported as a Server-Timing header and a log line.
+
+ServerTimingMiddleware starts a RequestTimings for every request and keeps it in a
+context variable, so the code a request runs records into it without passing it
+around:
+- every query on a Django connection is counted and timed by an execute wrapper
+  (installed on each connection as it is opened), the db.py pool and async_db
+  record theirs with record_query();
+- the fixtures clients time their fetches under 'api';
+- views wrap their aggregation and serialization in span('compute') / span('serialize').
+
+Work handed to a thread pool keeps recording into the request when the function is
+wrapped with propagate(). Durations recorded from several threads at once are
+summed, so 'sql' can exceed the request's wall time.
+
+The header (SERVER_TIMING) reads e.g.
+    Server-Timing: sql;dur=12.4;desc="6 queries", api;dur=81.0, compute;dur=3.2, total;dur=101.7
+Every request is logged on the football_data.timing logger with the same metrics
+as `extra={'timing': {...}}`; requests slower than SLOW_REQUEST_MS are logged as
+warnings together with the text of their queries (at most SLOW_REQUEST_MAX_QUERIES).
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+DEFAULT_SLOW_REQUEST_MS = 1000
+DEFAULT_SLOW_REQUEST_MAX_QUERIES = 50
+# Server-Timing descriptions of the metrics that are worth counting
+METRIC_UNITS = {'sql': 'queries', 'api': 'calls'}
+SQL_LOG_LENGTH = 1000  # characters of each query in the slow-request log
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('football_data_request_timings', default=None)
+_open_spans = contextvars.ContextVar('football_data_open_spans', default=frozenset())
+
+
+class RequestTimings:
+    """Durations (ms) and counts per metric name, plus the first queries of one request."""
+
+    def __init__(self, max_queries=DEFAULT_SLOW_REQUEST_MAX_QUERIES):
+        self.started = time.perf_counter()
+        self.metrics = {}  # name -> [milliseconds, count]
+        self.queries = []  # (sql, milliseconds)
+        self.max_queries = max_queries
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed_ms):
+        with self._lock:
+            metric = self.metrics.setdefault(name, [0.0, 0])
+            metric[0] += elapsed_ms
+            metric[1] += 1
+
+    def add_query(self, sql, elapsed_ms):
+        with self._lock:
+            metric = self.metrics.setdefault('sql', [0.0, 0])
+            metric[0] += elapsed_ms
+            metric[1] += 1
+            if len(self.queries) < self.max_queries:
+                self.queries.append((sql, elapsed_ms))
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def summary(self, total_ms):
+        """{'total_ms', '<name>_ms', '<name>_count'} rounded for logs."""
+        with self._lock:
+            metrics = dict(self.metrics)
+        summary = {'total_ms': round(total_ms, 1)}
+        for name, (elapsed_ms, count) in metrics.items():
+            summary[f"{name}_ms"] = round(elapsed_ms, 1)
+            summary[f"{name}_count"] = count
+        return summary
+
+    def header(self, total_ms):
+        """The Server-Timing header value."""
+        with self._lock:
+            metrics = dict(self.metrics)
+        entries = []
+        for name, (elapsed_ms, count) in metrics.items():
+            entry = f"{name};dur={elapsed_ms:.1f}"
+            if name in METRIC_UNITS:
+                entry += f';desc="{count} {METRIC_UNITS[name]}"'
+            entries.append(entry)
+        entries.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(entries)
+
+
+def current():
+    """The RequestTimings of the running request, or None outside one."""
+    return _current.get()
+
+
+def record(name, elapsed_ms):
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, elapsed_ms)
+
+
+def record_query(sql, elapsed_ms):
+    timings = _current.get()
+    if timings is not None:
+        timings.add_query(sql, elapsed_ms)
+
+
+@contextmanager
+def span(name):
+    """
+    Times the block under name in the running request (a no-op outside one).
+    A span nested in a span of the same name is not counted twice.
+    """
+    open_spans = _open_spans.get()
+    if _current.get() is None or name in open_spans:
+        yield
+        return
+    token = _open_spans.set(open_spans | {name})
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000)
+        _open_spans.reset(token)
+
+
+def timed(name):
+    """Decorator running every call of a function in span(name)."""
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def json_response(payload, **kwargs):
+    """JsonResponse(payload), with the encoding timed under 'serialize'."""
+    from django.http import JsonResponse
+
+    with span('serialize'):
+        return JsonResponse(payload, **kwargs)
+
+
+def propagate(func):
+    """
+    func, run in a copy of the caller's context: for thread pools, whose workers
+    would otherwise not see the running request. Every call gets its own copy, so the
+    wrapper can run on several threads at once.
+    """
+    context = contextvars.copy_context()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return wrapper
+
+
+def query_timer(execute, sql, params, many, context):
+    """Django execute wrapper recording every query into the running request."""
+    if _current.get() is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record_query(sql, (time.perf_counter() - started) * 1000)
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    """connection_created receiver: adds query_timer to a newly opened connection."""
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def _log_request(request, response, timings, total_ms):
+    summary = timings.summary(total_ms)
+    summary.update(method=request.method, path=request.path, status=response.status_code)
+    slow_ms = getattr(settings, 'SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+    metrics = " ".join(f"{key}={value}" for key, value in summary.items() if key.endswith(('_ms', '_count')))
+    if slow_ms is not None and total_ms >= slow_ms:
+        queries = "".join(
+            f"\n  {elapsed_ms:.1f} ms: {' '.join(sql.split())[:SQL_LOG_LENGTH]}" for sql, elapsed_ms in timings.queries
+        )
+        logger.warning(
+            "Slow request %s %s %s %s%s", request.method, request.path, response.status_code, metrics, queries,
+            extra={'timing': summary},
+        )
+    elif logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "%s %s %s %s", request.method, request.path, response.status_code, metrics,
+            extra={'timing': summary},
+        )
+
+
+class ServerTimingMiddleware:
+    """Records the timings of every request, see the module docstring. Works under WSGI and ASGI."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        timings = RequestTimings(getattr(settings, 'SLOW_REQUEST_MAX_QUERIES', DEFAULT_SLOW_REQUEST_MAX_QUERIES))
+        return timings, _current.set(timings)
+
+    def _finish(self, request, response, timings):
+        total_ms = timings.elapsed_ms()
+        if getattr(settings, 'SERVER_TIMING', True):
+            # A streamed response only covers the time to its first byte
+            response['Server-Timing'] = timings.header(total_ms)
+        _log_request(request, response, timings, total_ms)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, timings)
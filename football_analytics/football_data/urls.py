@@ -6,10 +6,21 @@ urlpatterns = [
     path('league-data/', views.league_data_view, name='football_data'),
     path('match-details/<str:team_name>/<str:league>/<int:season>/', views.match_details, name='match_details'),
     path('upcoming-games/', views.upcoming_games, name='upcoming_games'),
+    path('upcoming-games/async/', views.upcoming_games_async, name='upcoming_games_async'),
+    path('upcoming-games/combinations/', views.upcoming_combinations, name='upcoming_combinations'),
+    path('upcoming-games/cache-stats/', views.fixture_cache_stats_view, name='fixture_cache_stats'),
+    path('db-pool-stats/', views.db_pool_stats_view, name='db_pool_stats'),
     path('visualisation/', views.visualisation_view, name='visualisation'),
     path('visualisation/data/', views.visualisation_data, name='visualisation_data'),
+    path('visualisation/trend/', views.team_trend_data, name='team_trend_data'),
     path('league-visualisation/', views.league_visualisation_view, name='league_visualisation'),
     path('league-visualisation/data/', views.league_visualisation_data, name='league_visualisation_data'),
+    path('league-visualisation/data/async/', views.league_visualisation_data_async, name='league_visualisation_data_async'),
     path('get_seasons_for_league/', views.get_seasons_for_league, name='get_seasons_for_league'),
     path('correlations/', views.correlations_view, name='correlations'),
+    path('correlations/data/', views.correlations_data, name='correlations_data'),
+    path('form/data/', views.form_data, name='form_data'),
+    path('regression/data/', views.regression_data, name='regression_data'),
+    path('export/matches/', views.export_matches, name='export_matches'),
+    path('explorer/matches/', views.match_explorer_data, name='match_explorer_data'),
 ]
@@ -0,0 +1,181 @@
+"""
+Per-season data versions and HTTP conditional GET for the season pages.
+
+season_data_versions records, for every season table, its fingerprint (row count
+and write counter, see aggregates.season_fingerprint) and when the season last
+changed: when the fingerprint moved or a forced refresh (ingestion) rewrote rows.
+The version is the fingerprint plus that time. It is written whenever seasons are
+refreshed (manage.py refresh_team_aggregates) and read into memory for
+SEASON_VERSIONS_TTL seconds.
+
+season_conditional() wraps a view with Django's condition decorator so it emits
+a strong ETag and Last-Modified built from the versions of the seasons the
+request touches, and answers If-None-Match / If-Modified-Since with 304 before
+the view runs any query. Requests for seasons without a recorded version get
+neither header and are always computed. Async views are supported: the
+catalog and versions are resolved on a worker thread before the view is awaited.
+"""
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from . import db, snapshot
+from .catalog import get_catalog
+
+
+logger = logging.getLogger(__name__)
+
+
+VERSIONS_TABLE = "season_data_versions"
+DEFAULT_VERSIONS_TTL = 60  # seconds
+
+
+def ensure_versions_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+            season_id INTEGER PRIMARY KEY,
+            row_count BIGINT NOT NULL,
+            checksum BIGINT NOT NULL,  -- the write counter
+            updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def store_season_version(cursor, season_id, row_count, checksum, changed=False):
+    """
+    Records the fingerprint of a season; updated_at only moves when the fingerprint
+    changed, or always with changed=True (the rows were rewritten).
+    """
+    ensure_versions_table(cursor)
+    cursor.execute(f"""
+        INSERT INTO {VERSIONS_TABLE} (season_id, row_count, checksum, updated_at)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (season_id) DO UPDATE
+        SET row_count = EXCLUDED.row_count, checksum = EXCLUDED.checksum, updated_at = EXCLUDED.updated_at
+        WHERE %s OR ({VERSIONS_TABLE}.row_count, {VERSIONS_TABLE}.checksum)
+              IS DISTINCT FROM (EXCLUDED.row_count, EXCLUDED.checksum)
+    """, [season_id, row_count, checksum, changed])
+    invalidate_versions()
+
+
+def version_key(row_count, checksum, updated_at=None):
+    """The version string of a season fingerprint, changed at updated_at when known."""
+    if updated_at is None:
+        return f"{row_count}.{checksum}"
+    return f"{row_count}.{checksum}.{int(updated_at.timestamp() * 1_000_000)}"
+
+
+def load_versions():
+    """
+    Returns {season_id: (version, updated_at)} for every recorded season.
+    With the snapshot backend these are the versions the snapshotted seasons were taken at.
+    """
+    engine = snapshot.get_engine()
+    if engine is not None:
+        return engine.versions()
+    try:
+        with db.get_cursor() as cursor:
+            db.execute(cursor, f"SELECT season_id, row_count, checksum, updated_at FROM {VERSIONS_TABLE}")
+            rows = cursor.fetchall()
+    except Exception as e:
+        logger.warning("Season data versions not available: %s", e)
+        return {}
+    return {
+        season_id: (version_key(row_count, checksum, updated_at), updated_at)
+        for season_id, row_count, checksum, updated_at in rows
+    }
+
+
+_versions = None
+_versions_loaded_at = 0.0
+_versions_lock = threading.Lock()
+
+
+def get_versions():
+    """The shared {season_id: (version, updated_at)} map, reloaded every SEASON_VERSIONS_TTL seconds."""
+    global _versions, _versions_loaded_at
+    ttl = getattr(settings, 'SEASON_VERSIONS_TTL', DEFAULT_VERSIONS_TTL)
+    versions = _versions
+    if versions is None or time.monotonic() - _versions_loaded_at >= ttl:
+        with _versions_lock:
+            if _versions is None or time.monotonic() - _versions_loaded_at >= ttl:
+                _versions = load_versions()
+                _versions_loaded_at = time.monotonic()
+            versions = _versions
+    return versions
+
+
+def invalidate_versions():
+    global _versions
+    with _versions_lock:
+        _versions = None
+
+
+def season_conditional(resolve_season_ids):
+    """
+    Makes a view conditional on the data versions of the seasons it reads.
+    resolve_season_ids(request, *args, **kwargs) returns the season_ids of the request
+    (from the in-memory catalog, without touching the database).
+    """
+
+    def request_state(request, *args, **kwargs):
+        # condition() asks for the ETag and Last-Modified separately; resolve once per request
+        if not hasattr(request, '_season_state'):
+            request._season_state = None
+            catalog = get_catalog()
+            versions = get_versions()
+            season_ids = sorted({str(season_id) for season_id in resolve_season_ids(request, *args, **kwargs)})
+            known = {str(season_id): version for season_id, version in versions.items()}
+            if all(season_id in known for season_id in season_ids):
+                raw = "|".join(
+                    [getattr(settings, 'SEASON_ETAG_SALT', ''), catalog.fingerprint, request.get_full_path()]
+                    + [f"{season_id}:{known[season_id][0]}" for season_id in season_ids]
+                )
+                last_modified = max((known[season_id][1] for season_id in season_ids), default=None)
+                request._season_state = (hashlib.sha256(raw.encode()).hexdigest(), last_modified)
+        return request._season_state
+
+    def etag_func(request, *args, **kwargs):
+        state = request_state(request, *args, **kwargs)
+        return state[0] if state else None
+
+    def last_modified_func(request, *args, **kwargs):
+        state = request_state(request, *args, **kwargs)
+        return state[1] if state else None
+
+    def finalize(response):
+        if response.status_code >= 500:
+            # Don't let caches revalidate a transient failure
+            for header in ('ETag', 'Last-Modified'):
+                if response.has_header(header):
+                    del response[header]
+        elif response.has_header('ETag'):
+            patch_cache_control(response, public=True, max_age=getattr(settings, 'SEASON_HTTP_MAX_AGE', 0))
+        return response
+
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # Loading the catalog or versions may query the database, which can't happen on the event loop
+                await sync_to_async(request_state)(request, *args, **kwargs)
+                return finalize(await conditional_view(request, *args, **kwargs))
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return finalize(conditional_view(request, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
@@ -1,13 +1,31 @@
 from django.shortcuts import render
-from django.db import connection
-import requests
 from datetime import datetime, timedelta
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.conf import settings
 import statistics # For mean, median
 import math     # For sqrt, floor, etc.
 import json # Add this import at the top
+import logging
 from collections import Counter
 
+from . import async_db, columnar, db, timing
+from .catalog import get_catalog
+from .combinations import DEFAULT_LEGS, DEFAULT_TOP, CombinationError, build_combinations, parse_market
+from .correlations import METHODS as CORRELATION_METHODS, get_correlations
+from .explorer import DEFAULT_PAGE_SIZE as EXPLORER_PAGE_SIZE, InvalidCursor, explore_matches
+from .export import FORMATS as EXPORT_FORMATS, stream_export
+from .fixture_stats import aload_competition_team_stats, load_competition_team_stats, resolve_team_seasons
+from .fixtures import fixture_cache_stats, get_async_fixtures_client, get_fixtures_client
+from .histogram import build_histograms, parse_bins, parse_flag
+from .kpis import KPI_LABELS, KPIS
+from .regression import RegressionError, run_regression
+from .teams import get_team_index
+from .versions import season_conditional
+
+
+logger = logging.getLogger(__name__)
+
 
 # Define chart colors and helper functions if they are not imported from elsewhere
 CHART_COLORS = [
@@ -27,28 +45,7 @@ CHART_BG_COLORS_TRANSPARENT = [
     'rgba(255, 159, 64, 0.5)'
 ]
 
-def get_kpi_data_for_team(cursor, table_name, kpi_column, team_name):
-    """
-    Fetches KPI data for a specific team from a given table.
-    Returns a list of tuples (game_week, kpi_value).
-    """
-    # Ensure kpi_column is a valid identifier to prevent SQL injection if it's not from a controlled list.
-    # Here, we assume kpi_column is validated before this function is called (e.g., checked against a list of allowed KPIs).
-    # The f-string for table_name is also an injection risk if season_id isn't strictly controlled.
-    query = f"""
-        SELECT game_week, "{kpi_column}"
-        FROM "{table_name}"
-        WHERE team_name = %s
-        ORDER BY game_week
-    """
-    try:
-        cursor.execute(query, [team_name])
-        return cursor.fetchall()
-    except Exception as e:
-        print(f"Error in get_kpi_data_for_team for {team_name}, KPI {kpi_column} in {table_name}: {e}")
-        # Depending on desired error handling, you might raise e or return None/[]
-        return [] # Return empty list on error to allow main function to continue if possible
-
+@timing.timed('compute')
 def calculate_descriptive_stats(data_values):
     """
     Calculates mean, median, and mode for a list of numeric data_values.
@@ -76,178 +73,124 @@ def calculate_descriptive_stats(data_values):
     return {'mean': mean, 'median': median, 'mode': mode}
 
 
+def selected_season_ids(request, *args, **kwargs):
+    """Season of the league/season query parameters, for season_conditional."""
+    season_id = get_catalog().season_id(request.GET.get('league'), request.GET.get('season'))
+    return [] if season_id is None else [season_id]
+
+
+def match_details_season_ids(request, team_name, league, season):
+    season_id = get_catalog().season_id(league, season)
+    return [] if season_id is None else [season_id]
+
+
+def compare_league_names(query, league):
+    """
+    Comparison leagues of a league visualisation query: repeated compare_league and the
+    compare_league1..4 selects, without duplicates or the primary league, sorted.
+    """
+    names = query.getlist('compare_league') + [query.get(f'compare_league{i}') for i in range(1, 5)]
+    return sorted({name for name in names if name and name.lower() != 'none' and name != league})
+
+
+def compared_league_names(catalog, league, season, compare_leagues, compare_all=False):
+    """The primary league then the comparison leagues, or every other league that has the season with compare_all."""
+    if compare_all:
+        compare_leagues = [
+            name for name in catalog.all_leagues()
+            if name != league and catalog.season_id(name, season) is not None
+        ]
+    return [league] + list(compare_leagues)
+
+
+def compared_leagues_season_ids(request, *args, **kwargs):
+    """Seasons of the primary and comparison leagues, for season_conditional."""
+    catalog = get_catalog()
+    league = request.GET.get('league')
+    season = request.GET.get('season')
+    leagues = compared_league_names(
+        catalog, league, season,
+        compare_league_names(request.GET, league),
+        parse_flag(request.GET.get('compare_all'), False),
+    )
+    season_ids = [catalog.season_id(league, season) for league in leagues]
+    return [season_id for season_id in season_ids if season_id is not None]
+
+
 def get_seasons_for_league(request):
     league_name = request.GET.get('league')
     if not league_name:
         return JsonResponse({'error': 'League parameter missing'}, status=400)
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT DISTINCT season_year 
-                FROM "possible_leagues_and_seasons_NEW" 
-                WHERE name = %s AND data_available like 'yes' 
-                ORDER BY season_year
-            """, [league_name])
-            seasons = [row[0] for row in cursor.fetchall()]
+        seasons = get_catalog().seasons_for_league(league_name)
         return JsonResponse({'seasons': seasons})
     except Exception as e:
         return JsonResponse({'error': 'Error fetching seasons from database.', 'details': str(e)}, status=500)
 
 
+@season_conditional(selected_season_ids)
 def league_data_view(request):
     # Fetch leagues for the filters
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT DISTINCT name FROM "possible_leagues_and_seasons_NEW" WHERE data_available like 'yes' ORDER BY name
-        """
-        )
-        leagues = [row[0] for row in cursor.fetchall()]
+    catalog = get_catalog()
+    leagues = catalog.leagues()
 
     selected_league = request.GET.get('league')
     selected_season = request.GET.get('season') 
     selected_home_or_away = request.GET.get('home_or_away')
     view_type = request.GET.get('view_type', 'averages') # Default to averages
+    try:
+        # Matches per team in the form view
+        window = db.form_window(request.GET.get('window') or None)
+    except ValueError:
+        window = db.form_window()
     
     seasons_for_selected_league = []
     if selected_league:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT DISTINCT season_year 
-                FROM "possible_leagues_and_seasons_NEW" 
-                WHERE name = %s AND data_available like 'yes' 
-                ORDER BY season_year
-            """, [selected_league])
-            seasons_for_selected_league = [row[0] for row in cursor.fetchall()]
+        seasons_for_selected_league = catalog.seasons_for_league(selected_league)
 
     league_data = []
     raw_columns = [] # Store raw column names from DB
     display_columns = [] # Store formatted names for display
 
     if selected_league and selected_season:
-        with connection.cursor() as cursor:
-            cursor.execute("""
-                SELECT season_id
-                FROM "possible_leagues_and_seasons_NEW"
-                WHERE name = %s AND season_year = %s
-            """, [selected_league, selected_season]) 
-            result = cursor.fetchone()
-            if result:
-                season_id = result[0]
-                #print(season_id)
-                table_name = f"match_data_{season_id}_final"
-                #table_name = f"match_data_15050_final"
-
-                # Determine aggregation functions based on view_type
-                if view_type == 'totals':
-                    agg_goals_scored = "SUM(goals_scored)"
-                    agg_goals_conceded = "SUM(goals_conceded)"
-                    agg_corners_for = "SUM(corners_for)"
-                    agg_corners_against = "SUM(corners_against)"
-                    agg_offsides_for = "SUM(offsides_for)"
-                    agg_offsides_against = "SUM(offsides_against)"
-                    agg_yellow_cards_for = "SUM(yellow_cards_for)"
-                    agg_yellow_cards_against = "SUM(yellow_cards_against)"
-                    agg_red_cards_for = "SUM(red_cards_for)"
-                    agg_red_cards_against = "SUM(red_cards_against)"
-                    agg_shotsontarget_for = "SUM(shotsontarget_for)"
-                    agg_shotsontarget_against = "SUM(shotsontarget_against)"
-                    agg_shotsofftarget_for = "SUM(shotsofftarget_for)"
-                    agg_shotsofftarget_against = "SUM(shotsofftarget_against)"
-                    agg_shots_for = "SUM(shots_for)"
-                    agg_shots_against = "SUM(shots_against)"
-                    agg_fouls_for = "SUM(fouls_for)"
-                    agg_fouls_against = "SUM(fouls_against)"
-                    # Possession is an average, so keep it as AVG or handle differently if totals view means something else for possession
-                    agg_possession_for = "ROUND(CAST(AVG(possession_for) AS NUMERIC), 2)" 
-                    agg_possession_against = "ROUND(CAST(AVG(possession_against) AS NUMERIC), 2)"
-                    # Column aliases might need to change too, e.g., total_goals_scored
-                    # For now, keeping original aliases for simplicity, but values will be totals.
-                else: # averages (default)
-                    agg_goals_scored = "ROUND(CAST(AVG(goals_scored) AS NUMERIC), 2)"
-                    agg_goals_conceded = "ROUND(CAST(AVG(goals_conceded) AS NUMERIC), 2)"
-                    agg_corners_for = "ROUND(CAST(AVG(corners_for) AS NUMERIC), 2)"
-                    agg_corners_against = "ROUND(CAST(AVG(corners_against) AS NUMERIC), 2)"
-                    agg_offsides_for = "ROUND(CAST(AVG(offsides_for) AS NUMERIC), 2)"
-                    agg_offsides_against = "ROUND(CAST(AVG(offsides_against) AS NUMERIC), 2)"
-                    agg_yellow_cards_for = "ROUND(CAST(AVG(yellow_cards_for) AS NUMERIC), 2)"
-                    agg_yellow_cards_against = "ROUND(CAST(AVG(yellow_cards_against) AS NUMERIC), 2)"
-                    agg_red_cards_for = "ROUND(CAST(AVG(red_cards_for) AS NUMERIC), 2)"
-                    agg_red_cards_against = "ROUND(CAST(AVG(red_cards_against) AS NUMERIC), 2)"
-                    agg_shotsontarget_for = "ROUND(CAST(AVG(shotsontarget_for) AS NUMERIC), 2)"
-                    agg_shotsontarget_against = "ROUND(CAST(AVG(shotsontarget_against) AS NUMERIC), 2)"
-                    agg_shotsofftarget_for = "ROUND(CAST(AVG(shotsofftarget_for) AS NUMERIC), 2)"
-                    agg_shotsofftarget_against = "ROUND(CAST(AVG(shotsofftarget_against) AS NUMERIC), 2)"
-                    agg_shots_for = "ROUND(CAST(AVG(shots_for) AS NUMERIC), 2)"
-                    agg_shots_against = "ROUND(CAST(AVG(shots_against) AS NUMERIC), 2)"
-                    agg_fouls_for = "ROUND(CAST(AVG(fouls_for) AS NUMERIC), 2)"
-                    agg_fouls_against = "ROUND(CAST(AVG(fouls_against) AS NUMERIC), 2)"
-                    agg_possession_for = "ROUND(CAST(AVG(possession_for) AS NUMERIC), 2)"
-                    agg_possession_against = "ROUND(CAST(AVG(possession_against) AS NUMERIC), 2)"
-
-                query = f"""
-                    SELECT 
-                        team_name,
-                        count(points) AS games_played,
-                        SUM(points) AS total_points,
-                        {agg_goals_scored} AS avg_goals_scored,
-                        {agg_goals_conceded} AS avg_goals_conceded,
-                        {agg_corners_for} AS avg_corners_for,
-                        {agg_corners_against} AS avg_corners_against,
-                        {agg_offsides_for} AS avg_offsides_for,
-                        {agg_offsides_against} AS avg_offsides_against,
-                        {agg_yellow_cards_for} AS avg_yellow_cards_for,
-                        {agg_yellow_cards_against} AS avg_yellow_cards_against,
-                        {agg_red_cards_for} AS avg_red_cards_for,
-                        {agg_red_cards_against} AS avg_red_cards_against,
-                        {agg_shotsontarget_for} AS avg_shotsontarget_for,
-                        {agg_shotsontarget_against} AS avg_shotsontarget_against,
-                        {agg_shotsofftarget_for} AS avg_shotsofftarget_for,
-                        {agg_shotsofftarget_against} AS avg_shotsofftarget_against,
-                        {agg_shots_for} AS avg_shots_for,
-                        {agg_shots_against} AS avg_shots_against,
-                        {agg_fouls_for} AS avg_fouls_for,
-                        {agg_fouls_against} AS avg_fouls_against,
-                        {agg_possession_for} AS avg_possession_for,
-                        {agg_possession_against} AS avg_possession_against
-                    FROM {table_name}
-                """
-
-                if selected_home_or_away:
-                    query += " WHERE homeoraway = %s"
-                    params = [selected_home_or_away]
-                else:
-                    params = []
-
-                query += " GROUP BY team_name ORDER BY total_points DESC;"
-                cursor.execute(query, params)
-                league_data = cursor.fetchall()
-                
-                if league_data: # Ensure there's data before processing columns
-                    raw_columns = [col[0] for col in cursor.description]
-                    for col_name in raw_columns:
-                        # Specific transformations for certain column names if needed, then general rule
-                        if col_name == "team_name":
-                            display_columns.append("Team Name")
-                        elif col_name == "games_played":
-                            display_columns.append("Games Played")
-                        elif col_name == "total_points":
-                            display_columns.append("Total Points")
-                        # Add more specific cases if title() isn't perfect for all
-                        else:
-                            # General rule: replace underscores, then title case
-                            # Remove "avg_" or "total_" prefix for a cleaner name, then Title Case
-                            name_to_format = col_name
-                            if name_to_format.startswith("avg_"):
-                                name_to_format = name_to_format[4:]
-                            elif name_to_format.startswith("total_"): # Though we are not using total_ prefixes in aliases yet
-                                name_to_format = name_to_format[6:]
-                            
-                            display_columns.append(name_to_format.replace('_', ' ').title())
-                else:
-                    display_columns = [] # No data, no columns to display or handle appropriately
-            else: # No season_id found
-                league_data = []
-                display_columns = []
+        season_id = catalog.season_id(selected_league, selected_season)
+        if season_id is not None:
+            # Read the precomputed aggregates (manage.py refresh_team_aggregates), falling back
+            # to aggregating the season table when the season has not been built yet
+            if view_type == 'form':
+                # Last `window` matches of every team, averages only
+                league_data, raw_columns = db.fetch_team_form(season_id, window, selected_home_or_away)
+                kept = [i for i, col_name in enumerate(raw_columns) if not col_name.startswith("sum_")]
+                league_data = [tuple(row[i] for i in kept) for row in league_data]
+                raw_columns = [raw_columns[i] for i in kept]
+            else:
+                league_data, raw_columns = db.fetch_team_aggregates(season_id, view_type, selected_home_or_away)
+            
+            if league_data: # Ensure there's data before processing columns
+                for col_name in raw_columns:
+                    # Specific transformations for certain column names if needed, then general rule
+                    if col_name == "team_name":
+                        display_columns.append("Team Name")
+                    elif col_name == "games_played":
+                        display_columns.append("Games Played")
+                    elif col_name == "total_points":
+                        display_columns.append("Total Points")
+                    # Add more specific cases if title() isn't perfect for all
+                    else:
+                        # General rule: replace underscores, then title case
+                        # Remove "avg_" or "total_" prefix for a cleaner name, then Title Case
+                        name_to_format = col_name
+                        if name_to_format.startswith("avg_"):
+                            name_to_format = name_to_format[4:]
+                        elif name_to_format.startswith("total_"): # Though we are not using total_ prefixes in aliases yet
+                            name_to_format = name_to_format[6:]
+                        
+                        display_columns.append(name_to_format.replace('_', ' ').title())
+            else:
+                display_columns = [] # No data, no columns to display or handle appropriately
+        else: # No season_id found
+            league_data = []
+            display_columns = []
 
     context = {
         'league_data': league_data,
@@ -258,67 +201,26 @@ def league_data_view(request):
         'selected_season': selected_season,
         'selected_home_or_away': selected_home_or_away,
         'view_type': view_type, # Pass view_type to the template
+        'window': window,
     }
-    return render(request, 'football_data/league_data.html', context)
+    with timing.span('render'):
+        return render(request, 'football_data/league_data.html', context)
 
 
 
 
+@season_conditional(match_details_season_ids)
 def match_details(request, team_name, league, season):
     # Fetch the season_id for the given league and season year
-    with connection.cursor() as cursor:
-        cursor.execute("""
-            SELECT season_id
-            FROM possible_leagues_and_seasons
-            WHERE name = %s AND season_year = %s
-        """, [league, season])
-        result = cursor.fetchone()
-        
-        if not result:
-            # Handle case where no season_id is found
-            return render(request, 'football_data/match_details.html', {
-                'error_message': "Season ID not found for the selected league and season.",
-            })
+    season_id = get_catalog().season_id(league, season)
+    if season_id is None:
+        # Handle case where no season_id is found
+        return render(request, 'football_data/match_details.html', {
+            'error_message': "Season ID not found for the selected league and season.",
+        })
 
-        season_id = result[0]
-        table_name = f"match_data_{season_id}_final"  # Use the correct season_id to construct the table name
-
-        # Fetch specific columns for the selected team
-        query = f"""
-            SELECT 
-                team_name,
-                opponent_name,
-                homeoraway,
-                season,
-                game_week,
-                goals_scored,
-                goals_conceded,
-                corners_for,
-                corners_against,
-                offsides_for,
-                offsides_against,
-                yellow_cards_for,
-                yellow_cards_against,
-                red_cards_for,
-                red_cards_against,
-                shotsontarget_for,
-                shotsontarget_against,
-                shotsofftarget_for,
-                shotsofftarget_against,
-                shots_for,
-                shots_against,
-                fouls_for,
-                fouls_against,
-                possession_for,
-                possession_against,
-                stadium_name
-            FROM {table_name}
-            WHERE team_name = %s
-            ORDER BY game_week
-        """
-        cursor.execute(query, [team_name])  # Only parameterize values, not table names
-        match_data = cursor.fetchall()
-        columns = [col[0] for col in cursor.description]  # Extract column names
+    # Fetch the match columns for the selected team
+    match_data, columns = db.fetch_team_matches(season_id, team_name)
 
     context = {
         'team_name': team_name,
@@ -333,224 +235,239 @@ def match_details(request, team_name, league, season):
 
 
 
+def convert_season_format(season):
+    """Convert season from '2024/2025' format to '20242025' format"""
+    if not season or season == "NA":
+        return "NA"
+    # Remove any slashes and spaces
+    return season.replace('/', '').replace(' ', '')
+
+
+def _upcoming_date_range(data):
+    """The dates of the submitted range (request.POST or request.GET), or None when a date is malformed."""
+    # Get startdate and enddate from the form
+    startdate = data.get("startdate")
+    enddate = data.get("enddate")
+
+    # Convert startdate and enddate to datetime objects
+    try:
+        start_date = datetime.strptime(startdate, "%Y-%m-%d")
+        end_date = datetime.strptime(enddate, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return None
+
+    # Generate the date range
+    return [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+
+
+def _upcoming_league_names(catalog, team_index, team_seasons):
+    # League names come from the catalog, keyed by competition_id (== season_id). A competition
+    # the catalog doesn't know yet (e.g. a new season) gets the league of the seasons its teams
+    # were resolved to in the team dimension, when they all agree
+    resolved_leagues = {}
+    for (competition_id, _), season_id in team_seasons.items():
+        resolved_leagues.setdefault(competition_id, set()).add(team_index.league_name(season_id))
+    league_names = {}
+    for competition_id, leagues in resolved_leagues.items():
+        league_name = catalog.league_name(competition_id)
+        if league_name is None and len(leagues) == 1:
+            league_name = next(iter(leagues))
+        if league_name is not None:
+            league_names[competition_id] = league_name
+    return league_names
+
+
+@timing.timed('compute')
+def _upcoming_games_rows(games_data, league_names, team_index, team_seasons, stats_by_season, season_timings):
+    """
+    Joins the fixtures with the league names and the team metrics of each team's resolved
+    season (see resolve_team_seasons); games missing any of them are dropped. Team names
+    come from the team dimension, else from the season's match rows.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        timings_summary = ", ".join(f"{season_id}: {ms} ms" for season_id, ms in season_timings.items())
+        logger.debug("upcoming_games season lookups (%d): %s", len(season_timings), timings_summary)
+
+    def team_stats(competition_id, team_id):
+        season_id = team_seasons.get((competition_id, team_id), competition_id)
+        stats = stats_by_season.get(season_id, {}).get(team_id)
+        team_name = team_index.team_name(team_id, season_id)
+        if stats is None or team_name is None:
+            return stats
+        return (team_name,) + tuple(stats[1:])
+
+    def calculate_difference(metric1, metric2):
+        try:
+            return round(abs(float(metric1) - float(metric2)), 2)
+        except (ValueError, TypeError):
+            return "NA"
+
+    def form_value(metric):
+        # Form averages are NULL when a team's last matches have no value for the KPI
+        return "NA" if metric is None else round(float(metric), 2)
+
+    games = []
+    for game in games_data:
+        competition_id = game["competition_id"]
+        home_id = game["homeID"]
+        away_id = game["awayID"]
+
+        # Get league name
+        league_name = league_names.get(competition_id, "NA")
+
+        # Get team names and metrics
+        home_stats = team_stats(competition_id, home_id) or ("NA",) * 9
+        away_stats = team_stats(competition_id, away_id) or ("NA",) * 9
+        home_team_name, home_metrics = home_stats[0], home_stats[1:]
+        away_team_name, away_metrics = away_stats[0], away_stats[1:]
+
+        # Check for "NA" values
+        if "NA" in [league_name, home_team_name, away_team_name] or "NA" in home_metrics or "NA" in away_metrics:
+            continue  # Skip this game if any "NA" value exists
+
+        # Calculate differences
+        corners_diff = calculate_difference(home_metrics[0], away_metrics[0])
+        shots_diff = calculate_difference(home_metrics[1], away_metrics[1])
+        shots_on_target_diff = calculate_difference(home_metrics[2], away_metrics[2])
+        yellow_cards_diff = calculate_difference(home_metrics[3], away_metrics[3])
+
+        # Append game to the final list
+        games.append({
+            "date": game["date"],
+            "season": convert_season_format(game.get("season", "NA")),
+            "status": game.get("status", "NA"),
+            "roundID": game.get("roundID", "NA"),
+            "game_week": game.get("game_week", "NA"),
+            "league": league_name,
+            "home_team_name": home_team_name,
+            "away_team_name": away_team_name,
+            "home_corners_avg": round(float(home_metrics[0]), 2),
+            "away_corners_avg": round(float(away_metrics[0]), 2),
+            "corners_diff": corners_diff,
+            "home_shots": round(float(home_metrics[1]), 2),
+            "away_shots": round(float(away_metrics[1]), 2),
+            "shots_diff": shots_diff,
+            "home_shots_on_target": round(float(home_metrics[2]), 2),
+            "away_shots_on_target": round(float(away_metrics[2]), 2),
+            "shots_on_target_diff": shots_on_target_diff,
+            "home_yellow_cards": round(float(home_metrics[3]), 2),
+            "away_yellow_cards": round(float(away_metrics[3]), 2),
+            "yellow_cards_diff": yellow_cards_diff,
+            # Averages over each team's last FORM_WINDOW matches
+            "home_corners_form": form_value(home_metrics[4]),
+            "away_corners_form": form_value(away_metrics[4]),
+            "home_shots_form": form_value(home_metrics[5]),
+            "away_shots_form": form_value(away_metrics[5]),
+            "home_shots_on_target_form": form_value(home_metrics[6]),
+            "away_shots_on_target_form": form_value(away_metrics[6]),
+            "home_yellow_cards_form": form_value(home_metrics[7]),
+            "away_yellow_cards_form": form_value(away_metrics[7]),
+            "comp_id": competition_id
+        })
+    return games
+
+
+INVALID_DATES_MESSAGE = "Invalid date format. Please enter dates in YYYY-MM-DD format."
+
+
 def upcoming_games(request):
     games = []
     error_message = None
 
-    def convert_season_format(season):
-        """Convert season from '2024/2025' format to '20242025' format"""
-        if not season or season == "NA":
-            return "NA"
-        # Remove any slashes and spaces
-        return season.replace('/', '').replace(' ', '')
-
     if request.method == "POST":
-        # Get startdate and enddate from the form
-        startdate = request.POST.get("startdate")
-        enddate = request.POST.get("enddate")
+        date_range = _upcoming_date_range(request.POST)
+        if date_range is None:
+            error_message = INVALID_DATES_MESSAGE
+            return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
+
+        try:
+            # Fetch matches for all dates concurrently; games come back in date order
+            games_data = get_fixtures_client().fetch_range(date_range)
+        except Exception as e:
+            error_message = f"Error fetching data from API: {e}"
+            return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
 
-        # Convert startdate and enddate to datetime objects
         try:
-            start_date = datetime.strptime(startdate, "%Y-%m-%d")
-            end_date = datetime.strptime(enddate, "%Y-%m-%d")
-        except ValueError:
-            error_message = "Invalid date format. Please enter dates in YYYY-MM-DD format."
+            # Resolve every fixture team to the season its stats are read from (the fixture's
+            # competition, else the team's latest season) and group the team IDs by season
+            team_index = get_team_index()
+            team_seasons, season_teams = resolve_team_seasons(games_data, team_index)
+            league_names = _upcoming_league_names(get_catalog(), team_index, team_seasons)
+            # Team metrics (and the names of teams missing from the dimension), one query
+            # per season restricted to its own teams, run concurrently
+            stats_by_season, season_timings = load_competition_team_stats(season_teams)
+        except Exception as e:
+            error_message = f"Database error: {e}"
             return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
 
-        # API Key and Base URL
-        api_key = "928d7e45d921850a05f77b1f6e3fb7b137bd6184c447a44c9d9f6f0cab380ff9"
-        base_url = "https://api.football-data-api.com/todays-matches"
+        games = _upcoming_games_rows(games_data, league_names, team_index, team_seasons, stats_by_season, season_timings)
 
-        # Generate the date range
-        date_range = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    with timing.span('render'):
+        return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
 
-        # Store all fetched games temporarily
-        games_data = []
+
+async def upcoming_games_async(request):
+    """
+    upcoming_games for ASGI: the dates are fetched concurrently with httpx and the
+    competitions looked up concurrently on async connections, without holding a worker thread.
+    """
+    games = []
+    error_message = None
+
+    if request.method == "POST":
+        date_range = _upcoming_date_range(request.POST)
+        if date_range is None:
+            error_message = INVALID_DATES_MESSAGE
+            return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
 
         try:
-            # Fetch matches for all dates
-            for date in date_range:
-                params = {
-                    "key": api_key,
-                    "date": date.strftime('%Y-%m-%d'),
-                }
-                response = requests.get(base_url, params=params)
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get("success"):
-                        for game in data["data"]:
-                            game["date"] = date.strftime('%Y-%m-%d')  # Add the date to the game
-                            games_data.append(game)
-                else:
-                    print(f"API error for {date.strftime('%Y-%m-%d')}: {response.status_code}")
+            games_data = await get_async_fixtures_client().fetch_range(date_range)
         except Exception as e:
             error_message = f"Error fetching data from API: {e}"
             return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
 
-        # Extract unique competition IDs and team IDs
-        competition_ids = {game["competition_id"] for game in games_data}
-        team_ids = {game["homeID"] for game in games_data}.union({game["awayID"] for game in games_data})
-
-        # Bulk query for league names and team metrics
-        league_names = {}
-        team_metrics_by_competition = {}
-        team_names_by_competition = {}
-
         try:
-            with connection.cursor() as cursor:
-                # Fetch league names
-                cursor.execute("""
-                    SELECT season_id, name
-                    FROM possible_leagues_and_seasons
-                    WHERE season_id IN %s
-                """, [tuple(competition_ids)])
-                league_names = dict(cursor.fetchall())
-
-                # Fetch team names and metrics, isolating by competition
-                for competition_id in competition_ids:
-                    try:
-                        # Team Names
-                        cursor.execute(f"""
-                            SELECT teamid, team_name
-                            FROM match_data_{competition_id}_final
-                            WHERE teamid IN %s
-                        """, [tuple(team_ids)])
-                        team_names_by_competition[competition_id] = {row[0]: row[1] for row in cursor.fetchall()}
-
-                        # Team Metrics
-                        cursor.execute(f"""
-                            SELECT teamid, 
-                                   AVG(corners_for) AS corners_avg, 
-                                   AVG(shots_for) AS shots_avg, 
-                                   AVG(shotsontarget_for) AS shots_on_target_avg,
-                                   AVG(yellow_cards_for) AS yellow_cards_avg
-                            FROM match_data_{competition_id}_final
-                            WHERE teamid IN %s
-                            GROUP BY teamid
-                        """, [tuple(team_ids)])
-                        team_metrics_by_competition[competition_id] = {row[0]: row[1:] for row in cursor.fetchall()}
-                    except Exception as e:
-                        print(f"Skipping table for competition ID {competition_id}: {e}")
-                        continue
+            team_index = await sync_to_async(get_team_index)()
+            team_seasons, season_teams = resolve_team_seasons(games_data, team_index)
+            league_names = _upcoming_league_names(await sync_to_async(get_catalog)(), team_index, team_seasons)
+            stats_by_season, season_timings = await aload_competition_team_stats(season_teams)
         except Exception as e:
             error_message = f"Database error: {e}"
             return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
 
-        # Process games data
-        for game in games_data:
-            competition_id = game["competition_id"]
-            home_id = game["homeID"]
-            away_id = game["awayID"]
-
-            # Get league name
-            league_name = league_names.get(competition_id, "NA")
-
-            # Get team names
-            team_names = team_names_by_competition.get(competition_id, {})
-            home_team_name = team_names.get(home_id, "NA")
-            away_team_name = team_names.get(away_id, "NA")
-
-            # Get metrics
-            team_metrics = team_metrics_by_competition.get(competition_id, {})
-            home_metrics = team_metrics.get(home_id, ("NA", "NA", "NA", "NA"))
-            away_metrics = team_metrics.get(away_id, ("NA", "NA", "NA", "NA"))
-
-            # Check for "NA" values
-            if "NA" in [league_name, home_team_name, away_team_name] or "NA" in home_metrics or "NA" in away_metrics:
-                continue  # Skip this game if any "NA" value exists
-
-            # Calculate differences
-            def calculate_difference(metric1, metric2):
-                try:
-                    return round(abs(float(metric1) - float(metric2)), 2)
-                except (ValueError, TypeError):
-                    return "NA"
-
-            corners_diff = calculate_difference(home_metrics[0], away_metrics[0])
-            shots_diff = calculate_difference(home_metrics[1], away_metrics[1])
-            shots_on_target_diff = calculate_difference(home_metrics[2], away_metrics[2])
-            yellow_cards_diff = calculate_difference(home_metrics[3], away_metrics[3])
-
-            # Append game to the final list
-            games.append({
-                "date": game["date"],
-                "season": convert_season_format(game.get("season", "NA")),
-                "status": game.get("status", "NA"),
-                "roundID": game.get("roundID", "NA"),
-                "game_week": game.get("game_week", "NA"),
-                "league": league_name,
-                "home_team_name": home_team_name,
-                "away_team_name": away_team_name,
-                "home_corners_avg": round(float(home_metrics[0]), 2),
-                "away_corners_avg": round(float(away_metrics[0]), 2),
-                "corners_diff": corners_diff,
-                "home_shots": round(float(home_metrics[1]), 2),
-                "away_shots": round(float(away_metrics[1]), 2),
-                "shots_diff": shots_diff,
-                "home_shots_on_target": round(float(home_metrics[2]), 2),
-                "away_shots_on_target": round(float(away_metrics[2]), 2),
-                "shots_on_target_diff": shots_on_target_diff,
-                "home_yellow_cards": round(float(home_metrics[3]), 2),
-                "away_yellow_cards": round(float(away_metrics[3]), 2),
-                "yellow_cards_diff": yellow_cards_diff,
-                "comp_id": competition_id
-            })
+        games = _upcoming_games_rows(games_data, league_names, team_index, team_seasons, stats_by_season, season_timings)
+
+    with timing.span('render'):
+        return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
+
+
+def fixture_cache_stats_view(request):
+    """Hit/miss counters of the per-date fixture cache used by upcoming_games."""
+    return JsonResponse(fixture_cache_stats())
+
 
-    return render(request, "football_data/upcoming_games.html", {"games": games, "error_message": error_message})
+def db_pool_stats_view(request):
+    """Saturation metrics of the database connection pool used by the data views."""
+    return JsonResponse(db.pool_stats())
 
 
 def visualisation_view(request):
     # Fetch leagues for the dropdown
-    with connection.cursor() as cursor:
-        cursor.execute('''SELECT DISTINCT name FROM "possible_leagues_and_seasons_NEW" WHERE data_available like 'yes' ORDER BY name''')
-        leagues = [row[0] for row in cursor.fetchall()]
+    catalog = get_catalog()
+    leagues = catalog.leagues()
     # KPI list: (value, display_label)
-    kpis = [
-        ('goals_scored', 'Goals Scored'),
-        ('goals_conceded', 'Goals Conceded'),
-        ('corners_for', 'Corners For'),
-        ('corners_against', 'Corners Against'),
-        ('offsides_for', 'Offsides For'),
-        ('offsides_against', 'Offsides Against'),
-        ('yellow_cards_for', 'Yellow Cards For'),
-        ('yellow_cards_against', 'Yellow Cards Against'),
-        ('red_cards_for', 'Red Cards For'),
-        ('red_cards_against', 'Red Cards Against'),
-        ('shotsontarget_for', 'Shots On Target For'),
-        ('shotsontarget_against', 'Shots On Target Against'),
-        ('shotsofftarget_for', 'Shots Off Target For'),
-        ('shotsofftarget_against', 'Shots Off Target Against'),
-        ('shots_for', 'Shots For'),
-        ('shots_against', 'Shots Against'),
-        ('fouls_for', 'Fouls For'),
-        ('fouls_against', 'Fouls Against'),
-        ('possession_for', 'Possession For'),
-        ('possession_against', 'Possession Against'),
-    ]
+    kpis = KPIS
     selected_league = request.GET.get('league')
     selected_season = request.GET.get('season')
     seasons = []
     teams_for_js = [] # Default to an empty Python list for json_script
 
     if selected_league:
-        with connection.cursor() as cursor:
-            cursor.execute(
-                '''SELECT DISTINCT season_year FROM "possible_leagues_and_seasons_NEW" WHERE name = %s AND data_available like \'yes\' ORDER BY season_year''',
-                [selected_league]
-            )
-            seasons = [row[0] for row in cursor.fetchall()]
+        seasons = catalog.seasons_for_league(selected_league)
         if selected_season:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    '''SELECT season_id FROM "possible_leagues_and_seasons" WHERE name = %s AND season_year = %s''',
-                    [selected_league, selected_season]
-                )
-                result = cursor.fetchone()
-                if result:
-                    season_id = result[0]
-                    table_name = f'match_data_{season_id}_final'
-                    cursor.execute(f'''SELECT DISTINCT team_name FROM "{table_name}" ORDER BY team_name''')
-                    teams_for_js = [row[0] for row in cursor.fetchall()] # Assign the Python list here
+            season_id = catalog.season_id(selected_league, selected_season)
+            if season_id is not None:
+                teams_for_js = db.fetch_team_names(season_id) # Assign the Python list here
     
     return render(request, 'football_data/visualisation.html', {
         'leagues': leagues,
@@ -561,6 +478,33 @@ def visualisation_view(request):
         'selected_season': selected_season,
     })
 
+def _columnar_charts(series, histogram=None):
+    """
+    The charts of a visualisation payload in the columnar format: the colours once, then every
+    series as its label, its colour index and its values. series is [(label, values)] and
+    histogram (bin labels, [(label, counts)]), both in colour order.
+    """
+    charts = {
+        'colors': CHART_COLORS,
+        'background_colors': CHART_BG_COLORS_TRANSPARENT,
+        'series': [
+            {'label': label, 'color': position % len(CHART_COLORS), 'values': columnar.column(values)}
+            for position, (label, values) in enumerate(series)
+        ],
+    }
+    if histogram is not None:
+        bin_labels, histogram_series = histogram
+        charts['histogram'] = {
+            'labels': bin_labels,
+            'series': [
+                {'label': label, 'color': position % len(CHART_COLORS), 'counts': columnar.counts(frequencies)}
+                for position, (label, frequencies) in enumerate(histogram_series)
+            ],
+        }
+    return charts
+
+
+@season_conditional(selected_season_ids)
 def visualisation_data(request):
     league = request.GET.get('league')
     season_year_str = request.GET.get('season')
@@ -575,155 +519,120 @@ def visualisation_data(request):
     # Ensure unique comparison teams
     compare_teams_names = sorted(list(set(compare_teams_names)))
 
-    print(f"DEBUG: VisData: Primary={primary_team_name}, Compare={compare_teams_names}, KPI={kpi_value}")
+    logger.debug("VisData: Primary=%s, Compare=%s, KPI=%s", primary_team_name, compare_teams_names, kpi_value)
 
     if not (league and season_year_str and kpi_value and primary_team_name):
         return JsonResponse({'error': 'Missing primary selection parameters (league, season, KPI, or team)'}, status=400)
 
-    # Define KPIs directly in this view to avoid issues with calling visualisation_view(None)
-    kpis = [
-        ('goals_scored', 'Goals Scored'),
-        ('goals_conceded', 'Goals Conceded'),
-        ('corners_for', 'Corners For'),
-        ('corners_against', 'Corners Against'),
-        ('offsides_for', 'Offsides For'),
-        ('offsides_against', 'Offsides Against'),
-        ('yellow_cards_for', 'Yellow Cards For'),
-        ('yellow_cards_against', 'Yellow Cards Against'),
-        ('red_cards_for', 'Red Cards For'),
-        ('red_cards_against', 'Red Cards Against'),
-        ('shotsontarget_for', 'Shots On Target For'),
-        ('shotsontarget_against', 'Shots On Target Against'),
-        ('shotsofftarget_for', 'Shots Off Target For'),
-        ('shotsofftarget_against', 'Shots Off Target Against'),
-        ('shots_for', 'Shots For'),
-        ('shots_against', 'Shots Against'),
-        ('fouls_for', 'Fouls For'),
-        ('fouls_against', 'Fouls Against'),
-        ('possession_for', 'Possession For'),
-        ('possession_against', 'Possession Against'),
-    ]
+    kpis = KPIS
     kpis_definition = kpis # Use the directly defined list
     kpi_display_name = dict(kpis_definition).get(kpi_value, kpi_value)
 
+    # Histogram options: bin count, opt-in whole-number bins, edges from every team
+    hist_bins = parse_bins(request.GET.get('bins'))
+    hist_integer = parse_flag(request.GET.get('integer_bins'), False)
+    hist_shared_edges = parse_flag(request.GET.get('shared_edges'), False)
+
     all_descriptive_stats = {}
     time_series_datasets = []
     histogram_datasets = []
     primary_team_game_weeks = []
     primary_team_kpi_numeric_values = []
 
-    try:
-        with connection.cursor() as cursor:
-            cursor.execute('''SELECT season_id FROM possible_leagues_and_seasons WHERE name = %s AND season_year = %s''', [league, season_year_str])
-            db_season_result = cursor.fetchone()
-            if not db_season_result:
-                return JsonResponse({'error': 'Invalid league or season for season_id lookup'}, status=400)
-            season_id = db_season_result[0]
-            table_name = f"match_data_{season_id}_final"
-
-            if kpi_value not in dict(kpis_definition):
-                return JsonResponse({'error': 'Invalid KPI'}, status=400)
-
-            # --- Process Primary Team ---
-            raw_primary_data = get_kpi_data_for_team(cursor, table_name, kpi_value, primary_team_name)
-            if not raw_primary_data:
-                return JsonResponse({'error': f'No data found for primary team {primary_team_name} and KPI {kpi_display_name}'}, status=404)
-
-            primary_team_game_weeks = [row[0] for row in raw_primary_data]
-            primary_team_kpi_raw_values = [row[1] for row in raw_primary_data]
-            primary_team_kpi_numeric_values = [float(v) for v in primary_team_kpi_raw_values if v is not None]
-            
-            if not primary_team_kpi_numeric_values:
-                 return JsonResponse({'error': f'KPI data for {kpi_display_name} is all null for primary team {primary_team_name}'}, status=404)
+    if columnar.requested(request):
+        cached = columnar.cached_response(request)
+        if cached is not None:
+            return cached
 
-            all_descriptive_stats[primary_team_name] = calculate_descriptive_stats(primary_team_kpi_numeric_values)
+    try:
+        season_id = get_catalog().season_id(league, season_year_str)
+        if season_id is None:
+            return JsonResponse({'error': 'Invalid league or season for season_id lookup'}, status=400)
+        if kpi_value not in dict(kpis_definition):
+            return JsonResponse({'error': 'Invalid KPI'}, status=400)
+
+        # Fetch the primary and all comparison teams in one query
+        # (at most len(CHART_COLORS) - 1 comparison teams get a chart colour)
+        compare_teams_names = compare_teams_names[:len(CHART_COLORS) - 1]
+        kpi_data_by_team = db.fetch_kpi_series(season_id, kpi_value, [primary_team_name] + compare_teams_names)
+
+        # --- Process Primary Team ---
+        raw_primary_data = kpi_data_by_team.get(primary_team_name, [])
+        if not raw_primary_data:
+            return JsonResponse({'error': f'No data found for primary team {primary_team_name} and KPI {kpi_display_name}'}, status=404)
+
+        primary_team_game_weeks = [row[0] for row in raw_primary_data]
+        primary_team_kpi_raw_values = [row[1] for row in raw_primary_data]
+        primary_team_kpi_numeric_values = [float(v) for v in primary_team_kpi_raw_values if v is not None]
+        
+        if not primary_team_kpi_numeric_values:
+             return JsonResponse({'error': f'KPI data for {kpi_display_name} is all null for primary team {primary_team_name}'}, status=404)
+
+        all_descriptive_stats[primary_team_name] = calculate_descriptive_stats(primary_team_kpi_numeric_values)
+        time_series_datasets.append({
+            'label': primary_team_name,
+            'data': primary_team_kpi_raw_values, # Use raw for time series to show None as gaps
+            'borderColor': CHART_COLORS[0],
+            'backgroundColor': CHART_BG_COLORS_TRANSPARENT[0]
+        })
+
+        # --- Process Comparison Teams ---
+        comparison_histogram_teams = [] # (team name, numeric values, colour index)
+        color_idx = 1
+        for comp_team_name in compare_teams_names:
+            if color_idx >= len(CHART_COLORS): break # Ran out of unique colors
+
+            raw_comp_data = kpi_data_by_team.get(comp_team_name, [])
+            if not raw_comp_data: continue # Skip if no data for this comparison team
+
+            comp_kpi_raw_values = [row[1] for row in raw_comp_data]
+            comp_kpi_numeric_values = [float(v) for v in comp_kpi_raw_values if v is not None]
+            if not comp_kpi_numeric_values: continue
+
+            all_descriptive_stats[comp_team_name] = calculate_descriptive_stats(comp_kpi_numeric_values)
             time_series_datasets.append({
-                'label': primary_team_name,
-                'data': primary_team_kpi_raw_values, # Use raw for time series to show None as gaps
-                'borderColor': CHART_COLORS[0],
-                'backgroundColor': CHART_BG_COLORS_TRANSPARENT[0]
+                'label': comp_team_name,
+                'data': comp_kpi_raw_values,
+                'borderColor': CHART_COLORS[color_idx],
+                'backgroundColor': CHART_BG_COLORS_TRANSPARENT[color_idx]
             })
 
-            # --- Histogram Binning based on Primary Team ---
-            hist_bin_labels = []
-            hist_bin_edges = []
-            min_primary_kpi = min(primary_team_kpi_numeric_values)
-            max_primary_kpi = max(primary_team_kpi_numeric_values)
-            num_bins = 5
+            comparison_histogram_teams.append((comp_team_name, comp_kpi_numeric_values, color_idx))
+            color_idx += 1
 
-            if min_primary_kpi == max_primary_kpi:
-                hist_bin_labels = [f"{min_primary_kpi:.2f}"]
-                hist_bin_edges = [min_primary_kpi, max_primary_kpi]
-            else:
-                bin_width = (max_primary_kpi - min_primary_kpi) / num_bins
-                if bin_width == 0: bin_width = 1 # Fallback for extremely small range
-                hist_bin_edges = [min_primary_kpi + i * bin_width for i in range(num_bins + 1)]
-                if hist_bin_edges[num_bins] < max_primary_kpi: hist_bin_edges[num_bins] = max_primary_kpi
-                for i in range(num_bins):
-                    label_edge_upper = f"<{hist_bin_edges[i+1]:.2f}"
-                    if i == num_bins -1 : label_edge_upper = f"{hist_bin_edges[i+1]:.2f}" # Inclusive for last bin label text
-                    hist_bin_labels.append(f"{hist_bin_edges[i]:.2f} - {label_edge_upper}")
-            
-            primary_hist_freqs = [0] * len(hist_bin_labels) # Or num_bins if labels match num_bins
-            if len(hist_bin_labels) > 0: # Ensure there are bins before trying to populate them
-                for val in primary_team_kpi_numeric_values:
-                    for i_bin in range(len(hist_bin_labels)):
-                        is_last_bin = (i_bin == len(hist_bin_labels) - 1)
-                        lower_b = hist_bin_edges[i_bin]
-                        upper_b = hist_bin_edges[i_bin+1]
-                        if (is_last_bin and val >= lower_b and val <= upper_b) or \
-                           (not is_last_bin and val >= lower_b and val < upper_b) or \
-                           (val == lower_b and val == upper_b and len(hist_bin_labels) == 1): # Handles single value case
-                            primary_hist_freqs[i_bin] += 1
-                            break
-            
+        # --- Histograms, binned on the primary team's range (or every team's with shared_edges=1) ---
+        hist_bin_labels, hist_freqs = build_histograms(
+            [primary_team_kpi_numeric_values] + [values for _, values, _ in comparison_histogram_teams],
+            bins=hist_bins,
+            integer=hist_integer,
+            shared=hist_shared_edges,
+        )
+        histogram_datasets.append({
+            'label': primary_team_name,
+            'data': hist_freqs[0],
+            'borderColor': CHART_COLORS[0],
+            'backgroundColor': CHART_COLORS[0] # Solid for bar typically
+        })
+        for (comp_team_name, _, comp_color_idx), comp_hist_freqs in zip(comparison_histogram_teams, hist_freqs[1:]):
             histogram_datasets.append({
-                'label': primary_team_name,
-                'data': primary_hist_freqs,
-                'borderColor': CHART_COLORS[0],
-                'backgroundColor': CHART_COLORS[0] # Solid for bar typically
+                'label': comp_team_name,
+                'data': comp_hist_freqs,
+                'borderColor': CHART_COLORS[comp_color_idx],
+                'backgroundColor': CHART_COLORS[comp_color_idx]
             })
 
-            # --- Process Comparison Teams ---
-            color_idx = 1
-            for comp_team_name in compare_teams_names:
-                if color_idx >= len(CHART_COLORS): break # Ran out of unique colors
-
-                raw_comp_data = get_kpi_data_for_team(cursor, table_name, kpi_value, comp_team_name)
-                if not raw_comp_data: continue # Skip if no data for this comparison team
-
-                comp_kpi_raw_values = [row[1] for row in raw_comp_data]
-                comp_kpi_numeric_values = [float(v) for v in comp_kpi_raw_values if v is not None]
-                if not comp_kpi_numeric_values: continue
-
-                all_descriptive_stats[comp_team_name] = calculate_descriptive_stats(comp_kpi_numeric_values)
-                time_series_datasets.append({
-                    'label': comp_team_name,
-                    'data': comp_kpi_raw_values,
-                    'borderColor': CHART_COLORS[color_idx],
-                    'backgroundColor': CHART_BG_COLORS_TRANSPARENT[color_idx]
-                })
-
-                comp_hist_freqs = [0] * len(hist_bin_labels)
-                if len(hist_bin_labels) > 0:
-                    for val in comp_kpi_numeric_values:
-                        for i_bin in range(len(hist_bin_labels)):
-                            is_last_bin = (i_bin == len(hist_bin_labels) - 1)
-                            lower_b = hist_bin_edges[i_bin]
-                            upper_b = hist_bin_edges[i_bin+1]
-                            if (is_last_bin and val >= lower_b and val <= upper_b) or \
-                               (not is_last_bin and val >= lower_b and val < upper_b) or \
-                               (val == lower_b and val == upper_b and len(hist_bin_labels) == 1):
-                                comp_hist_freqs[i_bin] += 1
-                                break
-                
-                histogram_datasets.append({
-                    'label': comp_team_name,
-                    'data': comp_hist_freqs,
-                    'borderColor': CHART_COLORS[color_idx],
-                    'backgroundColor': CHART_COLORS[color_idx]
-                })
-                color_idx += 1
+        if columnar.requested(request):
+            return columnar.columnar_response(request, {
+                'format': columnar.FORMAT,
+                'kpi_display_name': kpi_display_name,
+                'primary_team_name': primary_team_name,
+                'descriptive_stats': all_descriptive_stats,
+                'game_weeks': primary_team_game_weeks,
+                **_columnar_charts(
+                    [(dataset['label'], dataset['data']) for dataset in time_series_datasets],
+                    (hist_bin_labels, [(dataset['label'], dataset['data']) for dataset in histogram_datasets]),
+                ),
+            })
 
         response_payload = {
             'kpi_display_name': kpi_display_name,
@@ -732,13 +641,123 @@ def visualisation_data(request):
             'time_series_data': {'labels': [f"GW {gw}" for gw in primary_team_game_weeks], 'datasets': time_series_datasets},
             'histogram_data': {'labels': hist_bin_labels, 'datasets': histogram_datasets}
         }
-        print(f"DEBUG: Final JSON response: {str(response_payload)[:500]}...") # Log snippet
-        return JsonResponse(response_payload)
+        logger.debug("Final JSON response: %.500s...", response_payload)  # formatted only when enabled
+        return timing.json_response(response_payload)
 
     except Exception as e:
-        import traceback
-        print("ERROR in visualisation_data:")
-        traceback.print_exc()
+        logger.exception("Error in visualisation_data")
+        return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
+
+def team_trend_data(request):
+    """
+    Returns a team's KPI game-week series and descriptive stats across several seasons of a league.
+    Either pass season (repeatable) or seasons=N for the N most recent seasons (default 5).
+    The number of seasons is capped at TREND_MAX_SEASONS.
+    """
+    league = request.GET.get('league')
+    team_name = request.GET.get('team')
+    kpi_value = request.GET.get('kpi')
+    selected_seasons = request.GET.getlist('season')
+
+    if not (league and team_name and kpi_value):
+        return JsonResponse({'error': 'Missing required parameters (league, team, or KPI)'}, status=400)
+    if kpi_value not in KPI_LABELS:
+        return JsonResponse({'error': 'Invalid KPI'}, status=400)
+
+    max_seasons = getattr(settings, 'TREND_MAX_SEASONS', 10)
+    try:
+        num_seasons = max(1, min(int(request.GET.get('seasons', 5)), max_seasons))
+    except ValueError:
+        return JsonResponse({'error': 'seasons must be a number'}, status=400)
+
+    kpi_display_name = KPI_LABELS[kpi_value]
+
+    try:
+        catalog = get_catalog()
+        league_seasons = catalog.seasons_for_league(league)
+        if selected_seasons:
+            league_seasons = [season for season in league_seasons if str(season) in selected_seasons][-max_seasons:]
+        else:
+            league_seasons = league_seasons[-num_seasons:]
+        season_ids = [catalog.season_id(league, season) for season in league_seasons]
+        season_ids = [season_id for season_id in season_ids if season_id is not None]
+        if not season_ids:
+            return JsonResponse({'error': f'No seasons found for league {league}'}, status=404)
+
+        season_ids = db.existing_season_ids(season_ids)
+        kpi_data_by_season = db.fetch_kpi_series_across_seasons(season_ids, kpi_value, team_name)
+
+        if not kpi_data_by_season:
+            return JsonResponse({'error': f'No data found for team {team_name} and KPI {kpi_display_name}'}, status=404)
+
+        seasons_payload = []
+        all_descriptive_stats = {}
+        time_series_datasets = []
+        all_numeric_values = []
+        max_game_week = 0
+        color_idx = 0
+        for season_id in season_ids:
+            rows = kpi_data_by_season.get(season_id)
+            if not rows:
+                continue
+            season_year = catalog.season_year(season_id)
+            game_weeks = [row[0] for row in rows]
+            raw_values = [row[1] for row in rows]
+            numeric_values = [float(v) for v in raw_values if v is not None]
+            all_numeric_values.extend(numeric_values)
+            max_game_week = max([max_game_week] + [gw for gw in game_weeks if gw is not None])
+
+            all_descriptive_stats[season_year] = calculate_descriptive_stats(numeric_values)
+            seasons_payload.append({
+                'season': season_year,
+                'season_id': season_id,
+                'game_weeks': game_weeks,
+                'values': raw_values,
+            })
+            # One line per season, aligned on game week so seasons overlay each other
+            values_by_game_week = dict(zip(game_weeks, raw_values))
+            time_series_datasets.append({
+                'label': f'{season_year}',
+                'data': [values_by_game_week.get(gw) for gw in range(1, max_game_week + 1)],
+                'borderColor': CHART_COLORS[color_idx % len(CHART_COLORS)],
+                'backgroundColor': CHART_BG_COLORS_TRANSPARENT[color_idx % len(CHART_BG_COLORS_TRANSPARENT)]
+            })
+            color_idx += 1
+
+        # Pad earlier seasons that ended before the longest one
+        for dataset in time_series_datasets:
+            dataset['data'] += [None] * (max_game_week - len(dataset['data']))
+
+        if columnar.requested(request):
+            # The season lines, aligned on game weeks 1..max, carry every value of seasons_payload
+            return columnar.columnar_response(request, {
+                'format': columnar.FORMAT,
+                'kpi_display_name': kpi_display_name,
+                'team_name': team_name,
+                'league': league,
+                'seasons': [{'season': season['season'], 'season_id': season['season_id']} for season in seasons_payload],
+                'descriptive_stats': all_descriptive_stats,
+                'overall_stats': calculate_descriptive_stats(all_numeric_values),
+                'game_weeks': list(range(1, max_game_week + 1)),
+                **_columnar_charts([(dataset['label'], dataset['data']) for dataset in time_series_datasets]),
+            })
+
+        response_payload = {
+            'kpi_display_name': kpi_display_name,
+            'team_name': team_name,
+            'league': league,
+            'seasons': seasons_payload,
+            'descriptive_stats': all_descriptive_stats,
+            'overall_stats': calculate_descriptive_stats(all_numeric_values),
+            'time_series_data': {
+                'labels': [f"GW {gw}" for gw in range(1, max_game_week + 1)],
+                'datasets': time_series_datasets
+            },
+        }
+        return timing.json_response(response_payload)
+
+    except Exception as e:
+        logger.exception("Error in team_trend_data")
         return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
 
 def index_view(request):
@@ -746,33 +765,11 @@ def index_view(request):
 
 def league_visualisation_view(request):
     # Fetch leagues for the dropdown
-    with connection.cursor() as cursor:
-        cursor.execute('''SELECT DISTINCT name FROM "possible_leagues_and_seasons_NEW" WHERE data_available like 'yes' ORDER BY name''')
-        leagues = [row[0] for row in cursor.fetchall()]
+    catalog = get_catalog()
+    leagues = catalog.leagues()
     
     # KPI list: (value, display_label)
-    kpis = [
-        ('goals_scored', 'Goals Scored'),
-        ('goals_conceded', 'Goals Conceded'),
-        ('corners_for', 'Corners For'),
-        ('corners_against', 'Corners Against'),
-        ('offsides_for', 'Offsides For'),
-        ('offsides_against', 'Offsides Against'),
-        ('yellow_cards_for', 'Yellow Cards For'),
-        ('yellow_cards_against', 'Yellow Cards Against'),
-        ('red_cards_for', 'Red Cards For'),
-        ('red_cards_against', 'Red Cards Against'),
-        ('shotsontarget_for', 'Shots On Target For'),
-        ('shotsontarget_against', 'Shots On Target Against'),
-        ('shotsofftarget_for', 'Shots Off Target For'),
-        ('shotsofftarget_against', 'Shots Off Target Against'),
-        ('shots_for', 'Shots For'),
-        ('shots_against', 'Shots Against'),
-        ('fouls_for', 'Fouls For'),
-        ('fouls_against', 'Fouls Against'),
-        ('possession_for', 'Possession For'),
-        ('possession_against', 'Possession Against'),
-    ]
+    kpis = KPIS
     
     selected_league = request.GET.get('league')
     selected_season = request.GET.get('season')
@@ -782,12 +779,7 @@ def league_visualisation_view(request):
     seasons = []
     
     if selected_league:
-        with connection.cursor() as cursor:
-            cursor.execute(
-                '''SELECT DISTINCT season_year FROM "possible_leagues_and_seasons_NEW" WHERE name = %s AND data_available like 'yes' ORDER BY season_year''',
-                [selected_league]
-            )
-            seasons = [row[0] for row in cursor.fetchall()]
+        seasons = catalog.seasons_for_league(selected_league)
     
     return render(request, 'football_data/league_visualisation.html', {
         'leagues': leagues,
@@ -799,212 +791,230 @@ def league_visualisation_view(request):
         'aggregation_type': aggregation_type,
     })
 
-def league_visualisation_data(request):
+def _league_visualisation_params(request):
+    """Query string of league_visualisation_data, shared by the sync and async views."""
     league = request.GET.get('league')
-    season_year_str = request.GET.get('season')
-    kpi_value = request.GET.get('kpi')
     aggregation_type = request.GET.get('aggregation_type', 'averages')
+    kpi_value = request.GET.get('kpi')
 
-    compare_leagues_names = []
-    for i in range(1, 5):
-        cl_name = request.GET.get(f'compare_league{i}')
-        if cl_name and cl_name.lower() != 'none' and cl_name != league:
-            compare_leagues_names.append(cl_name)
-    # Ensure unique comparison leagues
-    compare_leagues_names = sorted(list(set(compare_leagues_names)))
+    # Repeated compare_league (any number of leagues) or the compare_league1..4 selects;
+    # compare_all=1 compares every league that has the season
+    compare_leagues_names = compare_league_names(request.GET, league)
+    compare_all = parse_flag(request.GET.get('compare_all'), False)
 
-    print(f"DEBUG: LeagueVisData: Primary={league}, Compare={compare_leagues_names}, KPI={kpi_value}, Aggregation={aggregation_type}")
+    logger.debug(
+        "LeagueVisData: Primary=%s, Compare=%s, KPI=%s, Aggregation=%s",
+        league, 'all' if compare_all else compare_leagues_names, kpi_value, aggregation_type,
+    )
 
-    if not (league and season_year_str and kpi_value):
-        return JsonResponse({'error': 'Missing required parameters (league, season, or KPI)'}, status=400)
+    return {
+        'league': league,
+        'season': request.GET.get('season'),
+        'kpi': kpi_value,
+        'aggregation_type': aggregation_type,
+        'compare_leagues': compare_leagues_names,
+        'compare_all': compare_all,
+        'columnar': columnar.requested(request),
+        # Histogram options: bin count, opt-in whole-number bins, edges from every league
+        'hist_bins': parse_bins(request.GET.get('bins')),
+        'hist_integer': parse_flag(request.GET.get('integer_bins'), False),
+        'hist_shared_edges': parse_flag(request.GET.get('shared_edges'), False),
+    }
 
-    # Define KPIs
-    kpis = [
-        ('goals_scored', 'Goals Scored'),
-        ('goals_conceded', 'Goals Conceded'),
-        ('corners_for', 'Corners For'),
-        ('corners_against', 'Corners Against'),
-        ('offsides_for', 'Offsides For'),
-        ('offsides_against', 'Offsides Against'),
-        ('yellow_cards_for', 'Yellow Cards For'),
-        ('yellow_cards_against', 'Yellow Cards Against'),
-        ('red_cards_for', 'Red Cards For'),
-        ('red_cards_against', 'Red Cards Against'),
-        ('shotsontarget_for', 'Shots On Target For'),
-        ('shotsontarget_against', 'Shots On Target Against'),
-        ('shotsofftarget_for', 'Shots Off Target For'),
-        ('shotsofftarget_against', 'Shots Off Target Against'),
-        ('shots_for', 'Shots For'),
-        ('shots_against', 'Shots Against'),
-        ('fouls_for', 'Fouls For'),
-        ('fouls_against', 'Fouls Against'),
-        ('possession_for', 'Possession For'),
-        ('possession_against', 'Possession Against'),
-    ]
-    
-    kpi_display_name = dict(kpis).get(kpi_value, kpi_value)
+
+def _league_season_ids(catalog, params):
+    """(league, season_id) of every requested league that has the season, primary league first."""
+    if params['kpi'] not in dict(KPIS):
+        return []
+    league_season_ids = []
+    leagues = compared_league_names(
+        catalog, params['league'], params['season'], params['compare_leagues'], params['compare_all'],
+    )
+    for current_league in leagues:
+        season_id = catalog.season_id(current_league, params['season'])
+        if season_id is None:
+            continue  # Skip if no data for this league
+        league_season_ids.append((current_league, season_id))
+    return league_season_ids
+
+
+def _league_series(results):
+    """Chart series of one league from its fetch_league_gameweek_aggregates rows."""
+    return {
+        'game_weeks': [row[0] for row in results],
+        'aggregated_values': [float(row[1]) if row[1] is not None else 0 for row in results],
+        'games_count': [row[2] for row in results],
+    }
+
+
+def _league_visualisation_response(request, params, all_leagues_data):
+    """
+    Builds the charts and descriptive statistics from {league: _league_series(...)}, primary league first,
+    in the columnar format with format=columnar.
+    """
+    league = params['league']
+    all_leagues = list(all_leagues_data)
+    aggregation_type = params['aggregation_type']
+    kpi_display_name = dict(KPIS).get(params['kpi'], params['kpi'])
+
+    if not all_leagues_data:
+        return JsonResponse({'error': f'No data found for any of the selected leagues and KPI {kpi_display_name}'}, status=404)
 
     all_descriptive_stats = {}
     time_series_datasets = []
     histogram_datasets = []
-    all_leagues_data = {}
+
+    if league not in all_leagues_data:
+        return JsonResponse({'error': f'No data found for {league} and KPI {kpi_display_name}'}, status=404)
+
+    # Use primary league's game weeks as the base for all charts
+    primary_league_data = all_leagues_data[league]
+    base_game_weeks = primary_league_data['game_weeks']
+
+    # Create time series datasets for all leagues
+    color_idx = 0
+    for current_league in all_leagues:
+        if current_league not in all_leagues_data:
+            continue
+
+        league_data = all_leagues_data[current_league]
+
+        # Calculate descriptive statistics
+        numeric_values = [v for v in league_data['aggregated_values'] if v is not None and not math.isnan(v)]
+        if numeric_values:
+            all_descriptive_stats[current_league] = calculate_descriptive_stats(numeric_values)
+        else:
+            all_descriptive_stats[current_league] = {'mean': 'N/A', 'median': 'N/A', 'mode': 'N/A'}
+
+        # Create time series dataset
+        time_series_datasets.append({
+            'label': f'{current_league} - {kpi_display_name} ({aggregation_type.title()})',
+            'data': league_data['aggregated_values'],
+            'borderColor': CHART_COLORS[color_idx % len(CHART_COLORS)],
+            'backgroundColor': CHART_BG_COLORS_TRANSPARENT[color_idx % len(CHART_BG_COLORS_TRANSPARENT)]
+        })
+        color_idx += 1
+
+    # Create histograms binned on the primary league's range (or every league's with shared_edges=1)
+    histogram_leagues = []
+    for current_league in all_leagues:
+        if current_league not in all_leagues_data:
+            continue
+        numeric_values = [v for v in all_leagues_data[current_league]['aggregated_values'] if v is not None and not math.isnan(v)]
+        if numeric_values:
+            histogram_leagues.append((current_league, numeric_values))
+
+    hist_bin_labels = []
+    if histogram_leagues:
+        hist_bin_labels, hist_freqs = build_histograms(
+            [values for _, values in histogram_leagues],
+            bins=params['hist_bins'],
+            integer=params['hist_integer'],
+            shared=params['hist_shared_edges'],
+        )
+        for color_idx, ((current_league, _), league_hist_freqs) in enumerate(zip(histogram_leagues, hist_freqs)):
+            histogram_datasets.append({
+                'label': f'{current_league} - {kpi_display_name}',
+                'data': league_hist_freqs,
+                'borderColor': CHART_COLORS[color_idx % len(CHART_COLORS)],
+                'backgroundColor': CHART_COLORS[color_idx % len(CHART_COLORS)]
+            })
+
+    if params['columnar']:
+        return columnar.columnar_response(request, {
+            'format': columnar.FORMAT,
+            'kpi_display_name': kpi_display_name,
+            'aggregation_type': aggregation_type,
+            'descriptive_stats': all_descriptive_stats,
+            'game_weeks': base_game_weeks,
+            **_columnar_charts(
+                [(current_league, all_leagues_data[current_league]['aggregated_values']) for current_league in all_leagues],
+                (hist_bin_labels, [
+                    (current_league, dataset['data'])
+                    for (current_league, _), dataset in zip(histogram_leagues, histogram_datasets)
+                ]),
+            ),
+        })
+
+    response_payload = {
+        'kpi_display_name': kpi_display_name,
+        'aggregation_type': aggregation_type,
+        'descriptive_stats': all_descriptive_stats,
+        'time_series_data': {
+            'labels': [f"GW {gw}" for gw in base_game_weeks],
+            'datasets': time_series_datasets
+        },
+        'histogram_data': {
+            'labels': hist_bin_labels,
+            'datasets': histogram_datasets
+        }
+    }
+
+    logger.debug("League visualization response: %.500s...", response_payload)
+    return timing.json_response(response_payload)
+
+
+@season_conditional(compared_leagues_season_ids)
+def league_visualisation_data(request):
+    params = _league_visualisation_params(request)
+    if not (params['league'] and params['season'] and params['kpi']):
+        return JsonResponse({'error': 'Missing required parameters (league, season, or KPI)'}, status=400)
+    if params['columnar']:
+        cached = columnar.cached_response(request)
+        if cached is not None:
+            return cached
 
     try:
-        with connection.cursor() as cursor:
-            # Process all leagues (primary + comparison)
-            all_leagues = [league] + compare_leagues_names
-            
-            for current_league in all_leagues:
-                cursor.execute('''SELECT season_id FROM possible_leagues_and_seasons WHERE name = %s AND season_year = %s''', [current_league, season_year_str])
-                db_season_result = cursor.fetchone()
-                if not db_season_result:
-                    continue  # Skip if no data for this league
-                
-                season_id = db_season_result[0]
-                table_name = f"match_data_{season_id}_final"
-
-                if kpi_value not in dict(kpis):
-                    continue
-
-                # Determine aggregation function based on aggregation_type
-                if aggregation_type == 'totals':
-                    agg_function = f"SUM({kpi_value})"
-                else:  # averages
-                    agg_function = f"AVG({kpi_value})"
-
-                # Query to get aggregated data by game week
-                query = f"""
-                    SELECT 
-                        game_week,
-                        {agg_function} as aggregated_value,
-                        COUNT(*) as games_count
-                    FROM {table_name}
-                    WHERE {kpi_value} IS NOT NULL
-                    GROUP BY game_week
-                    ORDER BY game_week
-                """
-                
-                cursor.execute(query)
-                results = cursor.fetchall()
-                
-                if not results:
-                    continue
-
-                # Extract data for charts
-                game_weeks = [row[0] for row in results]
-                aggregated_values = [float(row[1]) if row[1] is not None else 0 for row in results]
-                games_count = [row[2] for row in results]
-
-                all_leagues_data[current_league] = {
-                    'game_weeks': game_weeks,
-                    'aggregated_values': aggregated_values,
-                    'games_count': games_count
-                }
-
-            if not all_leagues_data:
-                return JsonResponse({'error': f'No data found for any of the selected leagues and KPI {kpi_display_name}'}, status=404)
-
-            # Use primary league's game weeks as the base for all charts
-            primary_league_data = all_leagues_data[league]
-            base_game_weeks = primary_league_data['game_weeks']
-            
-            # Create time series datasets for all leagues
-            color_idx = 0
-            for current_league in all_leagues:
-                if current_league not in all_leagues_data:
-                    continue
-                    
-                league_data = all_leagues_data[current_league]
-                
-                # Calculate descriptive statistics
-                numeric_values = [v for v in league_data['aggregated_values'] if v is not None and not math.isnan(v)]
-                if numeric_values:
-                    all_descriptive_stats[current_league] = calculate_descriptive_stats(numeric_values)
-                else:
-                    all_descriptive_stats[current_league] = {'mean': 'N/A', 'median': 'N/A', 'mode': 'N/A'}
-
-                # Create time series dataset
-                time_series_datasets.append({
-                    'label': f'{current_league} - {kpi_display_name} ({aggregation_type.title()})',
-                    'data': league_data['aggregated_values'],
-                    'borderColor': CHART_COLORS[color_idx % len(CHART_COLORS)],
-                    'backgroundColor': CHART_BG_COLORS_TRANSPARENT[color_idx % len(CHART_BG_COLORS_TRANSPARENT)]
-                })
-                color_idx += 1
-
-            # Create histogram based on primary league data
-            primary_numeric_values = [v for v in primary_league_data['aggregated_values'] if v is not None and not math.isnan(v)]
-            if primary_numeric_values:
-                hist_bin_labels = []
-                hist_bin_edges = []
-                min_val = min(primary_numeric_values)
-                max_val = max(primary_numeric_values)
-                num_bins = 5
-
-                if min_val == max_val:
-                    hist_bin_labels = [f"{min_val:.2f}"]
-                    hist_bin_edges = [min_val, max_val]
-                else:
-                    bin_width = (max_val - min_val) / num_bins
-                    if bin_width == 0: bin_width = 1
-                    hist_bin_edges = [min_val + i * bin_width for i in range(num_bins + 1)]
-                    if hist_bin_edges[num_bins] < max_val: hist_bin_edges[num_bins] = max_val
-                    for i in range(num_bins):
-                        label_edge_upper = f"<{hist_bin_edges[i+1]:.2f}"
-                        if i == num_bins - 1: label_edge_upper = f"{hist_bin_edges[i+1]:.2f}"
-                        hist_bin_labels.append(f"{hist_bin_edges[i]:.2f} - {label_edge_upper}")
-
-                # Calculate histogram frequencies for all leagues
-                color_idx = 0
-                for current_league in all_leagues:
-                    if current_league not in all_leagues_data:
-                        continue
-                        
-                    league_data = all_leagues_data[current_league]
-                    numeric_values = [v for v in league_data['aggregated_values'] if v is not None and not math.isnan(v)]
-                    
-                    if numeric_values:
-                        hist_freqs = [0] * len(hist_bin_labels)
-                        for val in numeric_values:
-                            for i_bin in range(len(hist_bin_labels)):
-                                is_last_bin = (i_bin == len(hist_bin_labels) - 1)
-                                lower_b = hist_bin_edges[i_bin]
-                                upper_b = hist_bin_edges[i_bin+1]
-                                if (is_last_bin and val >= lower_b and val <= upper_b) or \
-                                   (not is_last_bin and val >= lower_b and val < upper_b) or \
-                                   (val == lower_b and val == upper_b and len(hist_bin_labels) == 1):
-                                    hist_freqs[i_bin] += 1
-                                    break
-
-                        histogram_datasets.append({
-                            'label': f'{current_league} - {kpi_display_name}',
-                            'data': hist_freqs,
-                            'borderColor': CHART_COLORS[color_idx % len(CHART_COLORS)],
-                            'backgroundColor': CHART_COLORS[color_idx % len(CHART_COLORS)]
-                        })
-                        color_idx += 1
-
-            response_payload = {
-                'kpi_display_name': kpi_display_name,
-                'aggregation_type': aggregation_type,
-                'descriptive_stats': all_descriptive_stats,
-                'time_series_data': {
-                    'labels': [f"GW {gw}" for gw in base_game_weeks],
-                    'datasets': time_series_datasets
-                },
-                'histogram_data': {
-                    'labels': hist_bin_labels,
-                    'datasets': histogram_datasets
-                }
-            }
-            
-            print(f"DEBUG: League visualization response: {str(response_payload)[:500]}...")
-            return JsonResponse(response_payload)
+        catalog = get_catalog()
+        league_season_ids = _league_season_ids(catalog, params)
+        # SUM or AVG of the KPI over all teams, per game week, for every league in one round trip
+        results = db.fetch_leagues_gameweek_aggregates(
+            [season_id for _, season_id in league_season_ids], params['kpi'], params['aggregation_type'],
+        )
+        all_leagues_data = {
+            current_league: _league_series(results[season_id])
+            for current_league, season_id in league_season_ids
+            if season_id in results
+        }
+        return _league_visualisation_response(request, params, all_leagues_data)
 
     except Exception as e:
-        import traceback
-        print("ERROR in league_visualisation_data:")
-        traceback.print_exc()
+        logger.exception("Error in league_visualisation_data")
+        return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
+
+
+@season_conditional(compared_leagues_season_ids)
+async def league_visualisation_data_async(request):
+    """
+    league_visualisation_data for ASGI: the game-week aggregates of every league are
+    read with one query on an async connection.
+    """
+    params = _league_visualisation_params(request)
+    if not (params['league'] and params['season'] and params['kpi']):
+        return JsonResponse({'error': 'Missing required parameters (league, season, or KPI)'}, status=400)
+    if params['columnar']:
+        cached = await sync_to_async(columnar.cached_response)(request)
+        if cached is not None:
+            return cached
+
+    try:
+        catalog = await sync_to_async(get_catalog)()
+        league_season_ids = _league_season_ids(catalog, params)
+        results = await async_db.fetch_leagues_gameweek_aggregates(
+            [season_id for _, season_id in league_season_ids], params['kpi'], params['aggregation_type'],
+        )
+        all_leagues_data = {
+            current_league: _league_series(results[season_id])
+            for current_league, season_id in league_season_ids
+            if season_id in results
+        }
+        if params['columnar']:
+            # Encodes, compresses and caches the body: not on the event loop
+            return await sync_to_async(_league_visualisation_response)(request, params, all_leagues_data)
+        return _league_visualisation_response(request, params, all_leagues_data)
+
+    except Exception as e:
+        logger.exception("Error in league_visualisation_data_async")
         return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
 
 def correlations_view(request):
@@ -1012,24 +1022,278 @@ def correlations_view(request):
     Renders the correlations page with initial filter options.
     """
     try:
-        with connection.cursor() as cursor:
-            # Fetch all leagues
-            cursor.execute("SELECT DISTINCT name FROM possible_leagues_and_seasons ORDER BY name")
-            leagues = [row[0] for row in cursor.fetchall()]
-
-            # Fetch all season years
-            cursor.execute("SELECT DISTINCT season_year FROM possible_leagues_and_seasons ORDER BY season_year DESC")
-            seasons = [row[0] for row in cursor.fetchall()]
+        catalog = get_catalog()
+        leagues = catalog.all_leagues()
+        seasons = catalog.all_season_years()
 
     except Exception as e:
-        print(f"Error in correlations_view: {e}")
+        logger.error("Error in correlations_view: %s", e)
         leagues, seasons = [], []
 
     context = {
         'leagues': leagues,
         'seasons': seasons,
+        'kpis': KPIS,
         'page_title': 'Correlations',
         'active_page': 'correlations',
     }
     return render(request, 'football_data/correlations.html', context)
 
+
+def correlations_data(request):
+    """
+    Returns the correlation matrix of every KPI as JSON.
+    Every selected league/season combination in the catalog is pooled
+    (league and season can be repeated); method is pearson or spearman.
+    """
+    selected_leagues = request.GET.getlist('league')
+    selected_seasons = request.GET.getlist('season')
+    method = request.GET.get('method', 'pearson')
+    home_or_away = request.GET.get('home_or_away') or None
+
+    if not (selected_leagues and selected_seasons):
+        return JsonResponse({'error': 'Missing required parameters (league and season)'}, status=400)
+    if method not in CORRELATION_METHODS:
+        return JsonResponse({'error': f'Invalid method, expected one of {", ".join(CORRELATION_METHODS)}'}, status=400)
+
+    try:
+        catalog = get_catalog()
+        season_ids = []
+        for league in selected_leagues:
+            for season in selected_seasons:
+                season_id = catalog.season_id(league, season)
+                if season_id is not None:
+                    season_ids.append(season_id)
+        if not season_ids:
+            return JsonResponse({'error': 'No data for the selected leagues and seasons'}, status=404)
+
+        result = get_correlations(season_ids, method, home_or_away)
+        response_payload = dict(result, labels=[KPI_LABELS[column] for column in result['columns']])
+        return timing.json_response(response_payload)
+
+    except Exception as e:
+        logger.exception("Error in correlations_data")
+        return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
+
+
+
+@season_conditional(selected_season_ids)
+def form_data(request):
+    """
+    Form table of a league season as JSON: every team's games, points, KPI averages and KPI
+    sums over its last `window` matches (FORM_WINDOW by default), or its last `window` home
+    or away matches with home_or_away.
+    """
+    league = request.GET.get('league')
+    season = request.GET.get('season')
+    home_or_away = request.GET.get('home_or_away') or None
+    if not (league and season):
+        return JsonResponse({'error': 'Missing required parameters (league and season)'}, status=400)
+    try:
+        window = db.form_window(request.GET.get('window') or None)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    season_id = get_catalog().season_id(league, season)
+    if season_id is None:
+        return JsonResponse({'error': 'No data for the selected league and season'}, status=404)
+    try:
+        rows, columns = db.fetch_team_form(season_id, window, home_or_away)
+    except Exception as e:
+        logger.exception("Error in form_data")
+        return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
+
+    teams = []
+    for row in rows:
+        team = dict(zip(columns, row))
+        teams.append({
+            'team_name': team.pop('team_name'),
+            'games_played': team.pop('games_played'),
+            'points': team.pop('total_points'),
+            # Decimal averages as numbers
+            'kpis': {name: None if value is None else float(value) for name, value in team.items()},
+        })
+    return timing.json_response({
+        'league': league,
+        'season': season,
+        'window': window,
+        'home_or_away': home_or_away,
+        'teams': teams,
+    })
+
+
+def regression_data(request):
+    """
+    Fits an OLS regression of a target KPI (or points) on predictor KPIs and returns it as JSON.
+    Every selected league/season combination in the catalog is pooled, as for correlations_data;
+    predictor is repeated for several predictors.
+    """
+    selected_leagues = request.GET.getlist('league')
+    selected_seasons = request.GET.getlist('season')
+    target = request.GET.get('target')
+    predictors = request.GET.getlist('predictor')
+    home_or_away = request.GET.get('home_or_away') or None
+
+    if not (selected_leagues and selected_seasons and target and predictors):
+        return JsonResponse({'error': 'Missing required parameters (league, season, target and predictor)'}, status=400)
+
+    try:
+        catalog = get_catalog()
+        season_ids = []
+        for league in selected_leagues:
+            for season in selected_seasons:
+                season_id = catalog.season_id(league, season)
+                if season_id is not None:
+                    season_ids.append(season_id)
+        if not season_ids:
+            return JsonResponse({'error': 'No data for the selected leagues and seasons'}, status=404)
+
+        return timing.json_response(run_regression(season_ids, target, predictors, home_or_away))
+
+    except RegressionError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.exception("Error in regression_data")
+        return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
+
+
+def upcoming_combinations(request):
+    """
+    Ranks the accumulators of the upcoming fixtures between startdate and enddate (YYYY-MM-DD) by
+    joint probability and returns the best ones as JSON. market is repeated, as market:line
+    (e.g. market=corners:9.5&market=cards:3.5); legs is the number of fixtures per combination,
+    top the number of combinations and min_probability the least likely selection to consider.
+    """
+    date_range = _upcoming_date_range(request.GET)
+    if date_range is None:
+        return JsonResponse({'error': INVALID_DATES_MESSAGE}, status=400)
+    try:
+        markets = [parse_market(spec) for spec in request.GET.getlist('market')]
+        legs = int(request.GET.get('legs', DEFAULT_LEGS))
+        top = int(request.GET.get('top', DEFAULT_TOP))
+        min_probability = float(request.GET.get('min_probability', 0))
+    except CombinationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except ValueError:
+        return JsonResponse({'error': 'legs and top must be integers, min_probability a number'}, status=400)
+
+    try:
+        games_data = get_fixtures_client().fetch_range(date_range)
+    except Exception as e:
+        return JsonResponse({'error': f'Error fetching data from API: {e}'}, status=502)
+
+    try:
+        result = build_combinations(games_data, markets, legs, top, min_probability, catalog=get_catalog())
+    except CombinationError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.exception("Error in upcoming_combinations")
+        return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
+
+    result.update({
+        'markets': [f"{market}:{line:g}" for market, line in markets],
+        'legs': legs,
+    })
+    return timing.json_response(result)
+
+
+def export_matches(request):
+    """
+    Streams match rows as CSV or NDJSON (format=csv|ndjson).
+    Seasons are chosen with repeated season_id, or with league and season (both repeatable,
+    every combination in the catalog is exported). Optional filters: team and kpi (repeatable)
+    and home_or_away.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse({'error': f'Invalid format, expected one of {", ".join(EXPORT_FORMATS)}'}, status=400)
+
+    catalog = get_catalog()
+    season_ids = request.GET.getlist('season_id')
+    for league in request.GET.getlist('league'):
+        for season in request.GET.getlist('season'):
+            season_id = catalog.season_id(league, season)
+            if season_id is not None:
+                season_ids.append(season_id)
+    if not season_ids:
+        return JsonResponse({'error': 'Missing or unknown seasons (season_id, or league and season)'}, status=400)
+    # A season named both by id and by league and season is exported, and counted, once
+    season_ids = list(dict.fromkeys(str(season_id) for season_id in season_ids))
+    max_seasons = getattr(settings, 'EXPORT_MAX_SEASONS', 50)
+    if len(season_ids) > max_seasons:
+        return JsonResponse({'error': f'At most {max_seasons} seasons can be exported at once'}, status=400)
+
+    try:
+        season_ids = db.existing_season_ids(season_ids)
+        if not season_ids:
+            return JsonResponse({'error': 'No data for the selected seasons'}, status=404)
+        content = stream_export(
+            season_ids,
+            fmt=fmt,
+            team_names=request.GET.getlist('team'),
+            kpis=request.GET.getlist('kpi'),
+            home_or_away=request.GET.get('home_or_away') or None,
+        )
+    except db.InvalidIdentifier as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[fmt])
+    filename = f"matches_{'_'.join(str(season_id) for season_id in season_ids[:5])}.{fmt}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def match_explorer_data(request):
+    """
+    A team's matches across every season and league it played in, newest first, as JSON.
+    Optional filters: opponent, home_or_away, and min_<kpi>/max_<kpi> for any KPI.
+    Pages are fetched with the next_cursor of the previous page (cursor parameter).
+    """
+    team_name = request.GET.get('team')
+    if not team_name:
+        return JsonResponse({'error': 'Missing team parameter'}, status=400)
+    opponent = request.GET.get('opponent') or None
+    home_or_away = request.GET.get('home_or_away') or None
+
+    kpi_ranges = {}
+    try:
+        page_size = int(request.GET.get('page_size', EXPLORER_PAGE_SIZE))
+        for kpi in KPI_LABELS:
+            minimum = request.GET.get(f'min_{kpi}')
+            maximum = request.GET.get(f'max_{kpi}')
+            if minimum or maximum:
+                kpi_ranges[kpi] = (float(minimum) if minimum else None, float(maximum) if maximum else None)
+    except ValueError:
+        return JsonResponse({'error': 'page_size and KPI ranges must be numbers'}, status=400)
+
+    try:
+        rows, next_cursor = explore_matches(
+            team_name,
+            opponent=opponent,
+            home_or_away=home_or_away,
+            kpi_ranges=kpi_ranges,
+            cursor=request.GET.get('cursor'),
+            page_size=page_size,
+        )
+        catalog = get_catalog()
+        matches = []
+        for season_id, *values in rows:
+            match = {
+                'season_id': season_id,
+                'league': catalog.league_name(int(season_id)),
+                'season_year': catalog.season_year(int(season_id)),
+            }
+            match.update(zip(db.MATCH_COLUMNS, values))
+            matches.append(match)
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logger.exception("Error in match_explorer_data")
+        return JsonResponse({'error': f'An unexpected server error occurred: {str(e)}'}, status=500)
+
+    return JsonResponse({
+        'team_name': team_name,
+        'opponent': opponent,
+        'matches': matches,
+        'next_cursor': next_cursor,
+    })